@@ -0,0 +1,64 @@
+"""
+Interpretation time of very wide and deeply nested documents.
+
+Usage:
+    python benchmarks/bench_blocks.py [wide blocks] [nesting depth]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+
+def make_wide(blocks):
+    """Return a program with `blocks` top-level blocks of 2 children."""
+    lines = []
+    for i in range(blocks):
+        lines += [
+            "Dummy block{}".format(i),
+            "    num = {}".format(i),
+            "    Dummy left{}".format(i),
+            "    End",
+            "    Dummy right{}".format(i),
+            "    End",
+            "End",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def make_nested(depth, width=50):
+    """Return `width` top-level blocks, each nested `depth` levels deep."""
+    lines = []
+    for w in range(width):
+        for i in range(depth):
+            lines += ["    " * i + "Dummy block{}_{}".format(w, i),
+                      "    " * (i + 1) + "num = {}".format(i)]
+        for i in reversed(range(depth)):
+            lines.append("    " * i + "End")
+    return "\n".join(lines) + "\n"
+
+
+def run(label, parser, text):
+    program = parser.parse(text)
+    start = perf_counter()
+    interpreter = E3lmInterpreter(parser=parser)
+    program = interpreter.interpret(program)
+    elapsed = perf_counter() - start
+    print("{:<32} {:>8} blocks {:>9.3f} s".format(
+        label, len(program.flat_blocks), elapsed))
+
+
+def main(blocks=20000, depth=100):
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    for n in (blocks // 100, blocks // 10, blocks):
+        run("wide ({} x 3)".format(n), parser, make_wide(n))
+    for d in (depth // 10, depth // 2, depth):
+        run("nested (50 x {})".format(d), parser, make_nested(d))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
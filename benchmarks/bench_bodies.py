@@ -0,0 +1,49 @@
+"""
+Interpretation time of body-heavy documents.
+
+Most bodies are plain text and many are identical, a few use Jinja markers.
+
+Usage:
+    python benchmarks/bench_bodies.py [blocks ...]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+
+def make_program(blocks):
+    lines = []
+    for i in range(blocks):
+        lines += ["Page page{}".format(i),
+                  "    title = 'Page {}'".format(i % 10),
+                  "    ---"]
+        if i % 10 == 0:
+            lines.append("    {{ title }} of the course.")
+        elif i % 2:
+            lines.append("    This is the body content of page {}.".format(i))
+        else:
+            lines.append("    Shared boilerplate text of the course.")
+        lines += ["    ---", "End"]
+    return "\n".join(lines) + "\n"
+
+
+def main(*sizes):
+    sizes = sizes or (100, 1000, 10000)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    for blocks in sizes:
+        program = parser.parse(make_program(blocks))
+        start = perf_counter()
+        program = E3lmInterpreter(parser=parser).interpret(program)
+        elapsed = perf_counter() - start
+        assert program.flat_blocks[0].attrs["body"] == "Page 0 of the course."
+        print("{:>8} bodies {:>9.3f} s {:>9.1f} us/body".format(
+            blocks, elapsed, elapsed * 1e6 / blocks))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
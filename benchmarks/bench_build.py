@@ -0,0 +1,43 @@
+"""
+Per-document overhead of building the lexer/parser versus reusing them.
+
+Usage:
+    python benchmarks/bench_build.py [documents]
+"""
+import sys
+from time import perf_counter
+from e3lm.demos import data
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+
+
+def run(label, documents, parse_one):
+    start = perf_counter()
+    for i in range(documents):
+        parse_one(data.code0)
+    elapsed = perf_counter() - start
+    print("{:<28} {:>9.3f} ms/doc".format(label, elapsed * 1000 / documents))
+
+
+def main(documents=200):
+    def rebuild(cache):
+        def parse_one(text):
+            lexer = E3lmLexer()
+            lexer.build(cache=cache)
+            parser = E3lmParser()
+            parser.build(lexer=lexer, cache=cache)
+            return parser.parse(text)
+        return parse_one
+
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+
+    run("build per doc (no cache)", documents, rebuild(False))
+    run("build per doc (cached)", documents, rebuild(True))
+    run("prebuilt, reset per doc", documents, parser.parse)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
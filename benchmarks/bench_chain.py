@@ -0,0 +1,49 @@
+"""
+Interpretation time of long chains of attribute references.
+
+Every block's attribute refers to the next block's (forward chain) or to
+the previous block's (backward chain) attribute.
+
+Usage:
+    python benchmarks/bench_chain.py [chain length ...]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+
+def make_chain(length, forward=True):
+    lines = []
+    for i in range(length):
+        ref = i + 1 if forward else i - 1
+        if 0 <= ref < length:
+            value = "block{}.num + 1".format(ref)
+        else:
+            value = "0"
+        lines += ["Dummy block{}".format(i), "    num = " + value, "End"]
+    return "\n".join(lines) + "\n"
+
+
+def main(*lengths):
+    lengths = lengths or (10, 100, 1000, 10000)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    print("{:>8} {:>12} {:>12}".format("length", "forward (s)", "backward (s)"))
+    for length in lengths:
+        times = []
+        for forward in (True, False):
+            program = parser.parse(make_chain(length, forward))
+            start = perf_counter()
+            program = E3lmInterpreter(parser=parser).interpret(program)
+            times.append(perf_counter() - start)
+            last = program.flat_blocks[0 if forward else -1]
+            assert last.attrs["num"] == length - 1
+        print("{:>8} {:>12.3f} {:>12.3f}".format(length, *times))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,63 @@
+"""
+Time and peak memory of the dot source of large programs, by number of
+drawn nodes (1k, 10k and 100k by default).
+
+Compares `DotPlugin` keeping the `dot_source` string with `DotPlugin.dump`
+writing it to a file-like object as the nodes are drawn. The time to
+interpret the program is shown for reference.
+
+Usage:
+    python benchmarks/bench_dot.py [nodes ...]
+"""
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+from e3lm.contrib.dot import DotPlugin
+from e3lm.utils.lang import interpret
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_json import Sink  # noqa: E402
+from bench_memory import make_program  # noqa: E402
+
+# Nodes drawn for each block of `make_program`.
+BLOCK_NODES = 20
+
+
+def measure(fn, program):
+    sink = Sink()
+    tracemalloc.start()
+    t_start = perf_counter()
+    fn(program, sink)
+    elapsed = perf_counter() - t_start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sink.size, sink.first - t_start, elapsed, peak
+
+
+def whole(program, fp):
+    fp.write(DotPlugin().interpret(program).dot_source)
+
+
+def streamed(program, fp):
+    DotPlugin().dump(program, fp)
+
+
+def main(*sizes):
+    for nodes in sizes or (1000, 10000, 100000):
+        text = make_program(max(nodes // BLOCK_NODES, 1))
+        t_start = perf_counter()
+        interpret(text)
+        print("{:>7} nodes, interpreted in {:8.1f} ms".format(
+            nodes, (perf_counter() - t_start) * 1000))
+        # Every run draws a new program, as drawing marks the nodes.
+        for name, fn in (("dot_source", whole), ("dump", streamed)):
+            size, first, elapsed, peak = measure(fn, interpret(text))
+            print("    {:>10}: {:>10} chars, first byte {:8.1f} ms,"
+                  " total {:8.1f} ms, peak {:8.1f} KiB".format(
+                      name, size, first * 1000, elapsed * 1000,
+                      peak / 1024))
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
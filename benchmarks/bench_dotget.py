@@ -0,0 +1,100 @@
+"""
+Scaling of `get_attr` / `dot_get` with the number of children of a block,
+of one `DotPath` reused across many programs, and of interpreting a block
+whose children refer to their siblings.
+
+Every program has an `outer` block with `children` child blocks, and the
+paths lead to an attribute of the last child.
+
+Usage:
+    python benchmarks/bench_dotget.py [children ...]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter, get_attr, dot_get
+
+LOOKUPS = 10000
+PROGRAMS = 20
+
+
+def make_program(children):
+    """Return a program of an `outer` block with `children` blocks."""
+    lines = ["Dummy outer"]
+    for i in range(children):
+        lines += [
+            "    Dummy child{}".format(i),
+            "        num = {}".format(i),
+            "    End",
+        ]
+    lines.append("End")
+    return "\n".join(lines) + "\n"
+
+
+def make_wide_program(children):
+    """Return a program of an `outer` block with `children` blocks, each
+    referring to the previous one."""
+    lines = ["Dummy outer"]
+    for i in range(children):
+        lines += [
+            "    Dummy child{}".format(i),
+            "        num = {}".format(
+                "outer.child{}.num + 1".format(i - 1) if i else 0),
+            "    End",
+        ]
+    lines.append("End")
+    return "\n".join(lines) + "\n"
+
+
+def per_lookup(function, *args):
+    start = perf_counter()
+    for i in range(LOOKUPS):
+        function(*args)
+    return (perf_counter() - start) / LOOKUPS * 1e6
+
+
+def main(*sizes):
+    sizes = sizes or (10, 100, 1000)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    print("{:>9} {:>14} {:>14} {:>18}".format(
+        "children", "get_attr (us)", "dot_get (us)", "path x prog (us)"))
+    for children in sizes:
+        text = make_program(children)
+        programs = [E3lmInterpreter(parser=parser).interpret(parser.parse(text))
+                    for i in range(PROGRAMS)]
+        program = programs[0]
+        last = "child{}".format(children - 1)
+        path = "outer.{}.num".format(last)
+        outer = program.blocks[0]
+        assert dot_get(program, path, eval=True) == children - 1
+
+        by_attr = per_lookup(get_attr, outer, last)
+        by_dot = per_lookup(dot_get, program, path)
+
+        # The same path over every program.
+        start = perf_counter()
+        for i in range(LOOKUPS // PROGRAMS):
+            for p in programs:
+                dot_get(p, path, eval=True)
+        by_path = (perf_counter() - start) / LOOKUPS * 1e6
+        print("{:>9} {:>14.3f} {:>14.3f} {:>18.3f}".format(
+            children, by_attr, by_dot, by_path))
+
+    # Interpreting is linear in the children when they refer to siblings.
+    print("\n{:>9} {:>16}".format("children", "interpret (ms)"))
+    for children in sizes + (sizes[-1] * 4,):
+        tree = parser.parse(make_wide_program(children))
+        start = perf_counter()
+        program = E3lmInterpreter(parser=parser).interpret(tree)
+        elapsed = perf_counter() - start
+        assert dot_get(program, "outer.child{}.num".format(children - 1),
+                       eval=True) == children - 1
+        print("{:>9} {:>16.1f}".format(children, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,71 @@
+"""
+Edit-to-result latency of `Document.edit` versus interpreting the whole
+edited text again, on a large program (20k lines by default).
+
+Each kind of edit is applied and then undone, `repeat` times, in the middle
+of the program.
+
+Usage:
+    python benchmarks/bench_incremental.py [lines] [repeat]
+"""
+import os
+import sys
+from time import perf_counter
+from e3lm.lang.incremental import Document, TextEdit
+from e3lm.utils.lang import interpret
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_memory import make_program  # noqa: E402
+
+# Lines of each block of `make_program`.
+BLOCK_LINES = 9
+
+
+def edits(doc):
+    """Return `{name: (edit, undo)}` of edits in the middle of `doc`."""
+    middle = len(doc.lines) // 2 // BLOCK_LINES * BLOCK_LINES
+    num = doc.lines[middle + 1]
+    col = num.index("=") + 2
+    value = num[col:].rstrip("\n")
+    block = "Dummy added\n    num = 1\n    twice = num * 2\nEnd\n"
+    removed = "".join(doc.lines[middle:middle + BLOCK_LINES])
+    return {
+        "change a value": (
+            TextEdit((middle + 1, col), (middle + 1, col + len(value)), "7"),
+            TextEdit((middle + 1, col), (middle + 1, col + 1), value)),
+        "insert a block": (
+            TextEdit((middle, 0), (middle, 0), block),
+            TextEdit((middle, 0), (middle + 4, 0), "")),
+        "delete a block": (
+            TextEdit((middle, 0), (middle + BLOCK_LINES, 0), ""),
+            TextEdit((middle, 0), (middle, 0), removed)),
+    }
+
+
+def main(lines=20000, repeat=10):
+    text = make_program(lines // BLOCK_LINES)
+    t_start = perf_counter()
+    doc = Document(text)
+    print("{} lines, {} top-level blocks, loaded in {:.1f} ms".format(
+        len(doc.lines), len(doc.program.blocks),
+        (perf_counter() - t_start) * 1000))
+
+    for name, (edit, undo) in edits(doc).items():
+        incremental = full = 0.0
+        for i in range(repeat):
+            for e in (edit, undo):
+                t_start = perf_counter()
+                doc.edit(e)
+                incremental += perf_counter() - t_start
+                text = doc.text
+                t_start = perf_counter()
+                interpret(text)
+                full += perf_counter() - t_start
+        assert not doc.full
+        print("{:<16} incremental {:8.2f} ms, full {:8.2f} ms ({:.0f}x)"
+              .format(name, incremental * 1000 / repeat / 2,
+                      full * 1000 / repeat / 2, full / incremental))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
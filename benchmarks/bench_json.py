@@ -0,0 +1,67 @@
+"""
+Peak memory and time to the first byte of the JSON of a large program.
+
+Compares `json.dumps` of the whole `JsonPlugin` tree (as the CLI used to
+do) with `JsonPlugin.dump` streaming one top-level block at a time, on an
+interpreted program.
+
+Usage:
+    python benchmarks/bench_json.py [blocks]
+"""
+import os
+import sys
+import json
+import tracemalloc
+from time import perf_counter
+from e3lm.contrib.json import JsonPlugin
+from e3lm.utils.lang import interpret
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_memory import make_program  # noqa: E402
+
+
+class Sink():
+    """File-like object counting the written characters."""
+
+    def __init__(self):
+        self.size = 0
+        self.first = None
+
+    def write(self, s):
+        if self.first is None:
+            self.first = perf_counter()
+        self.size += len(s)
+
+
+def measure(program, fn):
+    sink = Sink()
+    tracemalloc.start()
+    t_start = perf_counter()
+    fn(program, sink)
+    elapsed = perf_counter() - t_start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sink.size, sink.first - t_start, elapsed, peak
+
+
+def whole(program, fp):
+    fp.write(json.dumps(JsonPlugin().interpret(program).json, indent=4))
+
+
+def streamed(program, fp):
+    JsonPlugin().dump(program, fp)
+
+
+def main(*sizes):
+    for blocks in sizes or (1000, 10000):
+        program = interpret(make_program(blocks))
+        for name, fn in (("whole", whole), ("streamed", streamed)):
+            size, first, elapsed, peak = measure(program, fn)
+            print("{:>7} blocks {:>9}: {:>10} chars, first byte {:8.1f} ms,"
+                  " total {:8.1f} ms, peak {:8.1f} KiB".format(
+                      blocks, name, size, first * 1000, elapsed * 1000,
+                      peak / 1024))
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
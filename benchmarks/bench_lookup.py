@@ -0,0 +1,69 @@
+"""
+Scaling of block lookups by name and type with the number of blocks.
+
+Times `Program.block_by_name`, `get_attr` on the program and the
+interpreter resolving identifiers that refer to other blocks.
+
+Usage:
+    python benchmarks/bench_lookup.py [blocks ...]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter, get_attr
+
+LOOKUPS = 10000
+
+
+def make_program(blocks):
+    """Return a program where every block refers to the first one."""
+    lines = ["Dummy block0", "    num = 0", "End"]
+    for i in range(1, blocks):
+        lines += [
+            "Dummy block{}".format(i),
+            "    num = block0.num + {}".format(i),
+            "End",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def time_lookups(program, blocks):
+    names = ["block{}".format(i * blocks // LOOKUPS) for i in range(LOOKUPS)]
+    start = perf_counter()
+    for name in names:
+        program.block_by_name(name)
+    by_name = perf_counter() - start
+    start = perf_counter()
+    for name in names:
+        get_attr(program, name)
+    by_attr = perf_counter() - start
+    return by_name, by_attr
+
+
+def main(*sizes):
+    sizes = sizes or (100, 1000, 10000, 100000)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    print("{:>8} {:>14} {:>14} {:>14}".format(
+        "blocks", "by_name (us)", "get_attr (us)", "interpret (s)"))
+    for blocks in sizes:
+        program = parser.parse(make_program(blocks))
+        program.build_flat()
+        by_name, by_attr = time_lookups(program, blocks)
+
+        start = perf_counter()
+        interpreter = E3lmInterpreter(parser=parser)
+        program = interpreter.interpret(program)
+        interpreted = perf_counter() - start
+        assert program.block_by_name("block{}".format(blocks - 1)) \
+            .attrs["num"] == blocks - 1
+        print("{:>8} {:>14.3f} {:>14.3f} {:>14.3f}".format(
+            blocks, by_name * 1e6 / LOOKUPS, by_attr * 1e6 / LOOKUPS,
+            interpreted))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
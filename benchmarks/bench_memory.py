@@ -0,0 +1,102 @@
+"""
+Memory used by the AST of a synthetically large program.
+
+Reports the shallow size of every node (instance plus its `__dict__`, if
+any) after parsing and after interpreting, and the memory allocated while
+doing so.
+
+Usage:
+    python benchmarks/bench_memory.py [blocks]
+"""
+import sys
+import tracemalloc
+from collections import Counter
+from e3lm.lang import ast
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+
+def make_program(blocks):
+    lines = []
+    for i in range(blocks):
+        lines += [
+            "Dummy block{}".format(i),
+            "    num = {}".format(i),
+            "    ratio = num * 2 + 0.5",
+            "    title = 'Block number {}'".format(i),
+            "    items = [1, 2, 3]",
+            "    Dummy inner{}".format(i),
+            "        flag = true",
+            "    End",
+            "End",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def walk(node, seen):
+    """Yield every AST node reachable from `node` once."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+            continue
+        if isinstance(node, dict):
+            stack.extend(node.values())
+            continue
+        if not isinstance(node, ast.AST) or id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        for name in ("blocks", "children", "_attrs", "value", "left",
+                     "right"):
+            stack.append(getattr(node, name, None))
+
+
+def node_size(node):
+    size = sys.getsizeof(node)
+    d = getattr(node, "__dict__", None)
+    if d is not None:
+        size += sys.getsizeof(d)
+    return size
+
+
+def report(label, program):
+    nodes = list(walk(program, set()))
+    sizes = Counter()
+    counts = Counter()
+    for n in nodes:
+        sizes[type(n).__name__] += node_size(n)
+        counts[type(n).__name__] += 1
+    total = sum(sizes.values())
+    print("{}: {} nodes, {:.1f} bytes/node".format(
+        label, len(nodes), total / len(nodes)))
+    for name, count in counts.most_common():
+        print("    {:<12} {:>8} x {:>6.1f} bytes".format(
+            name, count, sizes[name] / count))
+
+
+def main(blocks=1000):
+    text = make_program(blocks)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+
+    tracemalloc.start()
+    program = parser.parse(text)
+    parsed = tracemalloc.get_traced_memory()[0]
+    report("parsed", program)
+
+    interpreter = E3lmInterpreter(parser=parser)
+    program = interpreter.interpret(program)
+    interpreted = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    report("interpreted", program)
+    print("allocated: {:.2f} MiB parsed, {:.2f} MiB interpreted".format(
+        parsed / 2**20, interpreted / 2**20))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
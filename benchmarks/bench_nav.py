@@ -0,0 +1,62 @@
+"""
+Scaling of `next(klass)` / `prev(klass)` navigation with the number of
+pages.
+
+Every page refers to the next and previous pages of its type, among blocks
+of another type, and the interpreter resolves them. The navigation calls
+themselves are also timed on the interpreted program.
+
+Usage:
+    python benchmarks/bench_nav.py [pages ...]
+"""
+import sys
+from time import perf_counter
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+
+def make_program(pages):
+    """Return a program of `pages` Page blocks, each followed by a Note."""
+    lines = []
+    for i in range(pages):
+        lines += [
+            "Page page{}".format(i),
+            "    title = 'Page {}'".format(i),
+            "    following = next(Page)",
+            "    previous = prev(Page)",
+            "End",
+            "Note note{}".format(i),
+            "    text = 'About page {}'".format(i),
+            "End",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def main(*sizes):
+    sizes = sizes or (1000, 2000, 4000)
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build(lexer=lexer)
+    print("{:>8} {:>14} {:>16}".format(
+        "pages", "interpret (s)", "next+prev (us)"))
+    for pages in sizes:
+        program = parser.parse(make_program(pages))
+        interpreter = E3lmInterpreter(parser=parser)
+        start = perf_counter()
+        program = interpreter.interpret(program)
+        interpreted = perf_counter() - start
+
+        blocks = program.flat_blocks.by_type("Page")
+        start = perf_counter()
+        for b in blocks:
+            interpreter.get_next("Page", b)
+            interpreter.get_prev("Page", b)
+        navigated = (perf_counter() - start) / len(blocks) * 1e6
+        print("{:>8} {:>14.3f} {:>16.2f}".format(pages, interpreted,
+                                                 navigated))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
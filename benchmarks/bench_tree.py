@@ -0,0 +1,73 @@
+"""
+Time, peak memory and time to the first line of printing the tree of large
+programs, as the CLI does at the INFO verbosity.
+
+Compares `asciitree.LeftAligned` building the whole tree as one string (as
+`nprint` used to do) with `TreePrinter` writing it line by line, drawing all
+the nodes and with the default child cap of the CLI.
+
+Usage:
+    python benchmarks/bench_tree.py [blocks ...]
+"""
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+from asciitree import LeftAligned
+from e3lm.helpers import printers
+from e3lm.utils.lang import interpret
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_json import Sink  # noqa: E402
+from bench_memory import make_program  # noqa: E402
+
+# Default of `--tree-children`.
+MAX_CHILDREN = 100
+
+
+def measure(fn, program):
+    sink = Sink()
+    tracemalloc.start()
+    t_start = perf_counter()
+    fn(program, sink)
+    elapsed = perf_counter() - t_start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sink.size, sink.first - t_start, elapsed, peak
+
+
+def traverse():
+    return printers.TRAVERSE(cols=printers.COLORS, charset=[],
+                             program_name="bench", evaluate=True)
+
+
+def asciitree(program, fp):
+    tree = LeftAligned(draw=printers.TREE_NODES.draw, traverse=traverse())
+    fp.write(tree(program) + "\n")
+
+
+def streamed(program, fp, max_children=None):
+    printers.TreePrinter(draw=printers.TREE_NODES.draw, traverse=traverse(),
+                         max_children=max_children).write(program, fp)
+
+
+def capped(program, fp):
+    streamed(program, fp, MAX_CHILDREN)
+
+
+def main(*sizes):
+    for blocks in sizes or (1000, 10000, 50000):
+        t_start = perf_counter()
+        program = interpret(make_program(blocks))
+        print("{:>6} blocks, interpreted in {:8.1f} ms".format(
+            blocks, (perf_counter() - t_start) * 1000))
+        for name, fn in (("asciitree", asciitree), ("TreePrinter", streamed),
+                         ("capped", capped)):
+            size, first, elapsed, peak = measure(fn, program)
+            print("    {:>11}: {:>10} chars, first line {:8.1f} ms,"
+                  " total {:8.1f} ms, peak {:9.1f} KiB".format(
+                      name, size, first * 1000, elapsed * 1000, peak / 1024))
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
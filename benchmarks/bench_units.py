@@ -0,0 +1,71 @@
+"""
+Cost of unit conversions and of the `UnitsPlugin` on many attributes.
+
+Times `Unit.convert` one value at a time, `UnitRegistry.convert_many` on a
+list of values, and interpreting a program where every block has attributes
+with units: with `UnitsPlugin` after the interpretation, and with the
+arithmetic in units of an interpreter with `units`.
+
+Usage:
+    python benchmarks/bench_units.py [values] [blocks]
+"""
+import sys
+from time import perf_counter
+from e3lm.contrib.units import UnitsPlugin, registry, cm
+from e3lm.utils.lang import interpret
+
+UNITS = ("cm", "mm", "m", "km", "in", "px", "pt", "pc")
+
+
+def make_program(blocks):
+    """Return a program of `blocks` blocks with two attributes with units."""
+    lines = []
+    for i in range(blocks):
+        lines += [
+            "Dummy block{}".format(i),
+            "    width = {}".format(i),
+            "    width_unit = '{}'".format(UNITS[i % len(UNITS)]),
+            "    height = {}".format(i * 2),
+            "    height_unit = 'cm'",
+            "    area = width / 2 + height",
+            "    area_unit = 'mm'",
+            "End",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def main(values=100000, blocks=2000):
+    amounts = [float(i) for i in range(values)]
+    for target in ("px", "km"):
+        start = perf_counter()
+        for a in amounts:
+            cm.convert(target, a)
+        one = perf_counter() - start
+        start = perf_counter()
+        registry.convert_many(amounts, cm, target)
+        many = perf_counter() - start
+        print("cm -> {:<3} convert {:8.3f} us/value, convert_many {:8.3f}"
+              " us/value".format(target, one * 1e6 / values,
+                                 many * 1e6 / values))
+
+    text = make_program(blocks)
+    start = perf_counter()
+    interpret(text)
+    plain = perf_counter() - start
+    start = perf_counter()
+    program = interpret(text, plugins=[UnitsPlugin])
+    with_units = perf_counter() - start
+    start = perf_counter()
+    for b in program.blocks:
+        b._attrs["width"].convert("m")
+    converted = perf_counter() - start
+    start = perf_counter()
+    interpret(text, units=True)
+    arithmetic = perf_counter() - start
+    print("{} blocks: interpret {:.3f} s, with units {:.3f} s, convert all"
+          " widths {:.2f} ms, arithmetic in units {:.3f} s".format(
+              blocks, plain, with_units, converted * 1000, arithmetic))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -6,8 +6,11 @@ upgrading the interpreter and its plugins.
 """
 __version__ = "0.1.9"
 
-__doc2__ = """additional arguments:
-    Nothing for now.
+__doc2__ = """commands:
+  build dir             interpret the 3lm files of a directory tree in parallel
+                        (see e3lm build --help)
+  serve                 answer JSON-RPC requests with warm parsers on a Unix
+                        socket or stdin/stdout (see e3lm serve --help)
 """
 
 __doc3__ = """additional arguments:
@@ -25,24 +28,20 @@ __doc3__ = """additional arguments:
 import argparse
 import io
 import itertools
-import json
 import os
-import signal
-import subprocess
 import sys
 from shlex import quote
 from time import perf_counter, sleep
 
-from graphviz import Source as GraphvizSource
-
-from e3lm.contrib.dot import DotPlugin as Dot
-from e3lm.contrib.json import JsonPlugin as Json
+# graphviz, jinja2, subprocess and the contrib plugins are imported by the
+# code paths that need them, to keep the startup fast.
 from e3lm.demos.data import getcode as gettestcode
 from e3lm.helpers import printers
 from e3lm.helpers.printers import COLORS
 from e3lm.lang.ast import basic_dt
 from e3lm.lang.interpreters import E3lmInterpreter, E3lmPlugin
 from e3lm.utils.lang import get_plugin, interpret, lex, parse
+from e3lm.utils.profiling import Profile
 
 # Variables
 
@@ -138,33 +137,20 @@ def demo_exists(f):
     return demo_file(f) != None
 
 
-def CLI(input_file="-", kwargs={}):
-    """The actual CLI."""
-    if kwargs:
-        quiet = kwargs["quiet"]
-        verbose = kwargs["verbose"]
-        verbose_lvl = kwargs["verbose_lvl"]
-        demos = kwargs["demos"]
-        plugins = kwargs["plugins"]
-        nocolors = kwargs["nocolors"]
-        noglyph = kwargs["noglyph"]
-        formatstyle = kwargs["formatstyle"]
-        benchmarking = kwargs["benchmarking"]
-        benchmarking_mods = kwargs["benchmarking_mods"]
-        colors = kwargs["colors"]
-        e3lm_parser = kwargs["e3lm_parser"]
+def load_runstack(input_file, kwargs):
+    """Return the dict of the texts to run by name, read from `input_file`
+    (a file, "-" for none or "." for the 3lm files of the cwd) and the demos.
+    """
+    demos = kwargs["demos"]
+    colors = kwargs["colors"]
+    benchmarking_mods = kwargs["benchmarking_mods"]
+    e3lm_parser = kwargs["e3lm_parser"]
 
-    shown_msgs = {}
     runstack = {}
-    runtime = {}
     special_positionals = ("?", "help",  # Help alternatives.
                            "-", ".",  # No or all file(s)
                            )
 
-    tmpdir = os.getenv("E3LM_TEMP_DIRECTORY", "tmp")
-    if not os.path.exists(tmpdir):
-        os.mkdir(tmpdir)
-
     # Check for special positional argument values in place of "file"
     if input_file in special_positionals:
         if input_file in ["?", "help"]:
@@ -219,6 +205,35 @@ def CLI(input_file="-", kwargs={}):
                 d = (d + "\n") * int(benchmarking_mods["lengthofcode"])
             runstack[key] = d
 
+    return runstack
+
+
+def CLI(input_file="-", kwargs={}):
+    """The actual CLI."""
+    if kwargs:
+        quiet = kwargs["quiet"]
+        verbose = kwargs["verbose"]
+        verbose_lvl = kwargs["verbose_lvl"]
+        demos = kwargs["demos"]
+        plugins = kwargs["plugins"]
+        nocolors = kwargs["nocolors"]
+        noglyph = kwargs["noglyph"]
+        formatstyle = kwargs["formatstyle"]
+        benchmarking = kwargs["benchmarking"]
+        benchmarking_mods = kwargs["benchmarking_mods"]
+        colors = kwargs["colors"]
+        e3lm_parser = kwargs["e3lm_parser"]
+        json_format = kwargs["json_format"]
+        dot_options = kwargs["dot_options"]
+        tree_options = kwargs["tree_options"]
+
+    shown_msgs = {}
+    runstack = load_runstack(input_file, kwargs)
+    runtime = {}
+    tmpdir = os.getenv("E3LM_TEMP_DIRECTORY", "tmp")
+    if not os.path.exists(tmpdir):
+        os.mkdir(tmpdir)
+
     # Print headers for each runtime
     for i, run in runstack.items():
         if formatstyle == "DEFAULT":
@@ -229,8 +244,12 @@ def CLI(input_file="-", kwargs={}):
         elif formatstyle == "COMPATIBLE":
             print("Runtime.begin", i)
 
+        # The JSON is streamed to the output once interpreted, see below.
         run_plugins = [get_plugin(p) for p in plugins if p not in CLI_PLUGINS and
-                       type(get_plugin(p)) not in basic_dt]
+                       p != "json" and type(get_plugin(p)) not in basic_dt]
+        if "dot" in plugins and dot_options:
+            run_plugins = [p(**dot_options) if p.__name__ == "DotPlugin" else p
+                           for p in run_plugins]
 
         if "lex" in plugins:
             run_program = lex(run, i, debug=verbose_lvl >= 2,
@@ -247,7 +266,8 @@ def CLI(input_file="-", kwargs={}):
                 if not benchmarking_mods["enabled"]:
                     if formatstyle == "COMPATIBLE":
                         print("Program.begin", i)
-                    printers.nprint(run_program, max_level=0, pallete=None if nocolors else COLORS,
+                    printers.nprint(run_program, **tree_options,
+                                    pallete=None if nocolors else COLORS,
                                     noglyph=noglyph, program_name=i, evaluate=False)
                     if formatstyle == "COMPATIBLE":
                         print("Program.end")
@@ -275,7 +295,8 @@ def CLI(input_file="-", kwargs={}):
             if not benchmarking_mods["enabled"]:
                 if formatstyle == "COMPATIBLE":
                     print("Program.begin", i)
-                printers.nprint(run_program, max_level=0, pallete=None if nocolors else COLORS,
+                printers.nprint(run_program, **tree_options,
+                                pallete=None if nocolors else COLORS,
                                 noglyph=noglyph, program_name=i, evaluate=True)
                 if formatstyle == "COMPATIBLE":
                     print("Program.end")
@@ -308,7 +329,12 @@ def CLI(input_file="-", kwargs={}):
         if "json" in plugins:
             if formatstyle == "COMPATIBLE":
                 print("Plugin.json.begin")
-            print(json.dumps(run_program.json, indent=4))
+            from e3lm.contrib.json import JsonPlugin as Json
+            Json().dump(run_program, sys.stdout,
+                        indent=None if json_format == "compact" else 4,
+                        ndjson=json_format == "ndjson")
+            if json_format != "ndjson":
+                print()
             if formatstyle == "COMPATIBLE":
                 print("Plugin.json.end")
 
@@ -324,6 +350,7 @@ def CLI(input_file="-", kwargs={}):
                     exit(1)
 
                 if formatstyle == "DEFAULT":
+                    from graphviz import Source as GraphvizSource
                     graph = GraphvizSource(
                         run_program.dot_source, filename=tmpdir + "/" + i + ".dot", format="png")
                     graph.view()
@@ -342,6 +369,8 @@ def CLI(input_file="-", kwargs={}):
 
 def caller(the_call, _type="subprocess", shell=True, ret=False, stdout=-1, stderr=-1):
     """Calls a shell command, or a program."""
+    import signal
+    import subprocess
 
     if _type == "os":
         proc = subprocess.Popen(the_call,
@@ -366,7 +395,70 @@ def caller(the_call, _type="subprocess", shell=True, ret=False, stdout=-1, stder
         return p
 
 
+def BENCHMARK_INPROCESS(input_file, kwargs={}):
+    """Benchmark each phase (lex, parse, interpret and plugins) in this
+    process and print min/median/p95/stddev per phase."""
+    from e3lm.utils.bench import STATS, benchmark
+
+    plugins = kwargs["plugins"]
+    nocolors = kwargs["nocolors"]
+    formatstyle = kwargs["formatstyle"]
+    benchmarking = kwargs["benchmarking"]
+    warmup = kwargs["benchmark_warmup"]
+    colors = kwargs["colors"]
+
+    kwargs = dict(kwargs, benchmarking_mods={
+        "enabled": True,
+        "lengthofcode": benchmarking[1],
+        "iterations": benchmarking[0],
+    })
+    runstack = load_runstack(input_file, kwargs)
+    run_plugins = [get_plugin(p) for p in plugins if p not in CLI_PLUGINS and
+                   type(get_plugin(p)) not in basic_dt]
+
+    def ms(ns):
+        return "{:.3f}".format(ns / 1e6)
+
+    if formatstyle == "DEFAULT":
+        printers.cprint(colors["2"] + "--" + colors["2"] + "== " + colors["2"] +
+                        "Benchmarking..." + colors["2"] + " ==" + colors["2"] + "--" + colors["R"], color="" if nocolors else "SUCCESS")
+    elif formatstyle == "COMPATIBLE":
+        print("Benchmark.begin")
+
+    for i, run in runstack.items():
+        results = benchmark(run, i if os.path.isfile(i) else None,
+                            plugins=run_plugins,
+                            repeat=int(benchmarking[0]), warmup=warmup)
+        if formatstyle == "DEFAULT":
+            printers.cprint(colors["3"] + "--" + colors["1"] + "== " + colors["4"] +
+                            i + colors["1"] + " ==" + colors["3"] + "--" + colors["R"], color="" if nocolors else "SUCCESS")
+            print(colors["1"] + "{:<24}".format("phase (ms)") +
+                  "".join("{:>12}".format(k) for k in STATS) + colors["R"])
+            for phase, stats in results.items():
+                print(colors["HEADER"] + "{:<24}".format(phase) + colors["R"] +
+                      "".join("{:>12}".format(ms(stats[k])) for k in STATS))
+        elif formatstyle == "COMPATIBLE":
+            print("Runtime.begin", i)
+            for phase, stats in results.items():
+                print("Benchmark.info.phase", phase,
+                      " ".join(ms(stats[k]) for k in STATS))
+            print("Runtime.end")
+
+    if formatstyle == "DEFAULT":
+        print(colors["1"] + "Iterations: " + colors["HEADER"] + str(benchmarking[0]) +
+              colors["1"] + " (+" + str(warmup) + " warm-up)" + colors["R"])
+        printers.cprint(colors["2"] + "--" + colors["2"] + "== " + colors["2"] +
+                        "Benchmarking done..." + colors["2"] + " ==" + colors["2"] + "--" + colors["R"] + "\n", color="" if nocolors else "SUCCESS")
+    elif formatstyle == "COMPATIBLE":
+        print("Benchmark.info.total_iter", benchmarking[0])
+        print("Benchmark.end")
+
+    exit(0)
+
+
 def BENCHMARK(input_file, kwargs={}):
+    """Benchmark by running the CLI in a new process for every iteration,
+    startup included (see `BENCHMARK_INPROCESS` for the in-process mode)."""
     import math
 
     if kwargs:
@@ -525,7 +617,150 @@ def BENCHMARK(input_file, kwargs={}):
     exit(0)
 
 
+def BUILD(argv):
+    """Interpret the 3lm files of a directory tree in parallel and write
+    their outputs (`e3lm build <dir>`)."""
+    from e3lm.utils.build import OUTPUTS, BuildCache, build
+
+    build_parser = argparse.ArgumentParser(prog='e3lm build',
+                                           usage='%(prog)s [options] dir',
+                                           description=BUILD.__doc__)
+    build_parser.add_argument('dir',
+                              help='directory searched recursively for .3lm files')
+    build_parser.add_argument('-o',
+                              '--output',
+                              metavar='DIR',
+                              dest='output',
+                              default='build',
+                              help='directory of the outputs (default is build)')
+    build_parser.add_argument('-j',
+                              '--jobs',
+                              metavar='N',
+                              dest='jobs',
+                              type=int,
+                              default=None,
+                              help='number of worker processes, 0 to build in this process\n'
+                              '(default is the number of CPUs)')
+    build_parser.add_argument('-p',
+                              '--plugin',
+                              metavar='|'.join(OUTPUTS),
+                              dest='outputs',
+                              nargs='+',
+                              choices=list(OUTPUTS),
+                              default=["json"],
+                              help='outputs written for each file (default is json)')
+    build_parser.add_argument('--no-cache',
+                              action='store_true',
+                              dest='nocache',
+                              default=False,
+                              help='build every file, even the unchanged ones')
+    build_parser.add_argument('-q',
+                              '--quiet',
+                              action='store_true',
+                              dest='quiet',
+                              default=False,
+                              help='only print the errors')
+    build_parser.add_argument('-nc',
+                              '--no-color',
+                              action='store_true',
+                              dest="nocolors",
+                              default=False,
+                              help='set output to be without ANSI colors')
+    args = build_parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 0:
+        build_parser.error('argument -j/--jobs: must be at least 0')
+
+    colors = COLORS
+    if args.nocolors:
+        colors = {k: "" for k in COLORS.keys()}
+    if not os.path.isdir(args.dir):
+        print(colors["E"] + 'Error: ' + args.dir +
+              ' is not a directory.' + colors["R"], file=sys.stderr)
+        sys.exit(1)
+
+    cache = None
+    if not args.nocache:
+        cache = BuildCache(os.path.join(args.output, ".e3lm-cache.json"))
+
+    done = 0
+    cached = 0
+    errors = []
+    t_start = perf_counter()
+    for result in build(args.dir, args.output, outputs=args.outputs,
+                        workers=args.jobs, cache=cache):
+        done += 1
+        if result.cached:
+            cached += 1
+        elif not result.ok:
+            errors.append(result)
+            print(colors["E"] + 'Error: ' + result.path + ': ' +
+                  result.error + colors["R"], file=sys.stderr)
+        elif not args.quiet:
+            print(colors["2"] + "       - " + colors["R"] + result.path)
+    seconds = perf_counter() - t_start
+
+    rate = done / seconds if seconds > 0 else 0.0
+    print(colors["1"] + "Built: " + colors["HEADER"] + str(done - len(errors)) +
+          colors["1"] + "/" + str(done) + " file(s), " + colors["HEADER"] +
+          str(len(errors)) + colors["1"] + " error(s), " + colors["HEADER"] +
+          str(cached) + colors["1"] + " unchanged in " + colors["HEADER"] +
+          "{:.2f}".format(seconds) + colors["1"] + " s (" + colors["HEADER"] +
+          "{:.1f}".format(rate) + colors["1"] + " files/s)" + colors["R"])
+    sys.exit(1 if errors else 0)
+
+
+def SERVE(argv):
+    """Keep the parsers and plugins warm and answer JSON-RPC 2.0 requests
+    (lex, parse, interpret, json, dot), one JSON object per line, on a Unix
+    domain socket or stdin/stdout (`e3lm serve`)."""
+    import asyncio
+    from e3lm.utils.serve import E3lmServer
+
+    serve_parser = argparse.ArgumentParser(prog='e3lm serve',
+                                           usage='%(prog)s [options]',
+                                           description=SERVE.__doc__)
+    transport = serve_parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument('-s',
+                           '--socket',
+                           metavar='PATH',
+                           dest='socket',
+                           help='path of the Unix domain socket to listen on')
+    transport.add_argument('--stdio',
+                           action='store_true',
+                           dest='stdio',
+                           default=False,
+                           help='read the requests from stdin and write the responses to stdout')
+    serve_parser.add_argument('-j',
+                              '--jobs',
+                              metavar='N',
+                              dest='jobs',
+                              type=int,
+                              default=4,
+                              help='number of worker threads (default is 4)')
+    args = serve_parser.parse_args(argv)
+    if args.jobs < 1:
+        serve_parser.error('argument -j/--jobs: must be at least 1')
+
+    server = E3lmServer(workers=args.jobs)
+    try:
+        if args.stdio:
+            asyncio.run(server.serve_stdio())
+        else:
+            print("Serving on " + args.socket, file=sys.stderr)
+            asyncio.run(server.serve_unix(args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    sys.exit(0)
+
+
 def main():
+    if sys.argv[1:2] == ["build"]:
+        return BUILD(sys.argv[2:])
+    if sys.argv[1:2] == ["serve"]:
+        return SERVE(sys.argv[2:])
+
     e3lm_parser = argparse.ArgumentParser(prog='e3lm',
                                           usage='%(prog)s [options] file',
                                           description=__doc__,
@@ -618,6 +853,100 @@ def main():
                              help='Formatting of the output messages',
                              )
 
+    e3lm_parser.add_argument('-bm',
+                             '--benchmark-mode',
+                             action='store',
+                             metavar='process|subprocess',
+                             dest='benchmark_mode',
+                             type=str,
+                             choices=["process", "subprocess"],
+                             default="process",
+                             help="Benchmark each phase in this process, or run every iteration\n"
+                             "in a subprocess to measure cold starts (default is process)",
+                             )
+
+    e3lm_parser.add_argument('-bw',
+                             '--benchmark-warmup',
+                             metavar='N',
+                             dest='benchmark_warmup',
+                             type=int,
+                             default=1,
+                             help="Number of untimed runs before an in-process benchmark (default is 1)",
+                             )
+
+    e3lm_parser.add_argument('-jf',
+                             '--json-format',
+                             action='store',
+                             metavar='pretty|compact|ndjson',
+                             dest='json_format',
+                             type=str,
+                             choices=["pretty", "compact", "ndjson"],
+                             default="pretty",
+                             help="Format of the json plugin output: indented, without indent, or\n"
+                             "one block per line (default is pretty)",
+                             )
+
+    e3lm_parser.add_argument('--tree-depth',
+                             metavar='N',
+                             dest='tree_depth',
+                             type=int,
+                             default=None,
+                             help="Print the tree of the program up to N levels deep\n"
+                             "(default is all levels)",
+                             )
+
+    e3lm_parser.add_argument('--tree-children',
+                             metavar='N',
+                             dest='tree_children',
+                             type=int,
+                             default=100,
+                             help="Print up to N children of every node of the tree, the\n"
+                             "others are counted (default is 100, 0 for all)",
+                             )
+
+    e3lm_parser.add_argument('--dot-depth',
+                             metavar='N',
+                             dest='dot_depth',
+                             type=int,
+                             default=None,
+                             help="Draw the blocks up to nesting depth N with the dot plugin,\n"
+                             "deeper blocks are summarized by type",
+                             )
+
+    e3lm_parser.add_argument('--dot-collapse',
+                             metavar='TYPE',
+                             dest='dot_collapse',
+                             nargs='+',
+                             default=None,
+                             help="Draw the blocks of TYPE(s) as one summary node per parent\n"
+                             "with the dot plugin",
+                             )
+
+    e3lm_parser.add_argument('--dot-no-expressions',
+                             dest='dot_expressions',
+                             action='store_false',
+                             default=True,
+                             help="Do not draw the expressions of attributes with the dot plugin",
+                             )
+
+    e3lm_parser.add_argument('--dot-split',
+                             metavar='DIR',
+                             dest='dot_split',
+                             default=None,
+                             help="Also write the dot source of every top-level block to its own\n"
+                             "file in DIR with the dot plugin",
+                             )
+
+    e3lm_parser.add_argument('--profile',
+                             metavar='FILE',
+                             dest='profile',
+                             nargs='?',
+                             const='-',
+                             default=None,
+                             help="Record the time and counters of each phase and write them as\n"
+                             "JSON to FILE (or the standard output)",
+                             )
+
     # For passing BENCHMARK to subprocess to modify length of codes.
     e3lm_parser.add_argument('--benchmark-mods',
                              dest='benchmarking_mods',
@@ -652,6 +981,22 @@ def main():
             '=')[1] for b in benchmarking_mods}
         benchmarking_mods["enabled"] = True
 
+    # Options of the dot plugin that are given.
+    dot_options = {k: v for k, v in (("depth", args.dot_depth),
+                                     ("collapse", args.dot_collapse),
+                                     ("split", args.dot_split))
+                   if v is not None}
+    if not args.dot_expressions:
+        dot_options["expressions"] = False
+
+    # Limits of the printed tree.
+    for option, value in (("--tree-depth", args.tree_depth),
+                          ("--tree-children", args.tree_children)):
+        if value is not None and value < 0:
+            e3lm_parser.error("argument {}: must be at least 0".format(option))
+    tree_options = {"max_level": args.tree_depth,
+                    "max_children": args.tree_children or None}
+
     kwargs = {
         "args": args,
         "quiet": quiet,
@@ -664,6 +1009,11 @@ def main():
         "formatstyle": formatstyle,
         "benchmarking": benchmarking,
         "benchmarking_mods": benchmarking_mods,
+        "benchmark_mode": args.benchmark_mode,
+        "benchmark_warmup": args.benchmark_warmup,
+        "json_format": args.json_format,
+        "dot_options": dot_options,
+        "tree_options": tree_options,
         "colors": colors,
         "e3lm_parser": e3lm_parser,
     }
@@ -676,10 +1026,30 @@ def main():
             elif len(benchmarking) == 1:
                 benchmarking.append(1)
         if benchmarking[0] != 0 and benchmarking[1] != 0:
-            BENCHMARK(input_file, kwargs=kwargs)
+            if args.benchmark_mode == "subprocess":
+                BENCHMARK(input_file, kwargs=kwargs)
+            else:
+                BENCHMARK_INPROCESS(input_file, kwargs=kwargs)
     else:
         # --- Actual program ---
-        CLI(input_file, kwargs=kwargs)
+        if args.profile is None:
+            CLI(input_file, kwargs=kwargs)
+        else:
+            with Profile() as prof:
+                try:
+                    CLI(input_file, kwargs=kwargs)
+                finally:
+                    write_profile(prof, args.profile)
+
+
+def write_profile(prof, path="-"):
+    """Write the JSON of the profile `prof` to the file `path`, or the
+    standard output if `path` is "-"."""
+    if path == "-":
+        print(prof.to_json(indent=4))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(prof.to_json(indent=4))
 
 
 if __name__ == "__main__":
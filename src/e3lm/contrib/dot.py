@@ -4,27 +4,75 @@ Author: Kenan Masri
 `DotPlugin` is an E3lm interpreter plugin used to provide a `dot` attribute
 to the main program, containing the text that can be used to generate
 a dot graph with `graphviz` package.
+With the `stream` option, the dot source is written to a file-like object
+as its nodes are drawn instead (see `DotPlugin.dump`).
+
+Options of the level of detail, to draw overviews of large programs:
+    `depth`: Maximum nesting depth of the drawn blocks, top-level blocks
+        being at depth 1.
+    `collapse`: Types of the blocks drawn as one `Summary` node per parent.
+        Blocks deeper than `depth` are summarized the same way.
+    `expressions`: Whether to draw the expressions of the attributes
+        (default is `True`).
+    `split`: Directory where the dot source of every top-level block is
+        written to its own file (see `DotPlugin.dump_blocks`).
 """
+import io
+import os
 import textwrap
-from graphviz import Graph
-from copy import deepcopy
+from types import MappingProxyType
+from collections import deque
 from e3lm.lang import ast
 from e3lm.lang.interpreters import E3lmPlugin
 from e3lm.lang.data import basic_dt
 
 
+def block_depth(block):
+    """Return the nesting depth of `block`, 1 for top-level blocks."""
+    depth = 0
+    while type(block) == ast.Block:
+        depth += 1
+        block = getattr(block, "parent", None)
+    return depth
+
+
+class Summary(ast.AST):
+    """Node drawn in place of `count` blocks of `type`, with the number of
+    `blocks` and `attrs` that they contain."""
+    __slots__ = ("type", "count", "blocks", "attrs")
+
+    def __init__(self, type):
+        self.type = type
+        self.count = self.blocks = self.attrs = 0
+        self.children = []
+
+    def add(self, block):
+        self.count += 1
+        stack = [block]
+        while stack:
+            b = stack.pop()
+            self.attrs += len(b._attrs)
+            self.blocks += len(b.children)
+            stack.extend(b.children)
+
+
 class ParseTreeVisualizer(object):
+    """Draws the nodes of a parsed program breadth-first, writing the line
+    of every node and edge as it goes (see `write`)."""
+
+    NODE_LINE = ' node{} [shape="{}",fillcolor="{}",color="{}",style="{}",label={}]\n'
+
     def __init__(self, parsed, interpreter=None, rankdir="LR"):
         self.parsed = parsed
         self.ncount = 1
-        self.dot_header = [textwrap.dedent("""digraph G {\
+        self.dot_header = textwrap.dedent("""digraph G {\
   graph [bgcolor="#22222222", rankdir=""" + rankdir + """]
   node [fontcolor="white" fontname="Arial" fontsize=13 height=.3 rankdir=LR ranksep=1 shape=rect]
   edge [arrowsize=.6 color="#666666"]
-        """)]
-        self.dot_body = []
-        self.dot_footer = ['}']
+        """)
+        self.dot_footer = '}'
         self.interpreter = interpreter
+        self.emit = None
 
     def draw(self, parent, node):
         # --- Node ---
@@ -73,7 +121,8 @@ class ParseTreeVisualizer(object):
                 s = ' node{} [shape={},fillcolor={},color={},style={},label="{}"]\n'.format(
                     num, "rect", "red", "red", "filled", node,
                 )
-        self.dot_body.append(s)
+        if s:
+            self.emit(s)
 
         # --- Connecting line ---
         if parent:
@@ -91,21 +140,26 @@ class ParseTreeVisualizer(object):
                     s = '  node{} -> node{} [color="{}"]\n'.format(
                         parent.dot["id"], num, col
                     )
-            self.dot_body.append(s)
+            if s:
+                self.emit(s)
 
         self.ncount += 1
 
     def bfs(self, program):
-        self.ncount = program._id + 0
-        self.queue = []
+        # Nodes drawn without an id of the interpreter are numbered after its
+        # ids and the ones of earlier drawings (e.g. of `dump_blocks` after
+        # `interpret`), so that they are not drawn as the same node.
+        self.ncount = max(program._id, getattr(self.interpreter, "_ids", 0),
+                          getattr(self.interpreter, "_drawn_ids", 0))
+        self.queue = deque()
         s, program.dot_children = self.get_dot_data(program, program.dot["id"])
-        self.dot_body.append(s)
+        self.emit(s)
         self.ncount += 1
         self.queue.append(program)
         main_node = program
 
         while self.queue:
-            node = self.queue.pop(0)
+            node = self.queue.popleft()
             if hasattr(node, "dot_children"):
                 for child_node in node.dot_children:
                     if not isinstance(node, basic_dt):
@@ -115,12 +169,21 @@ class ParseTreeVisualizer(object):
                 if not isinstance(node, basic_dt):
                     self.draw(main_node, node)
                     self.queue.append(node)
+        if self.interpreter is not None:
+            self.interpreter._drawn_ids = self.ncount
+
+    def write(self, fp):
+        """Write the dot source to the file-like `fp`, one line per node and
+        edge as they are drawn."""
+        self.emit = fp.write
+        self.emit(self.dot_header)
+        self.bfs(self.parsed)
+        self.emit(self.dot_footer)
 
     def gendot(self):
-        tree = self.parsed
-        self.bfs(tree)
-        v = ''.join(self.dot_header + self.dot_body + self.dot_footer)
-        return v
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
 
     def get_dot_data(self, node_or_dot, num, dots={}):
         if isinstance(node_or_dot, ast.AST):
@@ -138,7 +201,8 @@ class ParseTreeVisualizer(object):
         return self.stringify_dot(dotd, num, dots), children
 
     def stringify_dot(self, dotd, num, dots={}):
-        dot = {**dotd, **dots}
+        # The label of aligned nodes changes, do not change `dotd`.
+        dot = {**dotd, **dots} if dots or "align" in dotd else dotd
         if "align" in dot.keys():
             if dot["align"] in ("left", "ltr", "l"):
                 dot["label"] = "\\l".join(dot["label"].splitlines()) + "\\l"
@@ -146,11 +210,9 @@ class ParseTreeVisualizer(object):
                 dot["label"] = "\\r".join(dot["label"].splitlines()) + "\\r"
 
         q = "\"" if not dot["label"].startswith("<") else ""
-        s = ' node{} [shape="{}",fillcolor="{}",color="{}",style="{}",label={}]\n'
-        s = s.format(num,
-                     dot["shape"], dot["fillcolor"], dot["color"], dot["style"],
-                     q + dot["label"] + q
-                     )
+        s = self.NODE_LINE.format(
+            num, dot["shape"], dot["fillcolor"], dot["color"], dot["style"],
+            q + dot["label"] + q)
 
         if "extra" in dot.keys():
             s += dot["extra"].format(
@@ -169,64 +231,82 @@ class DotPlugin(E3lmPlugin):
     RANKDIR = "LR"
     SIZE = '6,9'
 
+    # Styles of the nodes, shared by the nodes of each kind.
     NODES = {
-        "Program": {
+        "Program": MappingProxyType({
             "shape": "diamond",
             "fillcolor": "#000000A0",
             "fontcolor": "#d300d3",
             "color": "#d38400",
             "style": "filled",
             "label": "Program",
-        },
-        "Block": {
+        }),
+        "Block": MappingProxyType({
             "shape": "square",
             "fillcolor": "#d3840050",
             "fontcolor": "#7e0e7e",
             "color": "#d38400",
             "style": "filled",
             "label": "Block",
-        },
-        "AST": {
+        }),
+        "AST": MappingProxyType({
             "shape": "circle",
             "fillcolor": "pink",
             "color": "white",
             "style": "filled",
             "label": "AST",
-        },
-        "Attr": {
+        }),
+        "Attr": MappingProxyType({
             "shape": "rect",
             "fillcolor": "#d3840050",
             "fontcolor": "#d384a0",
             "color": "#d38400",
             "style": "filled",
             "label": "Attr",
-        },
-        "Expr": {
+        }),
+        "Expr": MappingProxyType({
             "shape": "rect",
             "fillcolor": "#7e0e7e50",
             "color": "#7e0e7e",
             "fontcolor": "white",
             "style": "filled",
             "label": "<>"
-        },
-        "Func": {
+        }),
+        "Func": MappingProxyType({
             "shape": "circle",
             "fillcolor": "pink",
             "color": "pink",
             "style": "filled",
             "label": "Function",
-        },
-        "eval": {
+        }),
+        "Summary": MappingProxyType({
+            "shape": "folder",
+            "fillcolor": "#d3840025",
+            "fontcolor": "#d38400",
+            "color": "#d38400",
+            "style": "filled,dashed",
+            "label": "Summary",
+        }),
+        "eval": MappingProxyType({
             "shape": "rectangle",
             "color": "#167cd6",
             "fontcolor": "#167cd6",
             "fillcolor": "#000000",
-        },
+        }),
     }
 
     def __init__(self, **kwargs):
         self.options = kwargs
         self._ids = 0
+        # Next id of the nodes drawn without one, see `ParseTreeVisualizer`.
+        self._drawn_ids = 0
+        self.depth = kwargs.get("depth", None)
+        self.collapse = frozenset(kwargs.get("collapse", ()))
+        self.expressions = kwargs.get("expressions", True)
+        # Top-level block drawn by `dump_blocks`.
+        self.root = None
+        # graphviz is only imported when the plugin is used.
+        from graphviz import Graph
         self.g = g = Graph('G')
         self.g.attr('graph', bgcolor="#22222222")
         self.g.attr('node', fontname="Arial", fontcolor="white", shape="rect",
@@ -238,13 +318,89 @@ class DotPlugin(E3lmPlugin):
         return int(self._ids - 1)
 
     def interpret(self, program, source=None):
+        if "stream" in self.options.keys():
+            self.dump(program, self.options["stream"])
+            # The dot source is not kept in streaming mode.
+            self.program.dot_source = None
+            return self.program
         self.program = program
         self.program = self.visit(self.program)
         self.ptv = ParseTreeVisualizer(
             self.program, self, rankdir=self.RANKDIR)
         self.program.dot_source = self.ptv.gendot()
+        if self.options.get("split"):
+            self.dump_blocks(self.program, self.options["split"])
         return self.program
 
+    def dump(self, program, fp):
+        """Write the dot source of `program` to the file-like `fp` while its
+        nodes are drawn, without keeping it in memory.
+
+        The output is the same as the `dot_source` of `interpret`.
+        """
+        self.program = self.visit(program)
+        self.ptv = ParseTreeVisualizer(
+            self.program, self, rankdir=self.RANKDIR)
+        self.ptv.write(fp)
+
+    def dump_blocks(self, program, outdir):
+        """Write the dot source of every top-level block of `program` to its
+        own file in `outdir`, named after its position and name or type.
+
+        Links to nodes of other blocks are drawn as values. Returns the list
+        of the written paths.
+        """
+        self.program = self.visit(program)
+        os.makedirs(outdir, exist_ok=True)
+        paths = []
+        try:
+            for i, b in enumerate(self.program.blocks):
+                self.root = b
+                path = os.path.join(outdir, "{}-{}.dot".format(
+                    i, b.name or b.type))
+                with open(path, "w", encoding="utf-8") as f:
+                    ParseTreeVisualizer(b, self, rankdir=self.RANKDIR).write(f)
+                paths.append(path)
+        finally:
+            self.root = None
+        return paths
+
+    def child_blocks(self, blocks, depth):
+        """Return the `blocks` at `depth` to draw, with a `Summary` node for
+        those of each type that are collapsed or too deep."""
+        if self.depth is None and not self.collapse:
+            return blocks
+        shown = []
+        summaries = {}
+        too_deep = self.depth is not None and depth > self.depth
+        for b in blocks:
+            if not too_deep and b.type not in self.collapse:
+                shown.append(b)
+                continue
+            if b.type not in summaries:
+                summaries[b.type] = Summary(b.type)
+            summaries[b.type].add(b)
+        return shown + list(summaries.values())
+
+    def shown(self, node):
+        """Return whether `node` is drawn with the level-of-detail options."""
+        if self.depth is None and not self.collapse and self.expressions \
+                and self.root is None:
+            return True
+        if type(node) == ast.Attr:
+            node = getattr(node, "parent", None)
+        elif type(node) != ast.Block:
+            return self.expressions or not isinstance(node, ast.AST)
+        if type(node) != ast.Block:
+            return True
+        if self.depth is not None and block_depth(node) > self.depth:
+            return False
+        while type(node) == ast.Block:
+            if node.type in self.collapse:
+                return False
+            top, node = node, getattr(node, "parent", None)
+        return self.root is None or top is self.root
+
     def visit(self, node):
         result = super().visit(node)
         if type(result) not in basic_dt and result != None:
@@ -256,15 +412,15 @@ class DotPlugin(E3lmPlugin):
         return result
 
     def dot_Program(self, node):
-        dot = deepcopy(self.NODES["Program"])
+        dot = dict(self.NODES["Program"])
         dot["label"] = "Program"
-        dot["children"] = node.blocks
+        dot["children"] = self.child_blocks(node.blocks, 1)
         return dot
 
     def dot_Block(self, node):
-        dot = deepcopy(self.NODES["Block"])
+        dot = dict(self.NODES["Block"])
         ch = [
-            *node.children,
+            *self.child_blocks(node.children, block_depth(node) + 1),
             *[b for a, b in node._attrs.items() if a != "body"],
         ]
         if "body" in node._attrs.keys():
@@ -274,9 +430,10 @@ class DotPlugin(E3lmPlugin):
         return dot
 
     def dot_Attr(self, node):
-        dot = deepcopy(self.NODES["Attr"])
+        dot = dict(self.NODES["Attr"])
         dot["label"] = node.name
-        dot["children"] = [node.value]
+        dot["children"] = [node.value] \
+            if self.expressions or node.name == "body" else []
         if hasattr(node, "eval"):
             if node.name != "body":
                 pass
@@ -293,25 +450,25 @@ class DotPlugin(E3lmPlugin):
         return dot
 
     def dot_BinOp(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.op
         dot["children"] = [node.left, node.right]
         return dot
 
     def dot_UnaryOp(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.op
         dot["children"] = [node.value]
         return dot
 
     def dot_Num(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         # Use value as is. str because label.
         dot["label"] = str(node.value)
         return dot
 
     def dot_Str(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         q = ""
         if node.type == "SINGLEQ1":
             q = "'"
@@ -329,39 +486,45 @@ class DotPlugin(E3lmPlugin):
         return dot
 
     def dot_Bool(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = "true" if node.value else "false"
         return dot
 
     def dot_Undefined(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = "none"
         return dot
 
     def dot_Array(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.__str__()
         dot["children"] = node.children
         return dot
 
     def dot_Index(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.__str__()
         return dot
 
     def dot_Dict(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.__str__()
         dot["children"] = node.children
         return dot
 
     def dot_DictCouple(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = str(node.left) + " -> " + str(node.right)
         return dot
 
+    def dot_Summary(self, node):
+        dot = dict(self.NODES["Summary"])
+        dot["label"] = "{} x{}\\n{} blocks, {} attrs".format(
+            node.type, node.count, node.blocks, node.attrs)
+        return dot
+
     def dot_Func(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         if node.children:
             chtitle = "." + str(len(node.children)) + "."
             children = node.children
@@ -377,7 +540,7 @@ class DotPlugin(E3lmPlugin):
         return dot
 
     def dot_Identifier(self, node):
-        dot = deepcopy(self.NODES["Expr"])
+        dot = dict(self.NODES["Expr"])
         dot["label"] = node.__str__()
         dot["children"] = node.children
         dot["extra"] = self.link_dot_eval(
@@ -398,13 +561,14 @@ class DotPlugin(E3lmPlugin):
                 #     else:
                 #         do_node = True
                 # else:
-                if node.eval != node:
+                # Nodes that are not drawn are shown as values.
+                if node.eval == node:
+                    do_node = False
+                elif self.shown(node.eval):
                     dottu = node.eval.dot["id"]
                     _dot = "node{num} -> node"\
                         + str(dottu) + "\n"
                     do_node = False
-                else:
-                    do_node = False
         if do_node:
             string = str(node.eval)
             string = string.replace("{", "{{")
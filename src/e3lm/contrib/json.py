@@ -4,17 +4,22 @@ Author: Kenan Masri
 `JsonPlugin` is an E3lm interpreter plugin used to provide a `json` attribute
 to the main program, containing a json string.
 The plugin can have options such as `ast` to determine whether to generate
-an AST or a tree with evaluated attributes.
+an AST or a tree with evaluated attributes, and `stream` to write the JSON to
+a file-like object block by block instead (see `JsonPlugin.dump`).
 """
 import json
 from e3lm.helpers.printers import cprint
 from e3lm.lang.interpreters import E3lmInterpreter
+from e3lm.lang.data import basic_dt
 from e3lm.lang import ast
+from e3lm.contrib.units import Quantity
 
 
 class JsonPlugin(E3lmInterpreter):
     """An E3lm interpreter plugin used to provide a `json` attribute to the
     main program, containing a json string."""
+    # Values of attributes evaluated with units are quantities.
+    value_types = basic_dt + (Quantity,)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -22,10 +27,64 @@ class JsonPlugin(E3lmInterpreter):
 
     def interpret(self, input, source=None):
         self.program = input
+        if "stream" in self.options.keys():
+            self.dump(self.program, self.options["stream"],
+                      indent=self.options.get("indent", 4),
+                      ndjson=self.options.get("ndjson", False))
+            # The JSON is not kept in streaming mode.
+            self.program.json = None
+            return self.program
         program_json = self.visit(self.program)
         self.program.json = program_json
         return self.program
 
+    def dump(self, program, fp, indent=4, ndjson=False):
+        """Write the JSON of `program` to the file-like `fp`, one top-level
+        block at a time, so that only one block is held in memory.
+
+        The output is the same as `json.dumps(program.json, indent=indent)`.
+
+        Args:
+            `program`: Interpreted program.
+            `fp`: File-like object with a `write` method.
+            `indent`: Indent of the JSON, `None` for compact output.
+            `ndjson`: Whether to write only the blocks, one compact JSON per
+                line.
+        """
+        self.program = program
+        if ndjson:
+            for b in program.blocks:
+                fp.write(json.dumps(self.visit(b), separators=(",", ":")))
+                fp.write("\n")
+            return
+
+        if indent is None:
+            def dumps(obj, level):
+                return json.dumps(obj, separators=(",", ":"))
+            nl = sep = ""
+            colon = ":"
+        else:
+            pad = " " * indent if isinstance(indent, int) else indent
+
+            def dumps(obj, level):
+                return json.dumps(obj, indent=indent) \
+                    .replace("\n", "\n" + pad * level)
+            nl = "\n"
+            sep = pad
+            colon = ": "
+
+        head = self.vgeneric_start(program)
+        head["imports"] = program.imports
+        fp.write("{")
+        for k, v in head.items():
+            fp.write(nl + sep + json.dumps(k) + colon + dumps(v, 1) + ",")
+        fp.write(nl + sep + json.dumps("blocks") + colon + "[")
+        for i, b in enumerate(program.blocks):
+            fp.write(("," if i else "") + nl + sep * 2 + dumps(self.visit(b), 2))
+        if program.blocks:
+            fp.write(nl + sep)
+        fp.write("]" + nl + "}")
+
     def v_Program(self, obj, *args, **kwargs):
         s = self.vgeneric_start(obj)
         s = {**s,
@@ -172,5 +231,11 @@ class JsonPlugin(E3lmInterpreter):
     def v_bool(self, obj, *args, **kwargs):
         return obj
 
+    def v_Quantity(self, obj, *args, **kwargs):
+        s = self.vgeneric_start(obj)
+        s["value"] = self.visit(obj.value)
+        s["unit"] = obj.unit.id
+        return s
+
     v_tuple = vgeneric_string
     v_complex = vgeneric_string
@@ -6,49 +6,294 @@ Author: Kenan Masri
 ending.
 
 Eventually matching Attrs will have a `Unit` attached thereto.
+Units are shared, immutable and converted through a `UnitRegistry`, which
+holds the factors between all of them. Custom units are added with
+`register`.
+
+Interpreters created with `units` evaluate such attributes to a `Quantity`
+instead, which expressions add, subtract and scale in their units.
 """
-import sys
-from copy import deepcopy
+from numbers import Number
+from types import MappingProxyType
+from collections import deque
 from e3lm.helpers.printers import cprint
 from e3lm.lang.interpreters import E3lmPlugin
 from e3lm.lang import ast
 
 
 class Unit():
-    """Base unit."""
-
-    def __init__(self, id="unit", name="units", **kwargs):
-        self.id = id
-        self.name = name
-        self.converts_to = {}
-        if "converts_to" in kwargs.keys():
-            self.converts_to = kwargs["converts_to"]
-        if type(self.converts_to) in (set, list, tuple):
-            sett = self.converts_to
-            self.converts_to = {}
+    """Base unit. Units are immutable and shared by the attributes.
+
+    `converts_to` is a dict of the factors to other units by id, or a
+    `(factor, unit)` tuple to derive them from the factors of `unit`.
+    """
+    __slots__ = ("id", "name", "converts_to")
+
+    def __init__(self, id="unit", name="units", converts_to=None):
+        converts_to = converts_to or {}
+        if type(converts_to) in (set, list, tuple):
+            sett = converts_to
+            converts_to = {}
 
             for s in sett[1].converts_to:
                 val = sett[1].converts_to[s]
-                self.converts_to[s] = sett[0]*val
+                converts_to[s] = sett[0]*val
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "converts_to",
+                           MappingProxyType(dict(converts_to)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'Unit' object is immutable.")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        args = (self.id, self.name, dict(self.converts_to))
+        # Units of the default registry are unpickled as the shared ones.
+        if registry._units.get(self.id) is self:
+            return (_registered_unit, args)
+        return (self.__class__, args)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def convert(self, target, amount):
-        if type(target) != Unit:
-            for ustr in [g for g in dir(sys.modules[__name__])
-                         if not g.startswith('_')]:
-                u = getattr(sys.modules[__name__], ustr)
-                if type(u) == Unit:
-                    if u.id == target:
-                        target = u
-        if type(target) == Unit:
-            return amount * self.converts_to[target.id]
-        else:
-            raise ValueError("Cannot convert from {} to {}".format(
-                self.id, target))
+        """Return `amount` of this unit in the `target` unit (or its id)."""
+        return registry.convert(amount, self, target)
+
+    def convert_many(self, target, amounts):
+        """Return the `amounts` of this unit in the `target` unit."""
+        return registry.convert_many(amounts, self, target)
 
     def __str__(self):
         return "Unit("+self.id+")"
 
 
+class UnitRegistry():
+    """Units by id and alias, with the conversion factors between all of
+    them.
+
+    The factors of the units to each other (`Unit.converts_to`) are used as
+    they are, the others are derived through them, e.g. km -> m -> in -> px.
+    They are computed again when a unit is registered.
+
+    Attributes:
+        `names`: Dict of the units by id and alias.
+        `factors`: Dict of the factors of each unit id to other unit ids.
+    """
+
+    def __init__(self, units=()):
+        self.names = {}
+        self.factors = {}
+        self._units = {}
+        for u in units:
+            self.register(u)
+
+    def register(self, unit, aliases=()):
+        """Register `unit` by its id and `aliases`, replacing the unit of
+        the same id. Returns the unit."""
+        self._units[unit.id] = unit
+        self.names[unit.id] = unit
+        for a in aliases:
+            self.names[a] = unit
+        self._compute()
+        return unit
+
+    def _compute(self):
+        edges = {i: [] for i in self._units}
+        for u in self._units.values():
+            edges[u.id].extend((t, f) for t, f in u.converts_to.items()
+                               if t in edges)
+        # Inverse factors come after the ones that are given.
+        for u in self._units.values():
+            for t, f in u.converts_to.items():
+                if t in edges and f:
+                    edges[t].append((u.id, 1 / f))
+
+        factors = {}
+        for source in self._units:
+            found = factors[source] = {source: 1.0}
+            queue = deque([source])
+            while queue:
+                a = queue.popleft()
+                for t, f in edges[a]:
+                    if t not in found:
+                        found[t] = found[a] * f
+                        queue.append(t)
+        self.factors = factors
+
+    def __getitem__(self, name):
+        return self.names[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def _id(self, unit):
+        if type(unit) == Unit:
+            return unit.id
+        return self.names[unit].id if unit in self.names else unit
+
+    def factor(self, source, target):
+        """Return the factor converting amounts of `source` to `target`,
+        units or their ids or aliases."""
+        factors = self.factors.get(self._id(source))
+        if factors is None and type(source) == Unit:
+            # Not registered.
+            factors = source.converts_to
+        try:
+            return factors[self._id(target)]
+        except (KeyError, TypeError):
+            raise ValueError("Cannot convert from {} to {}".format(
+                self._id(source), self._id(target)))
+
+    def convert(self, amount, source, target):
+        """Return `amount` of `source` in `target`."""
+        return amount * self.factor(source, target)
+
+    def convert_many(self, amounts, source, target):
+        """Return the `amounts` of `source` in `target`, looking up the
+        factor once.
+
+        Lists, tuples and other iterables give a list. Arrays that multiply
+        by a number (e.g. numpy arrays) are multiplied as a whole.
+        """
+        factor = self.factor(source, target)
+        if isinstance(amounts, (list, tuple)) \
+                or not hasattr(amounts, "__mul__"):
+            return [a * factor for a in amounts]
+        return amounts * factor
+
+
+class DimensionError(TypeError):
+    """Arithmetic on quantities of units that do not convert to each other,
+    or on a quantity and a plain number where both need a unit."""
+
+
+class Quantity():
+    """Amount `value` of `unit` (a unit or its id or alias in `units`,
+    the default registry if not given).
+
+    Quantities are added and subtracted in the unit of the left one, and
+    are multiplied and divided by plain numbers. Dividing two quantities
+    gives the plain ratio of their amounts. The others raise
+    `DimensionError`.
+    """
+    __slots__ = ("value", "unit", "registry")
+
+    def __init__(self, value, unit, units=None):
+        self.registry = registry if units is None else units
+        self.value = value
+        self.unit = unit if type(unit) == Unit else self.registry[unit]
+
+    def to(self, target):
+        """Return this quantity in the `target` unit (or its id or alias)."""
+        if type(target) != Unit:
+            target = self.registry[target]
+        if target is self.unit:
+            return self
+        try:
+            factor = self.registry.factor(self.unit, target)
+        except ValueError:
+            raise DimensionError("Cannot convert {} to {}".format(
+                self, target.id)) from None
+        return Quantity(self.value * factor, target, self.registry)
+
+    def _amount(self, other, op):
+        """Return the amount of the quantity `other` in this unit."""
+        if isinstance(other, Quantity):
+            if other.unit is self.unit:
+                return other.value
+            try:
+                return other.value * self.registry.factor(other.unit,
+                                                          self.unit)
+            except ValueError:
+                pass
+        raise DimensionError("Cannot {} {} and {}".format(op, self, other))
+
+    def __reduce__(self):
+        units = None if self.registry is registry else self.registry
+        return (self.__class__, (self.value, self.unit, units))
+
+    def _new(self, value):
+        return Quantity(value, self.unit, self.registry)
+
+    def __add__(self, other):
+        return self._new(self.value + self._amount(other, "add"))
+
+    def __sub__(self, other):
+        return self._new(self.value - self._amount(other, "subtract"))
+
+    def __radd__(self, other):
+        raise DimensionError("Cannot add {} and {}".format(other, self))
+
+    def __rsub__(self, other):
+        raise DimensionError("Cannot subtract {} and {}".format(other, self))
+
+    def __mul__(self, other):
+        if isinstance(other, Quantity):
+            raise DimensionError("Cannot multiply {} and {}".format(
+                self, other))
+        if isinstance(other, Number):
+            return self._new(self.value * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, Quantity):
+            return self.value / self._amount(other, "divide")
+        if isinstance(other, Number):
+            return self._new(self.value / other)
+        return NotImplemented
+
+    def __floordiv__(self, other):
+        if isinstance(other, Quantity):
+            return self.value // self._amount(other, "divide")
+        if isinstance(other, Number):
+            return self._new(self.value // other)
+        return NotImplemented
+
+    def __rtruediv__(self, other):
+        raise DimensionError("Cannot divide {} by {}".format(other, self))
+
+    __rfloordiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        raise DimensionError("Cannot raise {} to {}".format(self, other))
+
+    def __rpow__(self, other):
+        raise DimensionError("Cannot raise {} to {}".format(other, self))
+
+    def __neg__(self):
+        return self._new(-self.value)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return self._new(abs(self.value))
+
+    def __eq__(self, other):
+        if not isinstance(other, Quantity):
+            return NotImplemented
+        try:
+            return self.value == self._amount(other, "compare")
+        except DimensionError:
+            return False
+
+    __hash__ = None
+
+    def __str__(self):
+        return "{}{}".format(self.value, self.unit.id)
+
+    def __repr__(self):
+        return "Quantity({!r}, {!r})".format(self.value, self.unit.id)
+
+
 inch = Unit("in", "inches", converts_to={
     "px": 96,
     "pt": 72,
@@ -74,6 +319,25 @@ px = Unit("px", "pixels", converts_to=(1/96, inch))
 pt = Unit("pt", "points", converts_to=(1/72, inch))
 pc = Unit("pc", "picas", converts_to=(12, pt))
 
+# Registry of the units of `UnitsPlugin` and `Unit.convert`.
+registry = UnitRegistry([cm, mm, m, km, px, pt, pc])
+registry.register(inch, aliases=("inch",))
+
+
+def _registered_unit(id, name, converts_to):
+    """Return the unit `id` of the default registry, or a new unit if it is
+    not registered there (e.g. in another process)."""
+    unit = registry._units.get(id)
+    if unit is None:
+        unit = Unit(id, name, converts_to)
+    return unit
+
+
+def register(unit, aliases=()):
+    """Register a custom `unit` in the default registry, e.g.
+    `register(Unit("ft", "feet", converts_to={"in": 12}))`."""
+    return registry.register(unit, aliases)
+
 
 class UnitsPlugin(E3lmPlugin):
     """An E3lm interpreter plugin used to pick Attrs that end with "_unit",
@@ -82,16 +346,8 @@ class UnitsPlugin(E3lmPlugin):
 
     def __init__(self, *args, **kwargs):
         self.options = kwargs
-        self.units = {
-            "inch": inch,
-            "cm": cm,
-            "mm": mm,
-            "m": m,
-            "km": km,
-            "px": px,
-            "pt": pt,
-            "pc": pc,
-        }
+        self.registry = kwargs.get("registry", registry)
+        self.units = self.registry.names
 
     def interpret(self, input, source=None):
         return self.visit(input)
@@ -117,6 +373,14 @@ class UnitsPlugin(E3lmPlugin):
         return obj
 
     def v_Attr(self, obj, main_attr):
-        main_attr.unit = deepcopy(self.units[obj.eval])
-        main_attr.convert = lambda u: main_attr.unit.convert(u, main_attr.eval)
+        main_attr.unit = self.registry[obj.eval]
+        registry = self.registry
+
+        def convert(u):
+            # Attributes evaluated with units are quantities of their unit.
+            amount = main_attr.eval
+            if isinstance(amount, Quantity):
+                amount = amount.value
+            return registry.convert(amount, main_attr.unit, u)
+        main_attr.convert = convert
         return obj
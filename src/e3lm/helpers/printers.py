@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
-from asciitree import LeftAligned, Traversal, KeyArgsConstructor
+import io
+import sys
+from asciitree import Traversal, KeyArgsConstructor
 from asciitree.drawing import BoxStyle
 
 COLORS = {
@@ -62,6 +64,11 @@ class TraverseItem(KeyArgsConstructor):
     pass
 
 
+class TraverseMore(KeyArgsConstructor):
+    """Placeholder of the `nodes` that are not drawn."""
+    pass
+
+
 class TRAVERSE(Traversal):
     evaluate = False
     program_name = ""
@@ -177,8 +184,19 @@ class TRAVERSE(Traversal):
     def get_text_of_TraverseArrow(self, arrow):
         return str(arrow.value)
 
-
-TREE = LeftAligned
+    def get_text_of_TraverseMore(self, more):
+        counts = {}
+        for node in more.nodes:
+            if type(node).__name__ == "Block":
+                kind = node.type + " block"
+            elif type(node) == TraverseItem:
+                kind = node.type.lower()
+            else:
+                kind = "node"
+            counts[kind] = counts.get(kind, 0) + 1
+        text = ", ".join("{:,} more {}{}".format(n, kind, "" if n == 1 else "s")
+                         for kind, n in counts.items())
+        return self.COLS["GRAY"] + "... " + text + self.COLS["R"]
 
 
 def TREEBOX_E3LM(colorname, charset=[]):
@@ -244,6 +262,66 @@ class BOXSTYLE(BoxStyle):
                 + line)
 
 
+class TreePrinter(KeyArgsConstructor):
+    """Draws a tree like `asciitree.LeftAligned`, but writes it line by line
+    to a stream, keeping only the children left to draw of each level.
+
+    Nodes deeper than `max_level` levels below the root and children after
+    the first `max_children` of a node are not drawn, a line counts them
+    instead, e.g. "... 4,812 more Page blocks". `None` draws all of them.
+    """
+    draw = BOXSTYLE()
+    traverse = TRAVERSE()
+    max_level = None
+    max_children = None
+
+    def _children(self, node, level):
+        children = self.traverse.get_children(node)
+        if not children:
+            return []
+        if self.max_level is not None and level >= self.max_level:
+            return [TraverseMore(nodes=children)]
+        if self.max_children is not None \
+                and len(children) > self.max_children:
+            return [*children[:self.max_children],
+                    TraverseMore(nodes=children[self.max_children:])]
+        return children
+
+    def write(self, tree, fp):
+        """Write the lines of `tree` to the file-like `fp`."""
+        draw, traverse = self.draw, self.traverse
+        root = traverse.get_root(tree)
+        fp.write(draw.node_label(traverse.get_text(root)) + "\n")
+        # (children, next child, prefix of their lines) of each level.
+        stack = [(self._children(root, 0), 0, "")]
+        while stack:
+            children, n, prefix = stack[-1]
+            if n == len(children):
+                stack.pop()
+                continue
+            stack[-1] = (children, n + 1, prefix)
+            child = children[n]
+            label = traverse.get_text(child)
+            if n == len(children) - 1:
+                fp.write(prefix + draw.last_child_head(label) + "\n")
+                tail = draw.last_child_tail("")
+            else:
+                fp.write(prefix + draw.child_head(label) + "\n")
+                tail = draw.child_tail("")
+            grandchildren = self._children(child, len(stack))
+            if grandchildren:
+                stack.append((grandchildren, 0, prefix + tail))
+
+    def __call__(self, tree):
+        """Return the drawn `tree`, without the last newline."""
+        fp = io.StringIO()
+        self.write(tree, fp)
+        return fp.getvalue()[:-1]
+
+
+TREE = TreePrinter
+
+
 TREE_NODES = TREE(draw=BOXSTYLE(color="INFO2", gfx=TREEBOX_E3LM, charset=[]))
 TREE_NODES_NC = TREE(draw=BOXSTYLE(color="NONE", gfx=TREEBOX_E3LM, charset=[]))
 TREE_NODES_NG = TREE(draw=BOXSTYLE(
@@ -272,8 +350,11 @@ def cprint(text, color="NONE"):  # pragma: no cover
         print(COLORS[color] + str(text) + COLORS["ENDC"])
 
 
-def nprint(node, max_level=6, treefunc=TREE_NODES, **kwargs):  # pragma: no cover
-    """Print nodes using `asciitree`"""
+def nprint(node, max_level=None, treefunc=TREE_NODES, max_children=None,
+           file=None, **kwargs):  # pragma: no cover
+    """Print nodes to `file` (stdout by default) as they are drawn, down to
+    `max_level` levels below `node` and `max_children` children per node.
+    See `TreePrinter`."""
 
     if "noglyph" in kwargs.keys():
         if kwargs["noglyph"] == True:
@@ -311,4 +392,9 @@ def nprint(node, max_level=6, treefunc=TREE_NODES, **kwargs):  # pragma: no cove
         pallete = COLORS
 
     treefunc.traverse = TRAVERSE(cols=pallete, charset=traverse_charset, **kwargs)
-    print("\n" + treefunc(node) + "\n")
+    treefunc.max_level = max_level
+    treefunc.max_children = max_children
+    file = file or sys.stdout
+    file.write("\n")
+    treefunc.write(node, file)
+    file.write("\n")
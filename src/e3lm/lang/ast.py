@@ -9,7 +9,20 @@ from e3lm.helpers.printers import cprint
 
 
 class AST:
-    """Base AST node."""
+    """Base AST node.
+
+    Nodes are slotted: every attribute that the parser, the interpreter and
+    the bundled plugins set on a node is declared in `__slots__` of its
+    class. Slots that were never set raise `AttributeError`, so `hasattr`
+    still tells whether e.g. a node was evaluated.
+
+    Attributes:
+        `children`: Children nodes.
+        `_id`: ID given by the visiting interpreter.
+        `eval`: Evaluation of the node.
+        `dot`, `dot_children`: Data of the `DotPlugin`.
+    """
+    __slots__ = ("children", "_id", "eval", "dot", "dot_children")
 
     def __init__(self, children=[]):
         self.children = children
@@ -33,8 +46,151 @@ class AST:
     __repr__ = __str__
 
 
+class BlockIndex(list):
+    """List of blocks indexed by identity, name and type.
+
+    Membership tests and `index` go through the identity index, so blocks
+    are compared by identity as they have no `__eq__`. The indexes are built
+    on the first lookup, and again after changes that move blocks.
+
+    Attributes:
+        `names`: Dict of the first block of each name.
+        `types`: Dict of the list of blocks of each type, in order.
+    """
+    __slots__ = ("_names", "_types", "_positions", "_type_positions")
+
+    def __init__(self, blocks=()):
+        super().__init__(blocks)
+        self._reindex()
+
+    def _reindex(self):
+        self._positions = None
+
+    def _indexed(self):
+        if self._positions is None:
+            self._names = {}
+            self._types = {}
+            self._positions = {}
+            self._type_positions = {}
+            for i, b in enumerate(self):
+                self._index(b, i)
+        return self
+
+    def _index(self, block, position):
+        if self._positions is None:
+            return
+        self._positions.setdefault(id(block), position)
+        self._names.setdefault(block.name, block)
+        blocks = self._types.setdefault(block.type, [])
+        self._type_positions.setdefault(id(block), len(blocks))
+        blocks.append(block)
+
+    @property
+    def names(self):
+        return self._indexed()._names
+
+    @property
+    def types(self):
+        return self._indexed()._types
+
+    def by_name(self, name, default=None):
+        """Return the first block named `name`."""
+        try:
+            return self.names.get(name, default)
+        except TypeError:  # Unhashable
+            return default
+
+    def by_type(self, klass):
+        """Return the list of blocks of type `klass`."""
+        try:
+            return self.types.get(klass, [])
+        except TypeError:  # Unhashable
+            return []
+
+    def position(self, block, klass=None):
+        """Return the index of `block` in the list, or in `by_type(klass)`
+        if `klass` is given. Returns `None` if it is not there."""
+        self._indexed()
+        if not klass:
+            return self._positions.get(id(block))
+        if getattr(block, "type", None) != klass:
+            return None
+        return self._type_positions.get(id(block))
+
+    def add(self, block):
+        """Append `block` unless it is already in the list.
+
+        Returns whether it was appended.
+        """
+        if id(block) in self._indexed()._positions:
+            return False
+        self.append(block)
+        return True
+
+    def append(self, block):
+        super().append(block)
+        self._index(block, len(self) - 1)
+
+    def extend(self, blocks):
+        start = len(self)
+        blocks = list(blocks)
+        super().extend(blocks)
+        for i, b in enumerate(blocks):
+            self._index(b, start + i)
+
+    def index(self, block, *args):
+        position = self._indexed()._positions.get(id(block))
+        if position is None or args:
+            return super().index(block, *args)
+        return position
+
+    def __contains__(self, block):
+        return id(block) in self._indexed()._positions
+
+    def __iadd__(self, blocks):
+        self.extend(blocks)
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+    def _reindexed(method):
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self._reindex()
+            return result
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    def __setitem__(self, key, value):
+        # Visitors set every child to the visited one, which is usually the
+        # same block and keeps the index.
+        if type(key) == int and -len(self) <= key < len(self) \
+                and list.__getitem__(self, key) is value:
+            return
+        super().__setitem__(key, value)
+        self._reindex()
+
+    # Other changes may move the first block of a name, index them again.
+    insert = _reindexed(list.insert)
+    remove = _reindexed(list.remove)
+    pop = _reindexed(list.pop)
+    clear = _reindexed(list.clear)
+    sort = _reindexed(list.sort)
+    reverse = _reindexed(list.reverse)
+    __delitem__ = _reindexed(list.__delitem__)
+    __imul__ = _reindexed(list.__imul__)
+    del _reindexed
+
+
 class Program(AST):
-    """A program that contains `blocks`."""
+    """A program that contains `blocks`.
+
+    The program keeps a `__dict__` for the attributes that plugins assign
+    to it, e.g. `json` or `dot_source`.
+    """
+    __slots__ = ("imports", "blocks", "_flat_blocks", "__dict__")
 
     def __init__(self, imports=[], blocks=[], **kwargs):
         self.imports = imports
@@ -44,6 +200,17 @@ class Program(AST):
         self.flat_blocks = kwargs['flat_blocks'] \
             if 'flat_blocks' in kwargs.keys() else []
 
+    @property
+    def flat_blocks(self):
+        """`BlockIndex` of all blocks of the program."""
+        return self._flat_blocks
+
+    @flat_blocks.setter
+    def flat_blocks(self, blocks):
+        if not isinstance(blocks, BlockIndex):
+            blocks = BlockIndex(blocks)
+        self._flat_blocks = blocks
+
     def build_flat(self):
         """Build the `flat_blocks` from `self.blocks`"""
         def append(b):
@@ -61,10 +228,7 @@ class Program(AST):
         return self
 
     def block_by_name(self, name):
-        for a in self.flat_blocks:
-            if a.name == name:
-                return a
-        return None
+        return self.flat_blocks.by_name(name)
 
     def __str__(self):
         return f"Program({self.id})" if hasattr(self, "id") else "Program()"
@@ -74,16 +238,28 @@ class Program(AST):
 
 class Block(AST):
     """Block that contains `children` blocks and `attrs`."""
+    __slots__ = ("type", "name", "_attrs", "attrs", "parent", "_children")
 
     def __init__(self, klass=None, children=[], attrs={}, name=""):
         self.type = klass
         self._attrs = attrs
         self.name = name
-        self.children = children if children != None else []
         if type(children) == BlockContent:
-            self.children = [a for a in children.children if type(a) == Block]
             self._attrs = {a.name: a
                            for a in children.children if type(a) == Attr}
+            children = [a for a in children.children if type(a) == Block]
+        self.children = children if children != None else []
+
+    @property
+    def children(self):
+        """`BlockIndex` of the children blocks, to look them up by name."""
+        return self._children
+
+    @children.setter
+    def children(self, blocks):
+        if not isinstance(blocks, BlockIndex):
+            blocks = BlockIndex(blocks)
+        self._children = blocks
 
     def __str__(self):
         idpart = f"#{self.id}" if hasattr(self, "id") else ""
@@ -98,11 +274,12 @@ class Block(AST):
 
 class Lazy(AST):
     """Lazy placeholder."""
-    pass
+    __slots__ = ()
 
 
 class BlockContent(AST):
     """BlockContent Placeholder for parsing."""
+    __slots__ = ()
 
     def __init__(self, children):
         self.children = children
@@ -110,6 +287,8 @@ class BlockContent(AST):
 
 class Attr(AST):
     """Attribute for `Block` object."""
+    __slots__ = ("name", "value", "tokens", "parent", "_eval",
+                 "_body_template", "unit", "convert")
 
     def __init__(self, name, value, **kwargs):
         self.name = name
@@ -125,6 +304,8 @@ class Attr(AST):
 
 
 class BinOp(AST):
+    __slots__ = ("token", "op", "left", "right")
+
     def __init__(self, op, left=None, right=None):
         self.token = self.op = op
         self.left = left
@@ -137,6 +318,8 @@ class BinOp(AST):
 
 
 class UnaryOp(AST):
+    __slots__ = ("token", "op", "value")
+
     def __init__(self, op, value):
         self.token = self.op = op
         self.value = value
@@ -154,6 +337,7 @@ class Num(AST):
     Available types:     NUM_INT     NUM_FLOAT     NUM_HEX     NUM_OCT
     NUM_IMAG
     """
+    __slots__ = ("value", "type")
 
     def __init__(self, value, type="NUM_INT"):
         self.value = value
@@ -170,6 +354,7 @@ class Str(AST):
 
     Available types:     SINGLEQ1     SINGLEQ2     TRIPLEQ1     TRIPLEQ2
     """
+    __slots__ = ("value", "type")
 
     def __init__(self, value):
         self.value = value
@@ -182,6 +367,8 @@ class Str(AST):
 
 
 class Bool(AST):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = True if value.lower() == "true" else False
 
@@ -192,6 +379,8 @@ class Bool(AST):
 
 
 class Undefined(AST):
+    __slots__ = ("value",)
+
     def __init__(self, value=None):
         self.value = value
 
@@ -200,6 +389,8 @@ class Undefined(AST):
 
 
 class Array(AST):
+    __slots__ = ()
+
     def __str__(self):
         return f"[.{len(self.children)}.]"
 
@@ -208,6 +399,7 @@ class Array(AST):
 
 class Index(AST):
     """Index of an array or dict."""
+    __slots__ = ("value",)
 
     def __init__(self, value=None):
         self.value = value
@@ -220,6 +412,7 @@ class Index(AST):
 
 class DictData(AST):
     """Dictionary data placeholder for parsing."""
+    __slots__ = ()
 
     def __init__(self, children=[]):
         self.children = children
@@ -232,6 +425,7 @@ class DictData(AST):
 
 class Dict(AST):
     """Dict object containing `DictCouple` children."""
+    __slots__ = ()
 
     def __init__(self, dictdata):
         self.children = dictdata.children
@@ -244,6 +438,7 @@ class Dict(AST):
 
 class DictCouple(AST):
     """A dict couple in the form: `left: right`."""
+    __slots__ = ("left", "right")
 
     def __init__(self, left, right):
         self.left = left
@@ -257,6 +452,7 @@ class DictCouple(AST):
 
 class Func(AST):
     """Function with `value` as its name, `children` as arguments."""
+    __slots__ = ("value", "call")
 
     def __init__(self, func, *args, **kwargs):
         self.value = func
@@ -281,6 +477,7 @@ class Func(AST):
 
 class FuncArgs(AST):
     """Function arguments placeholder for parsing."""
+    __slots__ = ()
 
     def __len__(self):
         return len(self.children)
@@ -294,8 +491,9 @@ class FuncArgs(AST):
 class Identifier(AST):
     """An expression with multiple AST nodes.
 
-    `children` are in ltr order.
+    `children` are in ltr order. `target` is the `Attr` it refers to.
     """
+    __slots__ = ("target",)
 
     def __init__(self, children=[]):
         self.children = []
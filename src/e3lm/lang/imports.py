@@ -0,0 +1,190 @@
+"""
+Author: Kenan Masri
+
+Tools for the `import` statements of the E3lmParser.
+This module provides a `SourceMap` that maps the lines of a text expanded
+with its imports back to the files they come from, and an `ImportCache` of
+the files read by the imports.
+"""
+
+import io
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+
+class SourceMap():
+    """Map lines of an expanded text to their source file and line.
+
+    The map is an interval index: each interval starts at an expanded line
+    and follows a single source from a given line onwards. Lines are
+    counted from 1 on both sides.
+
+    Attributes:
+        `starts`: First expanded line of each interval (sorted).
+        `sources`: Source of each interval.
+        `lines`: Source line of each interval start.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.sources = []
+        self.lines = []
+
+    def add(self, start, source, line):
+        """Start an interval at expanded line `start` that follows `source`
+        from its line `line`."""
+        if self.starts and self.starts[-1] == start:
+            # The previous interval is empty, replace it.
+            self.sources[-1] = source
+            self.lines[-1] = line
+            return
+        self.starts.append(start)
+        self.sources.append(source)
+        self.lines.append(line)
+
+    def locate(self, lineno):
+        """Return `(source, line)` of the expanded line `lineno`."""
+        i = bisect_right(self.starts, lineno) - 1
+        if i < 0:
+            return (None, lineno)
+        return (self.sources[i], self.lines[i] + lineno - self.starts[i])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __str__(self):
+        return f"SourceMap({len(self)})"
+
+    __repr__ = __str__
+
+
+class Fragment():
+    """A file read by an `import` statement.
+
+    Attributes:
+        `path`: Absolute path of the file.
+        `lines`: Tuple of the file lines, ends of lines included.
+        `imports`: Dict of the regex matches of the lines that are import
+            statements themselves, by line index.
+        `mtime`: Modification time of the file in nanoseconds.
+        `size`: Size of the file in bytes.
+        `digest`: SHA-1 hex digest of the file content.
+    """
+    __slots__ = ("path", "lines", "imports", "mtime", "size", "digest")
+
+    def __init__(self, path, lines, imports, mtime, size, digest):
+        self.path = path
+        self.lines = lines
+        self.imports = imports
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+
+    def __str__(self):
+        return f"Fragment({self.path!r}, {len(self.lines)} lines)"
+
+    __repr__ = __str__
+
+
+class ImportCache():
+    """Least recently used cache of the files read by `import` statements.
+
+    Entries are keyed by absolute path. A stored fragment is reused while
+    the file keeps its modification time and size. Otherwise the file is
+    read again, and the fragment is still reused when its content hash did
+    not change. The cache can be shared by parsers of several threads.
+
+    Attributes:
+        `maxsize`: Number of fragments kept, `None` for no bound.
+        `hits`: Number of lookups served without reading the file.
+        `misses`: Number of lookups that had to read the file.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, path, regex):
+        """Return the `Fragment` of the file at `path`.
+
+        Args:
+            `path`: Path of the file.
+            `regex`: Compiled regex matching import statements.
+        """
+        with self._lock:
+            return self._get(os.path.abspath(path), regex)
+
+    def _get(self, path, regex):
+        st = os.stat(path)
+        fragment = self._fragments.get(path)
+        if fragment is not None and fragment.mtime == st.st_mtime_ns \
+                and fragment.size == st.st_size:
+            self.hits += 1
+            self._fragments.move_to_end(path)
+            return fragment
+
+        import hashlib  # Only needed by files with imports.
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        if fragment is not None and fragment.digest == digest:
+            self.hits += 1
+            fragment.mtime = st.st_mtime_ns
+            fragment.size = st.st_size
+            self._fragments.move_to_end(path)
+            return fragment
+
+        self.misses += 1
+        # Same lines as reading the file in text mode.
+        lines = tuple(io.StringIO(content.decode("utf-8"),
+                                  newline=None).readlines())
+        imports = {}
+        for i, line in enumerate(lines):
+            match = regex.match(line)
+            if match:
+                imports[i] = match
+        fragment = Fragment(path, lines, imports, st.st_mtime_ns,
+                            st.st_size, digest)
+        self._fragments[path] = fragment
+        self._fragments.move_to_end(path)
+        if self.maxsize is not None:
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def invalidate(self, path):
+        """Drop the fragment of the file at `path`, if any.
+
+        Returns whether a fragment was dropped.
+        """
+        with self._lock:
+            return self._fragments.pop(os.path.abspath(path),
+                                       None) is not None
+
+    def clear(self):
+        """Drop all fragments and reset the counters."""
+        with self._lock:
+            self._fragments.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._fragments
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def __str__(self):
+        return (f"ImportCache({len(self)}/{self.maxsize}, "
+                f"hits={self.hits}, misses={self.misses})")
+
+    __repr__ = __str__
+
+
+# Cache shared by the parsers that are not given their own.
+import_cache = ImportCache()
@@ -0,0 +1,471 @@
+"""
+Author: Kenan Masri
+
+Incremental parsing and interpretation of an edited 3lm text.
+A `Document` keeps the text, its interpreted `Program` and the lines of
+every top-level block. `Document.edit` applies a `TextEdit` and parses
+again only the top-level blocks the edit touches, plus the ones holding
+attributes that depend on them, then interprets these blocks alone. The
+rest of the program is kept as is.
+
+Top-level blocks start with a class line at column 0 and go on up to the
+next one. When the text cannot be split that way (e.g. a triple quoted
+string with a line at column 0) or an edit touches an import line, the
+whole text is parsed and interpreted again, as it is when the edit makes
+the text invalid so that the errors are the ones of a full parse.
+
+Example:
+    doc = Document(text)
+    doc.edit(TextEdit((3, 10), (3, 11), "5"))
+    doc.program.block_by_name("dummy_1").attrs
+"""
+
+import re
+from e3lm.lang import ast
+from e3lm.lang.data import regexes
+from e3lm.lang.interpreters import E3lmInterpreter
+from e3lm.utils import profiling
+from e3lm.utils.lang import parser_pool
+
+# First line of a top-level block, which is not the end of one.
+BLOCK_START = re.compile(r"[_A-Z][_A-Za-z0-9]*")
+BLOCK_END = re.compile(r"[eE][nN][dD]")
+IMPORT = re.compile(regexes["IMPORT"])
+# Lines that may come before the first block: empty lines and comments.
+# Others are left to a full parse, which raises their errors.
+FREE_LINE = re.compile(r"(;.*)?\r?\n?")
+
+# Functions returning blocks by their position.
+POSITIONAL = ("prev", "next")
+
+
+class TextEdit():
+    """Replacement of the text between `start` and `end` by `text`.
+
+    Positions are `(line, column)` tuples counted from 0, as in the Language
+    Server Protocol. Columns past the end of a line stop at its line break.
+    """
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start, end, text=""):
+        self.start = tuple(start)
+        self.end = tuple(end)
+        self.text = text
+
+    def __str__(self):
+        return f"TextEdit({self.start}, {self.end}, {self.text!r})"
+
+    __repr__ = __str__
+
+
+class Chunk():
+    """Lines of a top-level block (`kind` "block"), of consecutive import
+    lines ("import") or of the text before the first block ("text"), with
+    the top-level `blocks` parsed from them."""
+    __slots__ = ("kind", "start", "size", "blocks")
+
+    def __init__(self, kind, start, size=1, blocks=()):
+        self.kind = kind
+        self.start = start
+        self.size = size
+        self.blocks = list(blocks)
+
+    @property
+    def end(self):
+        return self.start + self.size
+
+    def __str__(self):
+        return f"Chunk({self.kind}, {self.start}:{self.end})"
+
+    __repr__ = __str__
+
+
+def line_kind(line):
+    """Return "block", "import" or `None` for the chunk started by `line`."""
+    if IMPORT.match(line):
+        return "import"
+    if BLOCK_START.match(line) and not BLOCK_END.match(line):
+        return "block"
+    return None
+
+
+def split(lines, start=0):
+    """Return the list of `Chunk` of `lines`, the first one being line
+    `start` of the text. Returns `None` if an import line is not at the
+    start of a line, where it could not be told apart from the block it
+    is in."""
+    chunks = []
+    for i, line in enumerate(lines):
+        kind = line_kind(line)
+        if kind == "import" and line[:1] in (" ", "\t"):
+            return None
+        if kind is None or (kind == "import" and chunks
+                            and chunks[-1].kind == "import"
+                            and chunks[-1].end == start + i):
+            if not chunks:
+                chunks.append(Chunk("text", start, 0))
+            chunks[-1].size += 1
+        else:
+            chunks.append(Chunk(kind, start + i))
+    return chunks
+
+
+def walk_blocks(blocks):
+    """Yield `blocks` and their children blocks, in pre-order."""
+    stack = list(reversed(blocks))
+    while stack:
+        b = stack.pop()
+        yield b
+        stack.extend(reversed(b.children))
+
+
+def mentions(node, names):
+    """Add the names that the expression `node` looks up to the set `names`,
+    and return whether it uses a positional function (`prev`, `next`)."""
+    positional = False
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) == str:
+            names.add(node)
+        elif type(node) == ast.Func:
+            if node.value in POSITIONAL:
+                positional = True
+            stack.extend(node.children)
+        elif type(node) == ast.Identifier:
+            stack.extend(node.children)
+        elif type(node) in (ast.BinOp, ast.DictCouple):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif type(node) in (ast.UnaryOp, ast.Index):
+            stack.append(node.value)
+        elif type(node) in (ast.Array, ast.Dict):
+            stack.extend(node.children)
+    return positional
+
+
+class Document():
+    """A 3lm text and its interpreted `Program`, updated by edits.
+
+    Attributes:
+        `lines`: Lines of the text, with their line breaks.
+        `source`: Path of the file of the text, for its imports.
+        `program`: The interpreted `Program`, `None` if it could not be
+            parsed.
+        `errors`: Errors of the last parse, see `E3lmParser.errors`.
+        `chunks`: List of the `Chunk` of the text.
+        `incremental`: Whether edits can be applied to single chunks.
+        `full`: Whether the last update parsed the whole text.
+        `reparsed`: Number of top-level blocks parsed by the last update.
+    """
+
+    def __init__(self, text, source=None, parser=None,
+                 interpreter_cls=E3lmInterpreter):
+        self.lines = text.splitlines(True)
+        self.source = source
+        self.parser = parser
+        self.interpreter = interpreter_cls()
+        self.reparse()
+
+    @property
+    def text(self):
+        return "".join(self.lines)
+
+    def parse(self, text):
+        """Return `(tree, errors)` of parsing `text`."""
+        if self.parser is not None:
+            tree = self.parser.parse(text, self.source)
+            return tree, list(self.parser.errors)
+        with parser_pool.parser() as p:
+            tree = p.parse(text, self.source)
+            return tree, list(p.errors)
+
+    @profiling.profiled("document.reparse")
+    def reparse(self):
+        """Parse and interpret the whole text. Returns the program."""
+        self.program = None
+        self.chunks = []
+        self.incremental = False
+        self.full = True
+        self._chunk_of = {}
+        self._names = {}
+        self._mentions = {}
+        self._positional = set()
+        self._dependents = {}
+
+        tree, self.errors = self.parse(self.text)
+        self.reparsed = len(tree.blocks) if tree is not None else 0
+        if tree is None:
+            return None
+        chunks = split(self.lines) if not self.errors else None
+        if chunks is not None:
+            counts = []
+            for c in chunks:
+                if c.kind == "import":
+                    # Blocks of the imported files.
+                    imported, errors = self.parse(
+                        "".join(self.lines[c.start:c.end]))
+                    counts.append(len(imported.blocks)
+                                  if imported is not None else -1)
+                else:
+                    counts.append(int(c.kind == "block"))
+            if sum(counts) == len(tree.blocks) and -1 not in counts:
+                i = 0
+                for c, n in zip(chunks, counts):
+                    c.blocks = tree.blocks[i:i + n]
+                    i += n
+                    self._index(c)
+            else:
+                chunks = None
+
+        program = self.interpreter.interpret(tree)
+        if chunks is not None:
+            self.chunks = chunks
+            self.incremental = True
+            self._index_dependents(self._chunk_of)
+        self.program = program
+        return program
+
+    def _index(self, chunk):
+        """Index the names that the attributes of `chunk` look up. Done
+        before interpreting them, which replaces some of their nodes."""
+        for b in walk_blocks(chunk.blocks):
+            for a in b._attrs.values():
+                self._chunk_of[a] = chunk
+                if a.name == "body":
+                    continue
+                names = set()
+                if mentions(a.value, names):
+                    self._positional.add(a)
+                self._names[a] = names
+                for name in names:
+                    self._mentions.setdefault(name, set()).add(a)
+
+    def _index_dependents(self, attrs):
+        """Index the attributes that `attrs` depend on, once interpreted."""
+        deps = self.interpreter.attr_deps
+        for a in attrs:
+            for dep in deps.get(a, ()):
+                self._dependents.setdefault(dep, set()).add(a)
+
+    def _forget(self, chunk):
+        """Drop the attributes of `chunk` from the indexes."""
+        deps = self.interpreter.attr_deps
+        for b in walk_blocks(chunk.blocks):
+            for a in b._attrs.values():
+                self._chunk_of.pop(a, None)
+                self._positional.discard(a)
+                for name in self._names.pop(a, ()):
+                    attrs = self._mentions.get(name)
+                    if attrs is not None:
+                        attrs.discard(a)
+                        if not attrs:
+                            del self._mentions[name]
+                for dep in deps.get(a, ()):
+                    dependents = self._dependents.get(dep)
+                    if dependents is not None:
+                        dependents.discard(a)
+                self._dependents.pop(a, None)
+
+    def find(self, line):
+        """Return the index of the chunk of `line`."""
+        lo, hi = 0, len(self.chunks) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.chunks[mid].start <= line:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def apply(self, edit):
+        """Apply `edit` to `lines`. Returns `(first, last, delta)`: the first
+        and last lines that changed (before the edit, `last` is `first - 1`
+        when lines were only inserted before `first`) and the difference in
+        the number of lines."""
+        lines = self.lines
+
+        def position(line, col):
+            if line >= len(lines):
+                if lines and not lines[-1].endswith(("\n", "\r")):
+                    return len(lines) - 1, len(lines[-1])
+                return len(lines), 0
+            return line, min(col, len(lines[line].rstrip("\r\n")))
+
+        (sl, sc), (el, ec) = sorted((edit.start, edit.end))
+        sl, sc = position(max(sl, 0), max(sc, 0))
+        el, ec = position(max(el, 0), max(ec, 0))
+        prefix = lines[sl][:sc] if sl < len(lines) else ""
+        suffix = lines[el][ec:] if el < len(lines) else ""
+        old = lines[sl:el + 1]
+        new = (prefix + edit.text + suffix).splitlines(True)
+        self.lines = lines[:sl] + new + lines[el + 1:]
+
+        # Lines kept as they were at both ends of the edit.
+        i = 0
+        while i < len(old) and i < len(new) and old[i] == new[i]:
+            i += 1
+        j = 0
+        while j < len(old) - i and j < len(new) - i \
+                and old[-1 - j] == new[-1 - j]:
+            j += 1
+        return sl + i, sl + len(old) - 1 - j, len(new) - len(old)
+
+    @profiling.profiled("document.edit")
+    def edit(self, *edits):
+        """Apply the `TextEdit`s in order and update the program. Returns
+        the program."""
+        for edit in edits:
+            if not self.incremental or not self.chunks:
+                self.apply(edit)
+                continue
+            first, last, delta = self.apply(edit)
+            try:
+                if self._update(first, last, delta):
+                    continue
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException:
+                # Including InterpreterError, which is not an Exception. The
+                # full parse reports it.
+                pass
+            self.incremental = False
+        if not self.incremental:
+            return self.reparse()
+        return self.program
+
+    def _update(self, first, last, delta):
+        """Parse and interpret again the chunks of the old lines `first` to
+        `last`, now shifted by `delta` lines. Returns `False` if the text must
+        be parsed again in full."""
+        chunks = self.chunks
+        if last >= first:
+            ci, cj = self.find(first), self.find(last)
+        elif delta == 0:
+            self.full = False
+            self.reparsed = 0
+            return True
+        elif first >= chunks[-1].end:
+            ci, cj = len(chunks), len(chunks) - 1
+        else:
+            ci = self.find(first)
+            # Lines inserted before a chunk, or within one.
+            cj = ci - 1 if chunks[ci].start == first else ci
+        while True:
+            start = chunks[ci].start if ci < len(chunks) else first
+            end = (chunks[cj].end if cj >= ci else start) + delta
+            new = split(self.lines[start:end], start)
+            if new is None:
+                return False
+            if ci > 0 and new and new[0].kind == "text":
+                # The block of the first line is gone, its lines are now part
+                # of the previous chunk.
+                ci -= 1
+                continue
+            break
+        if any(c.kind == "import" for c in chunks[ci:cj + 1] + new):
+            return False
+        if any(c.kind == "text" and not all(
+                FREE_LINE.fullmatch(line) for line in self.lines[c.start:c.end])
+               for c in new):
+            return False
+        for c in chunks[cj + 1:]:
+            c.start += delta
+
+        # Parse the edited chunks.
+        blocks = self.parse_chunks(new)
+        if blocks is None:
+            return False
+        replaced = chunks[ci:cj + 1]
+
+        # Chunks holding attributes that depend on the replaced ones, or
+        # that look up names of the replaced blocks.
+        names = set()
+        for c in replaced + new:
+            for b in walk_blocks(c.blocks):
+                names.add(b.name)
+                names.add(b.type)
+        affected = {id(c) for c in replaced}
+        again = []
+        for a in self._positional:
+            c = self._chunk_of[a]
+            if c.kind == "import":
+                return False
+            if id(c) not in affected:
+                affected.add(id(c))
+                again.append(c)
+        frontier = list(replaced) + list(again)
+        seen = set()
+        while frontier or names - seen:
+            for name in names - seen:
+                seen.add(name)
+                for a in self._mentions.get(name, ()):
+                    c = self._chunk_of[a]
+                    if c.kind == "import":
+                        return False
+                    if id(c) not in affected:
+                        affected.add(id(c))
+                        again.append(c)
+                        frontier.append(c)
+            while frontier:
+                c = frontier.pop()
+                for b in walk_blocks(c.blocks):
+                    names.add(b.name)
+                    names.add(b.type)
+                    for a in b._attrs.values():
+                        for d in self._dependents.get(a, ()):
+                            dc = self._chunk_of[d]
+                            if dc.kind == "import":
+                                return False
+                            if id(dc) not in affected:
+                                affected.add(id(dc))
+                                again.append(dc)
+                                frontier.append(dc)
+        again.sort(key=lambda c: c.start)
+        again_new = [Chunk(c.kind, c.start, c.size) for c in again]
+        if again_new and self.parse_chunks(again_new) is None:
+            return False
+
+        # Splice the chunks.
+        removed = []
+        for c in replaced + again:
+            removed.extend(c.blocks)
+            self._forget(c)
+        for c, n in zip(again, again_new):
+            c.blocks = n.blocks
+        chunks[ci:cj + 1] = new
+        for c in new + again:
+            self._index(c)
+        self.program.blocks = [b for c in chunks for b in c.blocks]
+        refreshed = {id(c) for c in new + again}
+        added = [b for c in chunks if id(c) in refreshed for b in c.blocks]
+        self.interpreter.update(self.program, removed, added)
+        self._index_dependents([a for c in new + again
+                                for b in walk_blocks(c.blocks)
+                                for a in b._attrs.values()])
+        self.full = False
+        self.reparsed = len(added)
+        return True
+
+    def parse_chunks(self, chunks):
+        """Parse the lines of the block `chunks` at once and give each its
+        block. Returns the blocks, or `None` if they do not parse as one block
+        each."""
+        blocks = [c for c in chunks if c.kind == "block"]
+        if not blocks:
+            return []
+        text = "".join(line for c in blocks
+                       for line in self.lines[c.start:c.end])
+        if not text.endswith("\n"):
+            text += "\n"
+        tree, errors = self.parse(text)
+        if tree is None or errors or len(tree.blocks) != len(blocks):
+            return None
+        for c, b in zip(blocks, tree.blocks):
+            c.blocks = [b]
+        return tree.blocks
+
+    def __str__(self):
+        return f"Document({self.source!r}, {len(self.lines)} lines)"
+
+    __repr__ = __str__
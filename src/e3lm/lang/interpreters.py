@@ -2,20 +2,92 @@
 Author: Kenan Masri
 
 """
-import sys
 import functools
-from jinja2 import Template
 from e3lm.lang import ast
 from e3lm.lang.data import basic_dt
 from e3lm.helpers.printers import cprint
-
-stuck_counter = 0
+from e3lm.utils import profiling
 
 
 class InterpreterError(BaseException):
     pass
 
 
+class CircularReferenceError(InterpreterError):
+    """Attributes that depend on each other.
+
+    `cycle` is the list of `Attr` objects in the cycle, starting and ending
+    with the same attribute.
+    """
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        super().__init__("Circular reference: " + " -> ".join(
+            attr_path(a) for a in cycle))
+
+
+class PendingAttr(Exception):
+    """Raised while evaluating an attribute that needs `attr`, which is not
+    evaluated yet. Used by `E3lmInterpreter.resolve`."""
+
+    def __init__(self, attr):
+        super().__init__(attr)
+        self.attr = attr
+
+
+def attr_path(attr):
+    """Return a readable `block.attr` path of `attr`."""
+    block = getattr(attr, "parent", None)
+    if block is None or type(block) != ast.Block:
+        return attr.name
+    return "{}.{}".format(block.name or block.type, attr.name)
+
+
+# Jinja markers of expressions, statements and comments.
+JINJA_MARKERS = ("{{", "{%", "{#")
+
+
+class PlainTemplate():
+    """Template of a body without Jinja markers, rendered as is."""
+    __slots__ = ("text",)
+
+    def __init__(self, source):
+        # Same as Jinja, which drops a single trailing newline.
+        self.text = source[:-1] if source.endswith("\n") else source
+
+    def render(self, *args, **kwargs):
+        return self.text
+
+
+@functools.lru_cache(maxsize=None)
+def get_jinja_env():
+    """Return the Jinja environment shared by the interpreters to render
+    bodies. Jinja is only imported when the first one is needed."""
+    from jinja2 import Environment
+    return Environment()
+
+
+def __getattr__(name):
+    if name == "jinja_env":
+        return get_jinja_env()
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
+
+
+@functools.lru_cache(maxsize=4096)
+def body_template(source):
+    """Return the template of a body `source`, compiled once per source by
+    `jinja_env`. Plain text sources skip Jinja."""
+    if isinstance(source, str) and "\r" not in source \
+            and not any(m in source for m in JINJA_MARKERS):
+        return PlainTemplate(source)
+    return get_jinja_env().from_string(source)
+
+
+# Default of lookups where `None` is a found value.
+MISSING = object()
+
+
 def get_attr(obj, attr):
     """Return `attr` of `obj` by searching its `children`, `attrs` and actual
     attributes in order."""
@@ -33,10 +105,9 @@ def get_attr(obj, attr):
         if type(search) == ast.Identifier:
             pass
         if type(search) == ast.Program:
-            flat_blocks = search.flat_blocks
-            for fb in flat_blocks:
-                if sattr == fb.name:
-                    return fb
+            fb = search.flat_blocks.by_name(sattr)
+            if fb is not None:
+                return fb
 
     if isinstance(sattr, ast.AST):
         if type(sattr) == ast.Block:
@@ -48,7 +119,11 @@ def get_attr(obj, attr):
         except (KeyError, ValueError):
             return search[int(sattr)]
 
-    if hasattr(search, "children"):
+    if isinstance(getattr(search, "children", None), ast.BlockIndex):
+        child = search.children.by_name(sattr, MISSING)
+        if child is not MISSING:
+            return child
+    elif hasattr(search, "children"):
         names = [n.name for n in search.children]
         if sattr in names:
             return search.children[names.index(sattr)]
@@ -69,6 +144,65 @@ def get_attr(obj, attr):
     ))
 
 
+class DotPath():
+    """Dotted `path` of `dot_get`, split once to be used on many objects.
+
+    Examples:
+        path = DotPath("blocks.0.dummy_2")
+        path.get(program_1), path.get(program_2, eval=True)
+    """
+    __slots__ = ("path", "segments")
+
+    def __init__(self, path):
+        self.path = path
+        # Segments with their list index, if they are one.
+        self.segments = tuple((a, self._int(a)) for a in path.split("."))
+
+    @staticmethod
+    def _int(attr):
+        try:
+            return int(attr)
+        except ValueError:
+            return None
+
+    def get(self, obj, *args, eval=False):
+        """Return the object at the path from `obj`, its evaluation if
+        `eval`. `args` is the default of missing actual attributes."""
+        for attr, index in self.segments:
+            attrs = getattr(obj, "attrs", None)
+            if attrs is not None and attr in attrs:
+                obj = attrs[attr] if eval else obj._attrs[attr]
+                continue
+            if type(obj) in (list, dict, tuple, set):
+                if index is not None:
+                    try:
+                        obj = obj[index]
+                        continue
+                    except (KeyError, ValueError):
+                        pass
+                try:
+                    obj = obj[attr]
+                except ValueError:
+                    raise AttributeError(f"{attr} was not found in {obj}")
+                continue
+            try:
+                obj = get_attr(obj, attr)
+            except AttributeError:
+                obj = getattr(obj, attr, *args)
+        return obj
+
+    __call__ = get
+
+    def __repr__(self):
+        return "DotPath({!r})".format(self.path)
+
+
+@functools.lru_cache(maxsize=1024)
+def dot_path(path):
+    """Return the `DotPath` of `path`, split once per path."""
+    return DotPath(path)
+
+
 def dot_get(obj, attr, *args, **kwargs):
     """Get `obj` nested `attr` in dotted syntax.
 
@@ -79,31 +213,7 @@ def dot_get(obj, attr, *args, **kwargs):
         dot_get(my_program, "dummy_1.attr2")
         dot_get(my_program, "blocks.0.dummy_2")
     """
-    if "eval" in kwargs.keys():
-        _eval = kwargs["eval"]
-    else:
-        _eval = False
-
-    def _getattr(obj, attr):
-        if hasattr(obj, "attrs"):
-            if attr in obj.attrs.keys():
-                return obj.attrs[attr] if _eval else obj._attrs[attr]
-        try:
-            if type(obj) in (list, dict, tuple, set):
-                try:
-                    return obj[int(attr)]
-                except (KeyError, ValueError):
-                    return obj[attr]
-        except ValueError:
-            raise AttributeError(f"{attr} was not found in {obj}")
-        try:
-            n = get_attr(obj, attr)
-        except AttributeError:
-            n = getattr(obj, attr, *args)
-        return n
-
-    dot = functools.reduce(_getattr, [obj] + attr.split('.'))
-    return dot
+    return dot_path(attr).get(obj, *args, eval=kwargs.get("eval", False))
 
 
 class NodeVisitor:
@@ -155,12 +265,33 @@ class Functions:
             klass = args[0]
         return interpreter.get_next(klass, None)
 
+    @staticmethod
+    def quantity(interpreter, value, unit, **kwargs):
+        if interpreter.units is None:
+            raise ValueError("quantity() needs an interpreter with units.")
+        return interpreter.make_quantity(value, unit)
+
 
 class E3lmInterpreter(NodeVisitor):
-    """Main E3lm Interpreter."""
+    """Main E3lm Interpreter.
+
+    With `units` (a `UnitRegistry`, or `True` for the default one),
+    attributes with a `<name>_unit` sibling evaluate to a `Quantity` of
+    that unit, and expressions do their arithmetic in units.
+    """
+    # Types of evaluated values.
+    value_types = basic_dt
+    units = None
+    quantity = None
 
     def __init__(self, *args, **kwargs):
         super().__init__()
+        units = kwargs.get("units")
+        if units:
+            from e3lm.contrib.units import Quantity, registry
+            self.units = registry if units is True else units
+            self.quantity = Quantity
+            self.value_types = basic_dt + (Quantity,)
         if "parser_kwargs" in kwargs.keys():
             self.parser_kwargs = kwargs["parser_kwargs"]
         else:
@@ -169,7 +300,9 @@ class E3lmInterpreter(NodeVisitor):
             self.parser = kwargs["parser"]
         else:
             self.parser = None
+        self.reset()
 
+    @profiling.profiled("interpret")
     def interpret(self, input, source=None):
         if type(input) == str:
             if self.parser:
@@ -181,17 +314,148 @@ class E3lmInterpreter(NodeVisitor):
         if tree == None:
             return None
         self.program = tree
-        # Here we visit all blocks and subblocks to append to the flat_blocks
-        # list for use later.
-        self.num_visit = 1
-        self.lazy_attrs = []
+        # Blocks are registered to flat_blocks before any attribute is
+        # evaluated, then every attribute is resolved once, dependencies
+        # first.
+        self.reset()
         self.program = self.visit(self.program)
         self.program.flat_blocks = self.flat_blocks
-        while len(self.lazy_attrs) > 0:
-            self.num_visit += 1
-            self.program = self.visit(self.program)
+        if self.profile is not None:
+            self.profile.count("blocks", len(self.flat_blocks))
+            self.profile.count("attrs", len(self.attr_order))
         return self.program
 
+    @profiling.profiled("interpret.update")
+    def update(self, program, removed=(), added=()):
+        """Interpret the top-level blocks `added` to the `program` this
+        interpreter already interpreted, in place of the blocks `removed`
+        from it.
+
+        The state of the attributes of the removed blocks is dropped, the
+        blocks of the program are registered again and the added blocks are
+        visited like `interpret` does. Attributes of the other blocks are not
+        evaluated again, see `e3lm.lang.incremental` for replacing the ones
+        that depend on the removed blocks.
+        """
+        self.profile = profiling.current()
+        attrs = set()
+        stack = list(removed)
+        while stack:
+            b = stack.pop()
+            attrs.update(b._attrs.values())
+            stack.extend(b.children)
+        for a in attrs:
+            self.attr_deps.pop(a, None)
+        self._resolved.difference_update(attrs)
+        if attrs:
+            self.attr_order = [a for a in self.attr_order if a not in attrs]
+
+        self.program = program
+        # Same blocks and order as `register` gives, only the added ones
+        # need to be set up.
+        flat = []
+        stack = list(reversed(program.blocks))
+        while stack:
+            b = stack.pop()
+            flat.append(b)
+            stack.extend(reversed(b.children))
+        self.flat_blocks = self._nav = ast.BlockIndex(flat)
+        stack = [(b, program) for b in added]
+        while stack:
+            b, parent = stack.pop()
+            if not hasattr(b, "parent"):
+                b.parent = parent
+            if not hasattr(b, "attrs"):
+                b.attrs = {}
+            for a in b._attrs.values():
+                if not hasattr(a, "parent"):
+                    a.parent = b
+            stack.extend((c, b) for c in b.children)
+        self.current_block = None
+        for b in added:
+            self.visit(b, evaluate=True)
+        program.flat_blocks = self.flat_blocks
+        if self.profile is not None:
+            self.profile.count("blocks", len(added))
+        return program
+
+    def reset(self):
+        """Reset the per-program state so the interpreter can be reused."""
+        self.flat_blocks = ast.BlockIndex()
+        self._nav = ast.BlockIndex()
+        self.attr_deps = {}
+        self.attr_order = []
+        self._resolved = set()
+        self._resolving = []
+        self._pending = set()
+        self._evaluating = set()
+        self.profile = profiling.current()
+
+    def resolve(self, attr):
+        """Evaluate `attr` after the attributes it depends on.
+
+        Evaluating an attribute that needs another unevaluated one is
+        interrupted by `PendingAttr`, the dependency is recorded in
+        `attr_deps` and evaluated first. Each attribute is evaluated to
+        completion once, and `attr_order` gets the attributes in the order
+        they were evaluated (a topological order of `attr_deps`).
+
+        Raises `CircularReferenceError` if attributes depend on each other.
+        """
+        if attr in self._resolved:
+            return attr.eval
+        stack = self._resolving
+        base = len(stack)
+        cblock = getattr(self, "current_block", None)
+        cattr = getattr(self, "current_attr", None)
+        stack.append(attr)
+        self._pending.add(attr)
+        try:
+            while len(stack) > base:
+                top = stack[-1]
+                self.current_block = top.parent
+                self.current_attr = top
+                try:
+                    self.visit(top, evaluate=2)
+                except PendingAttr as p:
+                    dep = p.attr
+                    if dep in self._pending:
+                        raise CircularReferenceError(
+                            stack[stack.index(dep):] + [dep]) from None
+                    stack.append(dep)
+                    self._pending.add(dep)
+                    if self.profile is not None:
+                        # `top` is visited again once `dep` is resolved.
+                        self.profile.count("revisits")
+                    continue
+                stack.pop()
+                self._pending.discard(top)
+                self._resolved.add(top)
+                self.attr_order.append(top)
+                if type(top.parent) == ast.Block:
+                    top.parent.attrs[top.name] = top.eval
+        finally:
+            self._pending.difference_update(stack[base:])
+            del stack[base:]
+            self.current_block = cblock
+            self.current_attr = cattr
+        return attr.eval
+
+    def depend(self, obj):
+        """Record that the attribute being resolved needs `obj`, if it is an
+        `Attr`.
+
+        Raises `PendingAttr` if `obj` is not evaluated yet.
+        """
+        if type(obj) != ast.Attr or not self._resolving:
+            return obj
+        deps = self.attr_deps.setdefault(self._resolving[-1], [])
+        if obj not in deps:
+            deps.append(obj)
+        if obj not in self._resolved:
+            raise PendingAttr(obj)
+        return obj
+
     def id(self):
         """Generate an ID."""
         self._idgen += 1
@@ -200,7 +464,7 @@ class E3lmInterpreter(NodeVisitor):
     def visit(self, node, evaluate=False):
         if node == None:
             return None
-        if not hasattr(node, "_id") and type(node) not in ast.basic_dt:
+        if not hasattr(node, "_id") and type(node) not in self.value_types:
             node._id = self.id()
 
         # Check if the object is provided as plugin.
@@ -219,59 +483,38 @@ class E3lmInterpreter(NodeVisitor):
         return result
 
     def get_next(self, klass=None, obj=None):
+        """Return the block after `obj` (the current block) in `flat_blocks`,
+        or among the blocks of type `klass`. If `obj` is not one of them,
+        the first of them is returned."""
         obj = obj or self.current_block
-
-        a = self.filter_flat(klass=klass)
-        if obj not in a:
-            n = 0
-        else:
-            n = a.index(obj) + 1
-        if klass:
-            for i in range(len(a)):
-                try:
-                    if a[n+i].type == klass:
-                        return a[n+i]
-                except IndexError:
-                    break
-        else:
-            if n >= len(a):
-                return None
-            try:
-                return a[n]
-            except IndexError:
-                raise RecursionError("Cannot get next({}) of object {}."
-                                     .format(str(klass), str(obj)))
+        a = self.flat_blocks.by_type(klass) if klass else self.flat_blocks
+        n = self.flat_blocks.position(obj, klass)
+        n = 0 if n is None else n + 1
+        if n >= len(a):
+            return None
+        return a[n]
 
     def get_prev(self, klass=None, obj=None):
+        """Return the block before `obj` (the current block) in
+        `flat_blocks`, or among the blocks of type `klass`. If `obj` is not
+        one of them, the first of them is returned."""
         obj = obj or self.current_block
-        a = self.filter_flat(klass=klass)
-        if obj not in a:
-            n = 0
-        else:
-            n = a.index(obj) - 1
-        if klass:
-            for i in range(len(a)):
-                if n-i < 0:
-                    return None
-                try:
-                    if a[n-i].type == klass:
-                        return a[n-i]
-                except IndexError:
-                    break
-        else:
-            if n < 0:
-                return None
-            try:
-                return a[n]
-            except IndexError:
-                raise RecursionError("Cannot get prev({}) of object {}."
-                                     .format(str(klass), str(obj)))
+        a = self.flat_blocks.by_type(klass) if klass else self.flat_blocks
+        n = self.flat_blocks.position(obj, klass)
+        n = 0 if n is None else n - 1
+        if n < 0 or (klass and n >= len(a)):
+            return None
+        try:
+            return a[n]
+        except IndexError:
+            raise RecursionError("Cannot get prev({}) of object {}."
+                                 .format(str(klass), str(obj)))
 
     def filter_flat(self, klass=None):
         """Get `flat_blocks` filtered by `klass`."""
         store = self.flat_blocks
         if klass:
-            return [a for a in store if a.type == klass]
+            return list(store.by_type(klass))
         else:
             return store
 
@@ -286,7 +529,7 @@ class E3lmInterpreter(NodeVisitor):
                     if obj not in self.current_attr._eval:
                         self.current_attr._eval.append(obj)
                     obj = self.visit(obj, evaluate=2)
-                    if type(obj) in ast.basic_dt:
+                    if type(obj) in self.value_types:
                         break
                 if type(obj) == ast.Block:
                     return obj
@@ -294,13 +537,14 @@ class E3lmInterpreter(NodeVisitor):
                     if obj not in self.current_attr._eval:
                         self.current_attr._eval.append(obj)
                     obj = self.visit(obj, evaluate=2)
-                    if type(obj) in ast.basic_dt:
+                    if type(obj) in self.value_types:
                         break
                 obj = obj.eval
             else:
                 obj = self.visit(obj, evaluate=True)
         self.current_block = cblock
-        if type(obj) not in _types:
+        # Blocks are visited in document order, not when referenced.
+        if type(obj) not in _types and type(obj) != ast.Block:
             obj = self.visit(obj, evaluate=True)
         if obj not in self.current_attr._eval:
             self.current_attr._eval.append(obj)
@@ -309,25 +553,46 @@ class E3lmInterpreter(NodeVisitor):
     def v_Program(self, obj, *args, **kwargs):
         self.current_block = None
         if not hasattr(self, "flat_blocks"):
-            self.flat_blocks = []
+            self.flat_blocks = ast.BlockIndex()
         if not hasattr(self, "_nav"):
-            self._nav = []
-
-        def add_to_nav(slf, b):
-            if b not in slf._nav:
-                slf._nav.append(b)
-                if len(b.children) > 0:
-                    for bb in b.children:
-                        add_to_nav(slf, bb)
+            self._nav = ast.BlockIndex()
 
-        for i, b in enumerate(obj.blocks):
-            add_to_nav(self, b)
+        self.register(obj)
+        if self.profile is not None:
+            self.profile.count("passes")
+            with self.profile.time("interpret.resolve"):
+                self.visit_blocks(obj)
+        else:
+            self.visit_blocks(obj)
+        return obj
 
+    @profiling.profiled("interpret.register")
+    def register(self, obj):
+        """Register the blocks of the program `obj` to `_nav` and
+        `flat_blocks` in pre-order, skipping the ones already added with their
+        children."""
+        if self.profile is not None:
+            self.profile.count("passes")
+        stack = [(b, obj) for b in reversed(obj.blocks)]
+        while stack:
+            b, parent = stack.pop()
+            if self._nav.add(b):
+                self.flat_blocks.add(b)
+                if not hasattr(b, "parent"):
+                    b.parent = parent
+                if not hasattr(b, "attrs"):
+                    b.attrs = {}
+                for a in b._attrs.values():
+                    if not hasattr(a, "parent"):
+                        a.parent = b
+                stack.extend((c, b) for c in reversed(b.children))
+
+    def visit_blocks(self, obj):
+        """Visit the blocks of the program `obj`, resolving their
+        attributes."""
         for i, b in enumerate(obj.blocks):
             obj.blocks[i] = b = self.visit(b, evaluate=True)
 
-        return obj
-
     def v_Type(self, obj, *args, **kwargs):
         evaluate = kwargs["evaluate"]
         if not hasattr(obj, "_id"):
@@ -345,11 +610,8 @@ class E3lmInterpreter(NodeVisitor):
         if not hasattr(obj, "parent"):
             obj.parent = self.current_block or self.program
 
-        if not obj in self._nav:
-            self._nav.append(obj)
-
-        if obj not in self.flat_blocks:
-            self.flat_blocks.append(obj)
+        self._nav.add(obj)
+        self.flat_blocks.add(obj)
 
         # Visit children blocks and then attributes.
         for i, b in enumerate(obj.children):
@@ -361,24 +623,16 @@ class E3lmInterpreter(NodeVisitor):
 
         for i, a in obj._attrs.items():
             self.current_block = obj
-            self.current_attr = obj._attrs[i]
-            try:
-                obj._attrs[i] = self.visit(a, evaluate=True)
-            except RecursionError:
-                continue
-            self.current_block = obj
-            if evaluate != False:
-                self.current_attr = obj._attrs[i]
-                obj.attrs[i] = a.eval = self.visit(a, evaluate=2)
+            self.resolve(a)
+        # Attributes are resolved in dependency order, keep them in
+        # declaration order.
+        obj.attrs = {i: obj.attrs[i] for i in obj._attrs if i in obj.attrs}
 
         return obj
 
     def v_Attr(self, obj, *args, **kwargs):
-        global stuck_counter  # For stack overflow avoidance
         # --- RETURN BASED ON EVALUATE ---
         evaluate = kwargs["evaluate"]
-        if not hasattr(obj, "_lazy"):
-            obj._lazy = 1
         if not hasattr(obj, "_id"):
             obj._id = self.id()
         if not hasattr(obj, "parent"):
@@ -386,46 +640,64 @@ class E3lmInterpreter(NodeVisitor):
         if not hasattr(obj, "_eval"):
             obj._eval = []
 
-        if obj in self.lazy_attrs and obj._lazy == self.num_visit:
-            if self.current_attr not in self.lazy_attrs:
-                self.current_attr.lazy = self.num_visit
-                self.lazy_attrs.append(self.current_attr)
-            return ast.Lazy() if evaluate == 2 else obj
-
-        if obj.name == "body":
-            obj = self.v_body(obj, evaluate=False)
-            obj.eval = self.v_body(obj, evaluate=True)
-            obj._eval.append(obj.eval)
+        # Attributes are evaluated by `resolve`, others are dependencies.
+        if not self._resolving:
+            self.resolve(obj)
+        elif obj is not self._resolving[-1]:
+            self.depend(obj)
+        if obj in self._resolved:
             return obj.eval if evaluate == 2 else obj
-        else:
-            if len(obj._eval) >= 1 and type(obj._eval[-1]) == ast.Attr:
-                if obj.name == obj._eval[-1].name:
-                    raise RecursionError
-            try:
-                obj.value = self.visit(obj.value, evaluate=False)
+        if obj in self._evaluating:
+            # The attribute refers to itself.
+            raise CircularReferenceError([obj, obj])
+
+        self._evaluating.add(obj)
+        try:
+            if obj.name == "body":
+                obj = self.v_body(obj, evaluate=False)
+                obj.eval = self.v_body(obj, evaluate=True)
+                obj._eval.append(obj.eval)
+            else:
+                unit = None
+                if self.units is not None and type(obj.parent) == ast.Block:
+                    # Before the value, which is evaluated again if the
+                    # unit is pending.
+                    unit = obj.parent._attrs.get(obj.name + "_unit")
+                    if unit is not None:
+                        unit = self.visit(unit, evaluate=2)
                 _eval = self.visit(obj.value, evaluate=2)
                 if _eval not in obj._eval:
                     obj._eval.append(_eval)
-
                 obj.eval = self.abs_eval(_eval)
-                if obj in self.lazy_attrs:
-                    self.lazy_attrs.remove(obj)
-
-                # Removed recursion limit for 3lm interpreter..
-                # Basically a 3lm file won't be that large.
-
-                # stuck_counter += 1
-                # if stuck_counter > sys.getrecursionlimit():
-                    # print("Stuck at recursion: " + str(stuck_counter) + "\nThe attribute", obj, "is bugged. Please check your 3lm code.")
-                    # stuck_counter = 0
-                    # exit(1)
+                if unit is not None:
+                    obj.eval = self.with_unit(obj, unit)
+        finally:
+            self._evaluating.discard(obj)
+        return obj.eval if evaluate == 2 else obj
+
+    def with_unit(self, attr, unit):
+        """Return the eval of `attr` as a quantity of `unit`, the value of
+        its `<name>_unit` sibling, if it is a number or a quantity."""
+        if type(attr.eval) not in (int, float, complex, self.quantity):
+            return attr.eval
+        try:
+            return self.make_quantity(attr.eval, unit)
+        except (TypeError, ValueError) as e:
+            raise type(e)("attr '" + str(attr.name) + "' in block '"
+                          + str(attr.parent) + "': " + str(e) + ".")
+
+    def make_quantity(self, value, unit):
+        """Return `value` as a quantity of `unit`, converting it if it is a
+        quantity already."""
+        try:
+            if isinstance(value, self.quantity):
+                return value.to(unit)
+            return self.quantity(value, unit, self.units)
+        except KeyError:
+            raise ValueError("Unknown unit " + repr(unit)) from None
 
-                return obj.eval if evaluate == 2 else obj
-            except (AttributeError, ValueError) as e:
-                if obj not in self.lazy_attrs:
-                    obj.lazy = self.num_visit
-                    self.lazy_attrs.append(obj)
-                return obj
+    def v_Quantity(self, obj, *args, **kwargs):
+        return obj
 
     # TODO better Jinja2 implementation
     def v_body(self, obj, *args, **kwargs):
@@ -435,12 +707,16 @@ class E3lmInterpreter(NodeVisitor):
                 val = obj.value
                 if isinstance(val, ast.Str):
                     val = str(val.value)
-                obj._body_template = Template(val)
+                obj._body_template = body_template(val)
             kwargs = self.current_block.attrs
             if isinstance(obj, ast.Attr):
                 obj.tokens = []
             kwargs = {**kwargs, "tokens": obj.tokens}
-            obj.eval = obj._body_template.render(**kwargs)
+            if self.profile is None:
+                obj.eval = obj._body_template.render(**kwargs)
+            else:
+                with self.profile.time("interpret.render"):
+                    obj.eval = obj._body_template.render(**kwargs)
             return obj.eval if evaluate else obj
         # return obj
         # obj.eval = obj.value
@@ -450,6 +726,8 @@ class E3lmInterpreter(NodeVisitor):
         evaluate = kwargs["evaluate"]
         if not hasattr(obj, "_id"):
             obj._id = self.id()
+        if self.profile is not None:
+            self.profile.count("identifiers")
 
         for i, a in enumerate(obj.children):
             obj.children[i] = a = self.visit(a, evaluate=False)
@@ -504,25 +782,20 @@ class E3lmInterpreter(NodeVisitor):
                             _d = True
                         except AttributeError as e:
                             # Try the local/global keyword
-                            arr = [(_b.name, _b.type)
-                                   for _b in self.flat_blocks]
-                            try:
-                                ar = [k[0] for k in arr]
-                                test = self.flat_blocks[ar.index(aa)]
+                            test = self.flat_blocks.by_name(aa)
+                            if test is not None:
                                 c = test
                                 obj.eval = test
                                 _d = False
-                            except ValueError:
-                                try:
-                                    ar = [k[1] for k in arr]
-                                    test = self.flat_blocks[ar.index(aa)].type
-                                    obj.eval = test
-                                    _d = False
-                                except ValueError:
-                                    raise AttributeError(
-                                        "keyword '{}' does not exist.".format(
-                                            aa
-                                        ))
+                            elif self.flat_blocks.by_type(aa):
+                                test = self.flat_blocks.by_type(aa)[0].type
+                                obj.eval = test
+                                _d = False
+                            else:
+                                raise AttributeError(
+                                    "keyword '{}' does not exist.".format(
+                                        aa
+                                    ))
                 if _d:
                     obj.eval = test
                     skip = True
@@ -533,52 +806,25 @@ class E3lmInterpreter(NodeVisitor):
                 try:
                     if c == None:
                         c = self.current_block
-                    test = get_attr(c, aa)
+                    test = get_attr(self.depend(c), aa)
                     c = test
                     obj.eval = c
                     _d = False  # Do not skip
                 except AttributeError:
-                    arr = [(_b.name, _b.type)
-                           for _b in self._nav]
-                    try:
-                        ar = [k[1] for k in arr]
-                        test = self._nav[ar.index(aa)].type
+                    if self._nav.by_type(aa):
+                        test = self._nav.by_type(aa)[0].type
                         obj.eval = test
                         _d = False
-                    except ValueError:
-                        try:
-                            ar = [k[0] for k in arr]
-                            test = self._nav[ar.index(aa)]
-                            c = test
-                            obj.eval = test
-                            _d = False
-                        except ValueError:
-                            # Check if aa does not exist as global block
-                            ar = [k.name for k in self._nav]
-                            ar2 = [k.type for k in self._nav]
-                            if aa not in ar:
-                                print(ar)
-                                if aa not in ar2:
-                                    raise InterpreterError(
-                                        f"{c} does not have {aa}."
-                                    ) from None
-                                else:
-                                    test = self._nav[ar.index(aa)].type
-                                    obj.eval = test
-                                    _d = False
-                            else:
-                                # Check if aa does not exist on block/attr
-                                if type(c) == ast.Attr:
-                                    c = c._eval[0]
-                                if aa not in c.attrs:
-                                    test = self._nav[ar.index(aa)]
-                                    obj.eval = test
-                                    _d = False
-                                else:
-                                    raise AttributeError(
-                                        "keyword '{}' does not exist.".format(
-                                            aa
-                                        )) from None
+                    elif self._nav.by_name(aa) is not None:
+                        test = self._nav.by_name(aa)
+                        c = test
+                        obj.eval = test
+                        _d = False
+                    else:
+                        # aa does not exist as global block
+                        raise InterpreterError(
+                            f"{c} does not have {aa}."
+                        ) from None
 
                 if _d:
                     obj.eval = test
@@ -606,7 +852,7 @@ class E3lmInterpreter(NodeVisitor):
 
         op = obj.op
         ev = self.visit(obj.value, evaluate=True)
-        while (type(ev) not in ast.basic_dt):
+        while (type(ev) not in self.value_types):
             ev = self.abs_eval(ev)
 
         if op == "+":
@@ -624,8 +870,8 @@ class E3lmInterpreter(NodeVisitor):
         leval = self.visit(obj.left, evaluate=True)
         reval = self.visit(obj.right, evaluate=True)
 
-        while (type(leval) not in ast.basic_dt) \
-                or (type(reval) not in ast.basic_dt):
+        while (type(leval) not in self.value_types) \
+                or (type(reval) not in self.value_types):
             leval = self.abs_eval(leval)
             reval = self.abs_eval(reval)
 
@@ -643,10 +889,12 @@ class E3lmInterpreter(NodeVisitor):
             elif obj.op == "//":
                 obj.eval = leval // reval
         except TypeError as e:
-            raise TypeError("attr '"
-                            + str(self.current_attr.name) + "' in block '"
-                            + str(self.current_block) + "' invalid "
-                            + str(obj) + ".")
+            # Subclasses, like `DimensionError`, are kept with their reason.
+            raise type(e)("attr '"
+                          + str(self.current_attr.name) + "' in block '"
+                          + str(self.current_block) + "' invalid "
+                          + str(obj) + "."
+                          + ("" if type(e) == TypeError else " " + str(e)))
         return obj.eval if evaluate else obj
 
     def v_Num(self, obj, *args, **kwargs):
@@ -741,9 +989,9 @@ class E3lmInterpreter(NodeVisitor):
             cpl.left = self.visit(cpl.left, evaluate=True)
             cpl.right = self.visit(cpl.right, evaluate=True)
             cpl_left = cpl.left.eval \
-                if "eval" in dir(cpl.left) else cpl.left
+                if hasattr(cpl.left, "eval") else cpl.left
             cpl_right = cpl.right.eval \
-                if "eval" in dir(cpl.right) else cpl.right
+                if hasattr(cpl.right, "eval") else cpl.right
             _dict[cpl_left] = cpl_right
         obj.eval = _dict
         return obj.eval if evaluate else obj
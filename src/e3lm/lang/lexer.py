@@ -8,11 +8,18 @@ This module provides an `E3lmLexer` with various other internal classes and\
 The E3lmLexer is our e3lm language lexer.
 """
 
-import re
+import copy
 import tokenize
+import threading
+from array import array
 from ply import lex as plylex
 from e3lm.helpers import printers
 from e3lm.lang.data import tokens, regexes
+from e3lm.utils import profiling
+
+# Built PLY lexers by (lexer class, options). Instances get a clone of these.
+_ply_lexers = {}
+_ply_lock = threading.Lock()
 
 
 def raise_lex_error(t, message, type=IndentationError, file=None, details={}):
@@ -24,7 +31,7 @@ def raise_lex_error(t, message, type=IndentationError, file=None, details={}):
         `message`: Display string.
         `type`: Raised error.
         `file`: File name or None (defaults to None which is token lexer \
-            source).
+            source, or the imported file the line comes from).
         `details`: A dict with optional `lineno` and `lineno_inc`.
 
     Raises:
@@ -47,10 +54,16 @@ def raise_lex_error(t, message, type=IndentationError, file=None, details={}):
         end = start
     offset = t.lexpos - start + 1
 
+    text = t.lexer.lexdata[start:end]
+    source_map = t.lexer.e3lm_lexer.source_map
+    if source_map is not None and file == t.lexer.source:
+        source, lineno = source_map.locate(lineno)
+        file = source or file
+
     # print(message, 'ERROR')
     if type == IndentationError:
         details = {}
-    raise type(message, (file, lineno, offset, t.lexer.lexdata[start:end]),
+    raise type(message, (file, lineno, offset, text),
                **details
                )
 
@@ -109,10 +122,9 @@ class E3lmLexer():
     """Lexer for e3lm.
 
     Attributes:
-        `compute_pattern`: This is used to capture meaningful tokens from the \
-        source.
-        `compute_pattern_inds`: A dict that defines `compute_pattern` indices.
-        `_newline_pattern`: Newline regex pattern.
+        `computed`: Per line columns of the input (see `compute_input`).
+        `line_offsets`: Offset of each line start in the input.
+        `source_map`: `SourceMap` of the parsed input imports, if any.
         `debug`: Whether debug mode.
         `store`: A stack for following indents.
         `print`: Print method used to print debug output.
@@ -122,25 +134,8 @@ class E3lmLexer():
         `checks_tokens`: The tokens to check if followed by one another.
     """
     # --- Class variables ---
-    # Pattern to compute indents, actual text and comments.
-    # - Indents followed by anything* and semicolon then anything*, and a
-    # newline.
-    # - Newlines whether preceded by indents or not (nothing afterwards).
-    # - Indents followed by anything+ (inc. spaces and tabs), and a newline.
-    compute_pattern = re.compile(
-        r"(([ \t]*)(.*)(;.*)\n?)|(([ \t]*)\n)|(([ \t]*)(.+)\n?)"
-    )
-    compute_pattern_inds = {
-        # gName: (1st, 2nd, ...),
-        "indent": (2, 6, 8,),
-        "text": (3, 9,),
-        "comment": (4,),
-        "newline": (5,),
-    }
-    _newline_pattern = re.compile(r"\n")
     debug = 0
-
-    store = []
+    source_map = None
 
     def print(self, text, *args):
         return printers._print(
@@ -646,7 +641,7 @@ class E3lmLexer():
     # -- Class Functions
 
     def __init__(self, **kwargs):
-        pass
+        self.store = [{"indent": 0, "token": None}]
 
     def __getattr__(self, attr):
         if attr in ("lineno",):
@@ -660,6 +655,8 @@ class E3lmLexer():
                 `debug`: Whether to use debug mode.
                 `enable_colors`: Whether to print with cprint.
                 `lex_kwargs`: Dict to use for PLY LEX.
+                `cache`: Whether to reuse the PLY lexer built for this class \
+                    (defaults to True).
         """
         if 'debug' in kwargs.keys():
             self.debug = kwargs.pop('debug')
@@ -670,10 +667,60 @@ class E3lmLexer():
                 self.COLORS = printers.COLORS
         if 'lex_kwargs' not in kwargs.keys():
             kwargs['lex_kwargs'] = {}
-        self.lexer = plylex.lex(module=self, debug=(self.debug >= 2),
-                                **kwargs['lex_kwargs']
-                                )
+        cache = kwargs.pop('cache', True)
+        self.lexer = self.build_ply(cache=cache, **kwargs['lex_kwargs'])
+        self.reset()
+
+    def build_ply(self, cache=True, **lex_kwargs):
+        """Return a PLY lexer bound to this instance.
+
+        The master regexes are compiled once per lexer class and options, then
+        copied for every instance with the rules rebound to it.
+
+        Args:
+            `cache`: Whether to reuse (and store) the built PLY lexer.
+            `lex_kwargs`: Dict to use for PLY LEX.
+        """
+        debug = self.debug >= 2
+        try:
+            key = (self.__class__, debug, tuple(sorted(lex_kwargs.items())))
+            hash(key)
+        except TypeError:
+            key, cache = None, False
+
+        with _ply_lock:
+            master = _ply_lexers.get(key) if cache else None
+            if master is None:
+                master = plylex.lex(module=self, debug=debug, **lex_kwargs)
+                if cache:
+                    _ply_lexers[key] = master
+
+        # Not `Lexer.clone(self)`: PLY 3.11 mixes up the rules of each state
+        # when rebinding them.
+        def rebind(f):
+            return getattr(self, f.__name__)
+
+        lexer = copy.copy(master)
+        lexer.lexstatere = {
+            state: [(cre, [(rebind(f[0]), f[1]) if f and f[0] else f
+                           for f in findex])
+                    for cre, findex in ritem]
+            for state, ritem in master.lexstatere.items()
+        }
+        lexer.lexstateerrorf = {state: rebind(f) for state, f
+                                in master.lexstateerrorf.items()}
+        lexer.lexstateeoff = {state: rebind(f) for state, f
+                              in master.lexstateeoff.items()}
+        lexer.lexmodule = self
+        lexer.lexstatestack = []
+        lexer.begin("INITIAL")
+        return lexer
+
+    def reset(self):
+        """Reset the per-input state so the built lexer can be reused."""
         self.store = [{"indent": 0, "token": None}]
+        self.lexer.lexstatestack = []
+        self.lexer.begin("INITIAL")
         self.lexer.last_token = None
         self.lexer.source = None
         self.token_stream = None
@@ -735,6 +782,9 @@ class E3lmLexer():
         token_stream = iter(lexer.token, None)
         token_stream = self.filter_strings(lexer, token_stream)
         token_stream = self.post_token(lexer, token_stream)
+        prof = profiling.current()
+        if prof is not None:
+            token_stream = prof.stream("lex.tokens", token_stream, "tokens")
         return token_stream
 
     def filter_strings(self, lexer, toks):
@@ -804,6 +854,7 @@ class E3lmLexer():
 
     def input(self, data, source="<string>"):
         """Create token stream and compute data."""
+        self.reset()
         data = "\n" + data
         self.token_stream = self.make_token_stream(self.lexer)
         self.lexer.lineno = 0
@@ -812,87 +863,61 @@ class E3lmLexer():
         self.lexer.source = source
         self.compute_input(data)
 
-    def compute_input(self, text, append="\n"):
-        """Apply `compute_pattern` and capture `compute_pattern_inds` into the\
-        lexer `computed`.
-        """
-        # Initialize self.computed
-        if self.computed == None:
-            self.computed = {}
-
-        for key in self.compute_pattern_inds:
-            if key not in self.computed.keys():
-                self.computed[key] = []
-
-        text += "\n"  # Extend computed with a new line.
-
-        # Compute matches
-        matches = self.compute_pattern.finditer(text)
-        count = 0
-        for matchNum, match in enumerate(matches):
-            for key in self.compute_pattern_inds:
-                append = False
-                appendKey = key
-                appendGroups = self.compute_pattern_inds[key]
-                appendNones = False
-
-                if key == "comment":
-                    appendNones = True
-                elif key == "newline":
-                    append = {
-                        "text": "!None",
-                        "newline": "\n",
-                    }
-                elif key == "indent":
-                    append = {
-                        "indent": "spacelen()",
-                    }
-
-                for groupNum in range(0, len(match.groups())):
-                    groupNum = groupNum + 1
-                    group = match.group(groupNum)
-                    if groupNum in appendGroups:
-                        if append or appendNones or (not appendNones and
-                                                     group != None):
-                            if append:
-                                for ap in append:
-                                    if append[ap] == "!None":
-                                        if group != None:
-                                            self.computed[ap].append(
-                                                group
-                                            )
-                                    elif append[ap] == "spacelen()":
-                                        if group != None:
-                                            group = group.replace('\t', ' '*4)
-                                            self.computed[ap].append(
-                                                len(group)
-                                            )
-                                    else:
-                                        self.computed[ap].append(
-                                            append[ap]
-                                        )
-                            else:
-                                self.computed[appendKey].append(group)
+    @profiling.profiled("lex.compute_input")
+    def compute_input(self, text):
+        """Index the lines of `text` into the lexer `computed` columns.
 
-            count += 1
-
-        # Compute newline offsets
-        offsets = [0]
-        for m in self._newline_pattern.finditer(text):
-            offsets.append(m.end())
+        One pass over the lines (plus an extra empty line) fills parallel
+        columns with an item per line:
+            `indent`: Indentation width, a tab counts as 4 (`array('i')`).
+            `text`: The text without indentation and comment. Blank lines
+                keep their indentation and the newline.
+            `comment`: The comment from the last ";" or None.
+            `lengthx`: The line length used by `progress` (`array('i')`).
 
+        The offset of each line start is kept in `line_offsets`.
+        """
+        indents = array("i")
+        texts = []
+        comments = []
+        lengths = array("i")
+        offsets = array("i", [0])
+
+        offset = 0
+        lines = (text + "\n").split("\n")
+        lines.pop()  # Nothing follows the last newline.
+        for line in lines:
+            offset += len(line) + 1
+            offsets.append(offset)
+
+            content = line.lstrip(" \t")
+            spaces = len(line) - len(content)
+            indent = spaces + 3 * line.count("\t", 0, spaces)
+            comment = None
+            semicolon = content.rfind(";")
+            if semicolon != -1:
+                comment = content[semicolon:]
+                content = content[:semicolon]
+                length = len(content) + 1 + len(comment)
+            elif content:
+                length = len(content) + 1
+            else:
+                content = line + "\n"
+                length = len(content)
+
+            indents.append(indent)
+            texts.append(content)
+            comments.append(comment)
+            lengths.append(length + indent)
+
+        self.computed = {
+            "indent": indents,
+            "text": texts,
+            "comment": comments,
+            "lengthx": lengths,
+        }
         self.line_offsets = offsets
 
-        self.computed["lengthx"] = []
-        for m in range(len(self.computed["text"])):
-            x = self.computed["text"][m]
-            y = self.computed["indent"][m]
-            z = self.computed["comment"][m]
-            self.computed["lengthx"].append(len(x)
-                                            if x.endswith("\n") else len(x+" "))
-            self.computed["lengthx"][m] += y
-            self.computed["lengthx"][m] += len(z) if z else 0
-
     def find_column(self, input, token):
         """Compute column where `input` is a text string."""
         line_start = input.rfind('\n', 0, token.lexpos) + 1
@@ -5,27 +5,75 @@ Author: Kenan Masri
 
 import os
 import re
+import copy
 import textwrap
-from ply import yacc
+import threading
 from e3lm.helpers.printers import _print, cprint
 from e3lm.utils.funcs import strip_once
+from e3lm.utils import profiling
 from e3lm.lang import ast
 from e3lm.lang.data import tokens, regexes
+from e3lm.lang.imports import SourceMap, import_cache
 from e3lm.lang.lexer import E3lmLexer
 
+# Built PLY parsers by (parser class, options), used as templates.
+_yacc_parsers = {}
+_yacc_lock = threading.Lock()
+
+
+class ParseContext():
+    """State of a single `E3lmParser.parse` call.
+
+    Attributes:
+        `srs`: Absolute path of the parsed file, or "<string>".
+        `curpath`: Directory of the parsed file (or the cwd).
+        `errors`: List of the errors found while parsing.
+        `imports`: Dict of the imported files, by path, with their first and
+            last line in the expanded text.
+        `source_map`: `SourceMap` of the expanded text, if any.
+    """
+    __slots__ = ("srs", "curpath", "errors", "imports", "source_map")
+
+    def __init__(self, srs="<string>", curpath=None):
+        self.srs = srs
+        self.curpath = curpath
+        self.errors = []
+        self.imports = {}
+        self.source_map = None
+
+    def __str__(self):
+        return f"ParseContext({self.srs!r}, {len(self.errors)} errors)"
+
+    __repr__ = __str__
+
+
+def _context_property(name):
+    """Attribute `name` of the current `ParseContext` of the parser."""
+    def fget(self):
+        return getattr(self.context, name)
+
+    def fset(self, value):
+        setattr(self.context, name, value)
+    return property(fget, fset)
+
 
 class E3lmParser():
-    """The 3lm language parser."""
+    """The 3lm language parser.
+
+    A built parser can be reused for many inputs, but not by several threads
+    at once. The state of the current input is kept in `context`.
+    """
     # --- Class variables ---
     debug = False
     tokens = tokens
-    scopes = [{
-        "last": None,
-        "next": None,
-        "current": None,
-    }]
     print_method = _print
-    errors = []
+    import_cache = import_cache
+
+    srs = _context_property("srs")
+    curpath = _context_property("curpath")
+    errors = _context_property("errors")
+    imports = _context_property("imports")
+    source_map = _context_property("source_map")
 
     # --- Rules ---
     precedence = (
@@ -276,17 +324,13 @@ class E3lmParser():
 
     def p_error(self, p):
         if p:
-            # curimport = self.srs
-            # for key,val in self.imports.items():
-            #     if val[0] <= p.lineno <= val[1]:
-            #         curimport = key
-
-            # lineno = p.lineno if curimport == self.srs \
-            #     else p.lineno - self.imports[curimport][0]
+            message = "Syntax error near token " + str(p)
+            source, lineno = self.locate(p.lineno)
+            if source != self.srs:
+                message += " in '{}', line {}".format(source, lineno)
 
             self.errors.append([
-                (SyntaxError, p.lexpos, p.lineno), "Syntax error near token "
-                + str(p), p,
+                (SyntaxError, p.lexpos, p.lineno), message, p,
             ])
             # self.parser.errok()
         else:
@@ -295,6 +339,9 @@ class E3lmParser():
     # --- Functions ---
     # -- Class functions
 
+    def __init__(self):
+        self.context = ParseContext()
+
     def build(self, **kwargs):
         if 'debug' in kwargs.keys():
             self.debug = kwargs.pop('debug')
@@ -312,13 +359,15 @@ class E3lmParser():
                 lwargs = {}
             self.e3lmLexer.build(**lwargs)
         self.tokens = self.e3lmLexer.tokens
+        if 'import_cache' in kwargs.keys():
+            self.import_cache = kwargs.pop('import_cache')
         if 'yacc_kwargs' not in kwargs.keys():
             kwargs['yacc_kwargs'] = {}
-        self.parser = yacc.yacc(module=self, debug=(self.debug >= 2),
-                                **kwargs['yacc_kwargs']
-                                )
+        yacc_kwargs = {k: v for k, v in kwargs['yacc_kwargs'].items()
+                       if k != 'tracking'}
+        self.parser = self.build_yacc(cache=kwargs.get('cache', True),
+                                      **yacc_kwargs)
         self.parser.e3lm_parser = self
-        self.parser.last_node = None
         if 'tracking' in kwargs['yacc_kwargs'].keys():
             self.tracking = kwargs['yacc_kwargs']['tracking']
         else:
@@ -326,35 +375,82 @@ class E3lmParser():
                 self.tracking = kwargs['tracking']
             else:
                 self.tracking = False
-        self.errors = []
+        self.reset()
+
+    def build_yacc(self, cache=True, **yacc_kwargs):
+        """Return a PLY parser bound to this instance.
+
+        The grammar is validated and the LALR tables are read (or generated)
+        once per parser class and options. Other instances get a copy of that
+        parser with the productions rebound to their own rule methods.
+
+        Args:
+            `cache`: Whether to reuse (and store) the built PLY parser.
+            `yacc_kwargs`: Dict to use for PLY YACC.
+        """
+        # PLY YACC is only imported when a parser is built.
+        from ply import yacc
+        debug = self.debug >= 2
+        try:
+            key = (self.__class__, debug, tuple(sorted(yacc_kwargs.items())))
+            hash(key)
+        except TypeError:
+            key, cache = None, False
+
+        with _yacc_lock:
+            template = _yacc_parsers.get(key) if cache else None
+            if template is None:
+                template = yacc.yacc(module=self, debug=debug, **yacc_kwargs)
+                if cache:
+                    _yacc_parsers[key] = template
+
+        parser = copy.copy(template)
+        parser.productions = []
+        for p in template.productions:
+            production = yacc.MiniProduction(p.str, p.name, p.len, p.func,
+                                             p.file, p.line)
+            if p.func:
+                production.callable = getattr(self, p.func)
+            parser.productions.append(production)
+        parser.errorfunc = self.p_error
+        return parser
+
+    def reset(self):
+        """Reset the per-input state so the built parser can be reused."""
+        self.context = ParseContext()
+        self.parser.last_node = None
+        self.parser.errorok = True
 
+    @profiling.profiled("parse")
     def parse(self, input, source=None, **kwargs):
+        self.reset()
+        context = self.context
         # get curpath for imports
         is_file = False
 
         if input.count("\n") == 0 and os.path.exists(input):
             is_file = True
-            self.srs = os.path.abspath(input)
-            self.curpath = self.srs
             source = input
 
-        self.srs = "<string>"
         if source:
             if os.path.exists(source):
-                self.srs = os.path.abspath(source)
-                self.curpath = self.srs
+                context.srs = os.path.abspath(source)
 
         if not is_file:
             textinput = input
-            self.curpath = os.getcwd()
+            context.curpath = os.getcwd()
         else:
-            self.curpath = os.path.dirname(os.path.abspath(input))
-            with open(self.srs, 'r', encoding='utf-8') as f:
+            context.curpath = os.path.dirname(os.path.abspath(input))
+            with open(context.srs, 'r', encoding='utf-8') as f:
                 textinput = "".join(f.readlines())
 
         # Before parsing-and-lexing filters
         textinput = self.do_imports(textinput)
-        result = self.parser.parse(textinput, self.e3lmLexer, **kwargs)
+        self.e3lmLexer.source_map = self.source_map
+        try:
+            result = self.parser.parse(textinput, self.e3lmLexer, **kwargs)
+        finally:
+            self.e3lmLexer.source_map = None
 
         if self.debug >= 1:
             if len(self.errors) > 0:
@@ -366,9 +462,17 @@ class E3lmParser():
                         self.print_method((err[1]), "ERROR")
         return result
 
+    @profiling.profiled("parse.imports")
     def do_imports(self, text):
-        """Regex the import statements from `input` and load them."""
+        """Regex the import statements from `input` and load them.
+
+        Imported files replace their import line, nested imports included,
+        in a single pass. `source_map` maps every line of the result to the
+        file and line it comes from, see `locate`. Files are read through
+        `import_cache` unless it is `None`.
+        """
         curpath = os.path.dirname(self.srs)
+        regex = re.compile(regexes["IMPORT"])
 
         def get_file(fname):
             """Check for `fname` existence relative to main file dir (or
@@ -384,42 +488,50 @@ class E3lmParser():
                     raise Exception("'{}' does not exist.".format(fpath))
             return fpath
 
-        regex = regexes["IMPORT"]
-        data = text.splitlines(True)
         self.imports = {}
-        curimport = self.srs
-        _lastcurimport = self.srs
-        linecounter = {self.srs: 0, }
-        for lineno, line in enumerate(data):
-            curimport = self.srs
-            for key, val in self.imports.items():
-                if val[0] <= lineno <= val[1]:
-                    curimport = key
-
-            if _lastcurimport != curimport:
-                _lastcurimport = curimport
-                linecounter[curimport] = 0
-
-            linecounter[curimport] += 1
-            match = re.match(regex, line)
-            if match:
-                m = match.group(3)
-                fpath = get_file(m)
+        self.source_map = SourceMap()
+        data = []
+        lineno = 0  # Lines done in `data`.
+
+        def expand(lines, source, imports=None):
+            nonlocal lineno
+            self.source_map.add(lineno + 1, source, 1)
+            for i, line in enumerate(lines):
+                if imports is None:
+                    match = regex.match(line)
+                else:
+                    match = imports.get(i)
+                if not match:
+                    data.append(line)
+                    lineno += line.endswith("\n")
+                    continue
+
+                fpath = get_file(match.group(3))
                 if fpath in self.imports.keys():
                     raise SyntaxError(
                         "Importing '{}' again.".format(
                             os.path.basename(fpath)
                         ),
-                        (curimport,
-                            linecounter[curimport]+1, match.end(1), line
-                         )
+                        (source, i + 1, match.end(1), line)
                     )
-                with open(fpath, "r", encoding='utf-8') as f:
-                    new = f.readlines()
-                new.append("\n")
-                self.imports[fpath] = (lineno+1, lineno+len(new))
-                data[lineno] = ""
-                for i, l in enumerate(new):
-                    data.insert(lineno+i, l)
-
+                start = lineno + 1
+                self.imports[fpath] = (start, start)
+                if self.import_cache is not None:
+                    fragment = self.import_cache.get(fpath, regex)
+                    expand(fragment.lines, fpath, fragment.imports)
+                else:
+                    with open(fpath, "r", encoding='utf-8') as f:
+                        expand(f.readlines(), fpath)
+                data.append("\n")
+                lineno += 1
+                self.imports[fpath] = (start, lineno)
+                self.source_map.add(lineno + 1, source, i + 2)
+
+        expand(text.splitlines(True), self.srs)
         return "".join(data)
+
+    def locate(self, lineno):
+        """Return `(source, line)` of line `lineno` of the parsed text."""
+        if self.source_map is None:
+            return (self.srs, lineno)
+        return self.source_map.locate(lineno)
@@ -0,0 +1,41 @@
+import sys
+import json
+import subprocess
+
+
+def run_cli(cwd, *args):
+    return subprocess.run([sys.executable, "-m", "e3lm.cli", *args], cwd=cwd,
+                          capture_output=True, text=True)
+
+
+def test_cli_profile(tmp_path):
+    (tmp_path / "t.3lm").write_text("Dummy a\n    x = 1\nEnd\n")
+
+    # The program is run once, with or without a profile.
+    for args in ((), ("--profile", "p.json")):
+        proc = run_cli(tmp_path, "t.3lm", "-nc", *args)
+        assert proc.returncode == 0, proc.stderr
+        assert proc.stdout.count("Program(t.3lm)") == 1
+    profile = json.loads((tmp_path / "p.json").read_text())
+    assert profile["timings"]["parse"]["calls"] == 1
+
+    proc = run_cli(tmp_path, "t.3lm", "-p", "lex", "-v", "NONE", "-nc")
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.count("t.3lm") == 1
+
+
+def test_cli_build_jobs(tmp_path):
+    proc = run_cli(tmp_path, "build", ".", "-j", "-2")
+    assert proc.returncode == 2
+    assert "-j/--jobs: must be at least 0" in proc.stderr
+
+
+def test_cli_tree_options(tmp_path):
+    (tmp_path / "a.3lm").write_text("Course c\n    x = 1\nEnd\n")
+    for option in ("--tree-depth", "--tree-children"):
+        proc = run_cli(tmp_path, "a.3lm", option, "-1")
+        assert proc.returncode == 2
+        assert option + ": must be at least 0" in proc.stderr
+    proc = run_cli(tmp_path, "a.3lm", "-nc", "--tree-children", "0")
+    assert proc.returncode == 0, proc.stderr
+    assert "Attr(x = Num(1))" in proc.stdout
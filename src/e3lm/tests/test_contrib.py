@@ -1,4 +1,8 @@
+import io
+import os
+import re
 import json
+import pickle
 import pytest
 from e3lm.helpers import printers
 from e3lm.demos import data
@@ -6,7 +10,8 @@ from e3lm.lang.lexer import E3lmLexer
 from e3lm.lang.parser import E3lmParser
 from e3lm.contrib.json import JsonPlugin as Json
 from e3lm.contrib.dot import DotPlugin as Dot
-from e3lm.contrib.units import UnitsPlugin as Units
+from e3lm.contrib.units import UnitsPlugin as Units, Unit, UnitRegistry
+from e3lm.contrib import units
 from e3lm.lang.interpreters import dot_get
 from e3lm.utils.lang import interpret
 
@@ -47,6 +52,30 @@ def test_json():
                             assert dot == a[1]
 
 
+def test_json_stream():
+    program = interpret(data.code2 + "\n" + data.code4, plugins=[Json])
+    expected = program.json
+    for indent in (4, 2, None):
+        out = io.StringIO()
+        Json().dump(program, out, indent=indent)
+        if indent is None:
+            assert out.getvalue() == json.dumps(expected, separators=(",", ":"))
+        else:
+            assert out.getvalue() == json.dumps(expected, indent=indent)
+
+    out = io.StringIO()
+    Json().dump(program, out, ndjson=True)
+    lines = out.getvalue().splitlines()
+    assert len(lines) == len(program.blocks) > 1
+    assert [json.loads(l) for l in lines] == \
+        json.loads(json.dumps(expected["blocks"]))
+
+    out = io.StringIO()
+    program = interpret(data.code4, plugins=[Json(stream=out, indent=None)])
+    assert program.json is None
+    assert json.loads(out.getvalue())["blocks"][0]["name"] == "my1"
+
+
 def test_dot():
     for i, d in enumerate(data.examples):
         if "dot" not in d.keys():
@@ -62,6 +91,64 @@ def test_dot():
                         assert a in program.dot
 
 
+def test_dot_stream():
+    text = data.code2 + "\n" + data.code4
+    expected = interpret(text, plugins=[Dot]).dot_source
+    assert expected.startswith("digraph G {") and expected.endswith("}")
+
+    out = io.StringIO()
+    Dot().dump(interpret(text), out)
+    assert out.getvalue() == expected
+
+    out = io.StringIO()
+    program = interpret(text, plugins=[Dot(stream=out)])
+    assert program.dot_source is None
+    assert out.getvalue() == expected
+
+    # Styles are shared by the nodes, not copied into them.
+    with pytest.raises(TypeError):
+        Dot.NODES["Block"]["color"] = "red"
+
+
+def test_dot_detail(tmp_path):
+    text = ("Course c\n    heading = 'Course'\n"
+            "    Page p1\n        Note n1\n            text = 'a'\n"
+            "        End\n    End\n"
+            "    Page p2\n        ref = c.heading\n    End\nEnd\n"
+            "Course d\n    other = p1\nEnd\n")
+
+    def unique_ids(source):
+        ids = re.findall(r"^ node(\w+) \[", source, re.M)
+        assert len(ids) == len(set(ids))
+        return source
+
+    def dot(text=text, **options):
+        return unique_ids(interpret(text, plugins=[Dot(**options)]).dot_source)
+
+    full = dot()
+    assert "Page: p1" in full and "Note: n1" in full and "Id(p1)" in full
+    # Deeper blocks are summarized by type, links to them become values.
+    source = dot(depth=1)
+    assert "Course: c" in source and "Page: p1" not in source
+    assert 'label="Page x2\\n1 blocks, 2 attrs"' in source
+    assert 'label="Block(Page, p1)"' in source
+    assert 'label="Course x2\\n3 blocks, 4 attrs"' in dot(depth=0)
+    source = dot(collapse=["Note"])
+    assert "Page: p1" in source and "Note x1" in source
+    source = dot(expressions=False)
+    assert "ref" in source and "Id(c.heading)" not in source
+
+    dot(split=str(tmp_path), depth=2)
+    assert sorted(os.listdir(tmp_path)) == ["0-c.dot", "1-d.dot"]
+    d = (tmp_path / "1-d.dot").read_text()
+    assert "Course: d" in d and "Course: c" not in d
+    assert 'label="Block(Page, p1)"' in d
+    # Nodes of the split files are numbered after the ones of `dot_source`.
+    dot(data.code2 + data.code4, split=str(tmp_path / "demo"))
+    for name in os.listdir(tmp_path / "demo"):
+        unique_ids((tmp_path / "demo" / name).read_text())
+
+
 def test_units():
     for i, d in enumerate(data.examples):
         if "units" not in d.keys():
@@ -77,3 +164,84 @@ def test_units():
                     for a in _d["assert"]:
                         if program:
                             assert a[1] == dot_get(program, a[0])
+
+
+def test_unit_registry():
+    # Given factors are kept, the others are derived through them.
+    assert units.cm.convert("px", 2) == 2 * 37.79527559055118
+    assert units.registry.factor("km", "px") == pytest.approx(3779527.559)
+    assert units.m.convert("km", 500) == 0.5
+    assert units.registry.factor("inch", "in") == 1.0
+    with pytest.raises(ValueError):
+        units.cm.convert("kg", 1)
+
+    registry = UnitRegistry([units.cm, units.m])
+    ft = registry.register(Unit("ft", "feet", converts_to={"cm": 30.48}),
+                           aliases=("foot",))
+    assert registry["foot"] is ft
+    assert registry.convert(2, "m", "foot") == pytest.approx(6.56168, 1e-5)
+    assert registry.convert_many([1, 2], ft, "m") == [0.3048, 0.6096]
+    assert registry.convert_many(range(2), "m", "cm") == [0.0, 100.0]
+    assert "ft" not in units.registry
+
+    # Units are shared and immutable.
+    with pytest.raises(AttributeError):
+        units.cm.id = "mm"
+    with pytest.raises(TypeError):
+        units.cm.converts_to["m"] = 1
+    program = interpret(data.code5, plugins=[Units(registry=registry)])
+    attr1 = dot_get(program, "dummy_1.attr1")
+    assert attr1.unit is units.cm
+    assert dot_get(program, "dummy_1.attr2").convert("ft") == \
+        pytest.approx(16.4042, 1e-5)
+
+    # Registered units are unpickled as the shared ones, others are copied.
+    assert pickle.loads(pickle.dumps(units.cm)) is units.cm
+    assert pickle.loads(pickle.dumps(ft)).converts_to == ft.converts_to
+    quantity = pickle.loads(pickle.dumps(units.Quantity(2, "m")))
+    assert quantity.unit is units.m and quantity.registry is units.registry
+
+
+def test_unit_arithmetic():
+    Quantity = units.Quantity
+    assert Quantity(1, "m") + Quantity(50, "cm") == Quantity(150, "cm")
+    assert (Quantity(1, "in") - Quantity(48, "px")).value == 0.5
+    assert 2 * Quantity(3, "mm") == Quantity(6, "mm")
+    assert Quantity(1, "m") / Quantity(10, "cm") == 10
+    with pytest.raises(units.DimensionError):
+        Quantity(1, "cm") + 1
+    with pytest.raises(units.DimensionError):
+        Quantity(1, "cm") * Quantity(1, "cm")
+
+    text = ("Page page\n    width = 21\n    width_unit = 'cm'\n"
+            "    margin = quantity(10, 'mm')\n"
+            "    inner = width - margin * 2\n    inner_unit = 'mm'\n"
+            "    ratio = width / margin\nEnd\n"
+            "Box box\n    w = page.width + 5 * page.margin\n"
+            "    w_unit = 'in'\n    h = -w / 2\n    n = 3 + 4\nEnd\n")
+    program = interpret(text, units=True, plugins=[Json, Units])
+    page, box = program.blocks
+    assert page.attrs["inner"] == Quantity(190, "mm")
+    assert page.attrs["inner"].unit is units.mm
+    assert page.attrs["ratio"] == 21
+    assert box.attrs["w"].unit is units.inch
+    assert box.attrs["w"] == Quantity(26, "cm")
+    assert box.attrs["h"] == Quantity(-13, "cm")
+    assert box.attrs["n"] == 7
+    assert box._attrs["w"].convert("cm") == pytest.approx(26)
+    assert program.json["blocks"][0]["attrs"]["inner"] == \
+        {"_type": "Quantity", "value": 190.0, "unit": "mm"}
+
+    # Without units, the same program ignores them.
+    assert interpret(text.replace("quantity(10, 'mm')", "1")) \
+        .blocks[0].attrs["inner"] == 19
+    for error, text in (
+            (units.DimensionError,
+             "Page p\n    w = 1\n    w_unit = 'cm'\n    x = w + 1\nEnd\n"),
+            (units.DimensionError,
+             "Page p\n    w = 1\n    w_unit = 'cm'\n    x = w\n"
+             "    x_unit = 'pt'\n    y = x ** 2\nEnd\n"),
+            (ValueError,
+             "Page p\n    w = 1\n    w_unit = 'kg'\nEnd\n")):
+        with pytest.raises(error):
+            interpret(text, units=True)
@@ -5,7 +5,11 @@ from e3lm.demos import data
 from e3lm.lang.lexer import E3lmLexer
 from e3lm.lang.parser import E3lmParser
 from e3lm.utils.lang import interpret
-from e3lm.lang.interpreters import dot_get
+from e3lm.lang.interpreters import (
+    dot_get, body_template, E3lmInterpreter, CircularReferenceError,
+    PlainTemplate)
+from e3lm.lang.incremental import Document, TextEdit
+from e3lm.contrib.json import JsonPlugin
 
 lexer = E3lmLexer()
 parser = E3lmParser()
@@ -47,3 +51,194 @@ def test_basic_interpret():
                             assert dot == a[1]
                         else:
                             raise AssertionError("No program.")
+
+
+def test_slotted_nodes():
+    lexer.build(debug=0)
+    parser.build(debug=0, lexer=lexer)
+    program = interpret(data.code0, parser=parser)
+    for b in program.flat_blocks:
+        assert not hasattr(b, "__dict__")
+        for a in b._attrs.values():
+            assert not hasattr(a, "__dict__")
+            assert hasattr(a, "eval") and hasattr(a, "parent")
+    # Unset slots behave like missing attributes.
+    num = ast.Num("1")
+    assert not hasattr(num, "eval")
+    with pytest.raises(AttributeError):
+        num.something = 1
+
+
+def test_block_index():
+    program = interpret("Dummy first\nEnd\nDummy second\nEnd\n"
+                        "Other first\n    x = first\nEnd\n", parser=parser)
+    first = program.flat_blocks[0]
+    assert program.block_by_name("first") is first
+    assert program.block_by_name("third") is None
+    assert program.flat_blocks.by_type("Dummy") == program.flat_blocks[:2]
+    assert program.flat_blocks.by_type(["unhashable"]) == []
+    assert program.flat_blocks[2].attrs["x"] is first
+
+    assert first in program.flat_blocks
+    assert ast.Block("Dummy", name="first") not in program.flat_blocks
+    assert program.flat_blocks.index(program.flat_blocks[2]) == 2
+    assert not program.flat_blocks.add(first)
+
+    # Changes to the list keep the index.
+    program.flat_blocks.remove(first)
+    assert program.block_by_name("first").type == "Other"
+    assert first not in program.flat_blocks
+    program.build_flat()
+    assert isinstance(program.flat_blocks, ast.BlockIndex)
+    assert program.block_by_name("first") is first
+
+
+
+def test_wide_block(monkeypatch):
+    # Visiting the children of a block keeps the index of its children.
+    text = "Dummy outer\n" + "".join(
+        "    Dummy c{}\n        v = {}\n    End\n".format(
+            i, "outer.c{}.v + 1".format(i - 1) if i else 0)
+        for i in range(200)) + "End\n"
+    rebuilds = []
+    indexed = ast.BlockIndex._indexed
+
+    def counted(self):
+        if self._positions is None:
+            rebuilds.append(self)
+        return indexed(self)
+    monkeypatch.setattr(ast.BlockIndex, "_indexed", counted)
+    program = interpret(text, parser=parser)
+    outer = program.blocks[0]
+    assert outer.children[-1].attrs["v"] == 199
+    assert sum(r is outer.children for r in rebuilds) == 1
+
+    children = outer.children
+    children[0] = children[0]
+    assert children._positions is not None
+    children[0] = children[1]
+    assert children.by_name("c0") is None
+
+
+def test_navigation():
+    program = interpret("Page p0\n    n = next(Page)\n    p = prev(Page)\nEnd\n"
+                        "Note n0\n    n = next()\n    p = prev()\nEnd\n"
+                        "Page p1\n    n = next(Page)\n    p = prev(Page)\n"
+                        "    first = prev('Other')\nEnd\n", parser=parser)
+    p0, n0, p1 = program.flat_blocks
+    assert (p0.attrs["n"], p0.attrs["p"]) == (p1, None)
+    assert (n0.attrs["n"], n0.attrs["p"]) == (p1, p0)
+    assert (p1.attrs["n"], p1.attrs["p"], p1.attrs["first"]) == \
+        (None, p0, None)
+
+    blocks = program.flat_blocks
+    assert [blocks.position(b) for b in blocks] == [0, 1, 2]
+    assert [blocks.position(b, "Page") for b in blocks] == [0, None, 1]
+    interpreter = E3lmInterpreter()
+    interpreter.interpret(program)
+    # Blocks of another type start from the first one of the type.
+    assert interpreter.get_next("Page", n0) is p0
+    assert interpreter.get_prev("Page", n0) is p0
+    assert interpreter.get_next(None, p1) is None
+
+
+def test_attr_dependencies():
+    # Forward references are evaluated once, dependencies first.
+    program = interpret("Dummy a\n    x = b.y + 1\n    z = x * 2\nEnd\n"
+                        "Dummy b\n    y = c.w\nEnd\n"
+                        "Dummy c\n    w = 4\nEnd\n", parser=parser)
+    a, b, c = program.flat_blocks
+    assert a.attrs == {"x": 5, "z": 10}
+    assert list(a.attrs) == ["x", "z"]
+
+    interpreter = E3lmInterpreter()
+    interpreter.interpret(program)
+    x, z = a._attrs["x"], a._attrs["z"]
+    y, w = b._attrs["y"], c._attrs["w"]
+    assert interpreter.attr_deps[x] == [y]
+    assert interpreter.attr_deps[y] == [w]
+    assert interpreter.attr_deps[z] == [x]
+    assert interpreter.attr_order == [w, y, x, z]
+
+    for text in ("Dummy a\n    x = y\n    y = x\nEnd\n",
+                 "Dummy a\n    x = b.y\nEnd\nDummy b\n    y = a.x\nEnd\n",
+                 "Dummy a\n    x = x\nEnd\n"):
+        with pytest.raises(CircularReferenceError) as e:
+            interpret(text, parser=parser)
+        assert e.value.cycle[0] is e.value.cycle[-1]
+        assert "a.x" in str(e.value)
+
+    # Unresolvable references raise instead of retrying forever.
+    with pytest.raises(AttributeError):
+        interpret("Dummy a\n    x = nothing.y\nEnd\n", parser=parser)
+
+
+def test_body_templates():
+    from jinja2 import Template
+    sources = ["plain", "plain\n", "plain\n\n", "", "\n", "a\r\nb\n",
+               "{{ x }}\n", "{% if x %}y{% endif %}", "{# note #}z", "{ x }"]
+    for source in sources:
+        template = body_template(source)
+        assert template is body_template(source)
+        assert template.render(x=1) == Template(source).render(x=1)
+    assert isinstance(body_template("plain\n"), PlainTemplate)
+    assert not isinstance(body_template("{{ x }}"), PlainTemplate)
+
+
+def test_incremental():
+    def same(doc):
+        program = interpret(doc.text, parser=parser)
+        assert JsonPlugin().interpret(doc.program).json == \
+            JsonPlugin().interpret(program).json
+
+    text = "".join("Dummy b{}\n    x = {}\n    y = x * 2\nEnd\n".format(i, i)
+                   for i in range(6))
+    doc = Document(text + "Dummy ref\n    z = b3.y + 1\nEnd\n")
+    assert doc.incremental and len(doc.chunks) == 7
+
+    # A value: its block and the block depending on it.
+    doc.edit(TextEdit((13, 8), (13, 9), "5"))
+    assert not doc.full and doc.reparsed == 2
+    assert doc.program.block_by_name("ref").attrs == {"z": 11}
+    same(doc)
+
+    # Inserted, renamed and deleted blocks.
+    doc.edit(TextEdit((4, 0), (4, 0), "Dummy new\n    w = b0.x\nEnd\n"))
+    assert not doc.full and doc.reparsed == 1
+    same(doc)
+    doc.edit(TextEdit((7, 6), (7, 8), "b9"))
+    assert not doc.full and doc.reparsed == 1
+    assert doc.program.blocks[2].name == "b9"
+    same(doc)
+    doc.edit(TextEdit((4, 0), (7, 0), ""), TextEdit((0, 0), (4, 0), ""))
+    assert not doc.full and doc.reparsed == 0
+    same(doc)
+
+    # Errors are the ones of a full parse, with their lines.
+    with pytest.raises(AttributeError):
+        doc.edit(TextEdit((8, 0), (12, 0), ""))
+    assert doc.full and doc.program is None
+    doc.edit(TextEdit((8, 0), (8, 0), "Dummy b3\n    y = 1\nEnd\n"))
+    assert doc.program.block_by_name("ref").attrs == {"z": 2}
+    same(doc)
+    with pytest.raises(SyntaxError) as e:
+        doc.edit(TextEdit((1, 6), (1, 7), "+"))
+    assert e.value.lineno == 2
+    doc.edit(TextEdit((1, 6), (1, 7), "="))
+    assert doc.full and doc.program is not None
+    doc.edit(TextEdit((1, 8), (1, 9), "4"))
+    assert not doc.full
+    same(doc)
+
+    # Lines before the first block are checked as in a full parse.
+    for text in ("End\n", "@@@ garbage\n", "x = 1\n"):
+        doc = Document("Course c\n    x = 1\nEnd\n")
+        with pytest.raises(SyntaxError) as full:
+            interpret(text + doc.text, parser=parser)
+        with pytest.raises(SyntaxError) as edited:
+            doc.edit(TextEdit((0, 0), (0, 0), text))
+        assert str(edited.value) == str(full.value)
+    doc = Document("Course c\n    x = 1\nEnd\n")
+    doc.edit(TextEdit((0, 0), (0, 0), "; note\n\n"))
+    assert not doc.full
+    same(doc)
@@ -1,3 +1,4 @@
+import re
 import pytest
 from e3lm.helpers import printers
 from e3lm.demos import data
@@ -48,3 +49,48 @@ def test_lexer():
                                 "Code {} did not raise {} error."
                                 .format(str(i), a[1]["class"])
                             )
+
+
+def test_lexer_reuse():
+    lexer.build(debug=0)
+    with pytest.raises(SyntaxError):
+        lex(data.errorcode2, lexer=lexer)
+    # The same built lexer is reset for the next input.
+    toks = [t.type for t in lex(data.code0, lexer=lexer)]
+    assert toks == data.examples[0]["lex"]["assert"][0][1]
+    assert lexer.lexer.lexstate == "INITIAL"
+
+
+def compute_input_regex(text):
+    """The former regex based `E3lmLexer.compute_input`, as a reference."""
+    pattern = re.compile(
+        r"(([ \t]*)(.*)(;.*)\n?)|(([ \t]*)\n)|(([ \t]*)(.+)\n?)"
+    )
+    text += "\n"
+    computed = {"indent": [], "text": [], "comment": [], "lengthx": []}
+    for match in pattern.finditer(text):
+        indent = match.group(2) or match.group(6) or match.group(8) or ""
+        computed["indent"].append(len(indent.replace("\t", " " * 4)))
+        computed["text"].append(match.group(3) if match.group(3) is not None
+                                else match.group(5) or match.group(9))
+        computed["comment"].append(match.group(4))
+    for x, y, z in zip(computed["text"], computed["indent"],
+                       computed["comment"]):
+        computed["lengthx"].append((len(x) if x.endswith("\n")
+                                    else len(x + " ")) + y + len(z or ""))
+    offsets = [0] + [m.end() for m in re.finditer(r"\n", text)]
+    return computed, offsets
+
+
+def test_compute_input():
+    texts = [d["text"] for d in data.examples] + [
+        "", "\n\n", "Dummy\n\tattr = 1 ; one; two\n  \t \n\t End",
+        "a;\r\n  \r\n;x\n \t;\n   ",
+    ]
+    for text in texts:
+        text = "\n" + text
+        lexer.compute_input(text)
+        computed, offsets = compute_input_regex(text)
+        for key, column in computed.items():
+            assert list(lexer.computed[key]) == column, key
+        assert list(lexer.line_offsets) == offsets
@@ -1,8 +1,13 @@
+import os
+import re
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from e3lm.helpers import printers
 from e3lm.demos import data
+from e3lm.lang.data import regexes
+from e3lm.lang.imports import ImportCache
 from e3lm.lang.parser import E3lmParser
-from e3lm.utils.lang import parse
+from e3lm.utils.lang import parse, interpret, ParserPool
 
 parser = E3lmParser()
 
@@ -52,3 +57,123 @@ def test_parser_errors():
                             #     print(er[0][0].__name__, er[0][2])
 
                 assert passerts == passerts_count
+
+
+def test_parser_reuse():
+    parser.build(debug=0)
+    built = parser.parser
+    parser.parse(data.errorcode3)
+    assert len(parser.errors) == 2
+    program = parser.parse(data.code1)
+    assert parser.parser is built
+    assert parser.errors == []
+    assert len(program.blocks) == 3
+
+
+def test_imports(tmp_path):
+    (tmp_path / "inner.3lm").write_text("Dummy inner\nEnd\n")
+    (tmp_path / "outer.3lm").write_text(
+        "import inner\nDummy outer\n    attr1 = 1\nEnd\n")
+    main = tmp_path / "main.3lm"
+    main.write_text("Dummy first\nEnd\nimport outer\nDummy last\nEnd\n")
+
+    parser.build(debug=0)
+    program = parser.parse(str(main), str(main))
+    assert [b.name for b in program.blocks] == \
+        ["first", "inner", "outer", "last"]
+    inner, outer = str(tmp_path / "inner.3lm"), str(tmp_path / "outer.3lm")
+    assert list(parser.imports.keys()) == [outer, inner]
+    assert parser.locate(1) == (str(main), 1)
+    assert parser.locate(3) == (inner, 1)
+    assert parser.locate(6) == (outer, 2)
+    assert parser.locate(10) == (str(main), 4)
+
+    # The syntax error is reported with the imported file and line.
+    (tmp_path / "outer.3lm").write_text("Dummy outer\n    attr1 = 1 +\nEnd\n")
+    parser.parse(str(main), str(main))
+    assert any("'{}', line 3".format(outer) in er[1]
+               for er in parser.errors)
+
+    main.write_text("import inner\nimport inner\n")
+    with pytest.raises(SyntaxError) as e:
+        parser.parse(str(main), str(main))
+    assert e.value.lineno == 2
+
+
+def test_import_cache(tmp_path):
+    cache = ImportCache(maxsize=2)
+    regex = re.compile(regexes["IMPORT"])
+    shared = tmp_path / "shared.3lm"
+    shared.write_text("Dummy shared\nEnd\n")
+    parser = E3lmParser()
+    parser.build(import_cache=cache)
+    for i in range(3):
+        lesson = tmp_path / "lesson{}.3lm".format(i)
+        lesson.write_text("import shared\nDummy lesson{}\nEnd\n".format(i))
+        program = parser.parse(lesson.read_text(), str(lesson))
+        assert [b.name for b in program.blocks] == \
+            ["shared", "lesson{}".format(i)]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Changed content is read again.
+    shared.write_text("Dummy changed\nEnd\n")
+    program = parser.parse(lesson.read_text(), str(lesson))
+    assert program.blocks[0].name == "changed"
+    assert cache.misses == 2
+
+    # Same content with a new modification time keeps the fragment.
+    fragment = cache.get(str(shared), regex)
+    st = os.stat(shared)
+    os.utime(shared, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.get(str(shared), regex) is fragment
+    assert cache.misses == 2
+
+    # LRU bound and invalidation.
+    for name in ("a", "b"):
+        (tmp_path / (name + ".3lm")).write_text("Dummy {}\nEnd\n".format(name))
+        cache.get(str(tmp_path / (name + ".3lm")), regex)
+    assert len(cache) == 2 and str(shared) not in cache
+    assert cache.invalidate(str(tmp_path / "a.3lm"))
+    assert not cache.invalidate(str(tmp_path / "a.3lm"))
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0
+
+
+def test_concurrent_parse(tmp_path):
+    def shape(node):
+        if isinstance(node, list):
+            return [shape(n) for n in node]
+        return (node.type, node.name,
+                [(k, repr(v)) for k, v in node.attrs.items()]
+                if isinstance(node.attrs, dict) else None,
+                shape([c for c in node.children if hasattr(c, "attrs")]))
+
+    def run(text, source=None):
+        try:
+            parsed = shape(parse(text, source).blocks)
+            interpreted = shape(interpret(text, source).blocks)
+        except Exception as e:
+            return (e.__class__.__name__, str(e))
+        return (parsed, interpreted)
+
+    (tmp_path / "shared.3lm").write_text("Dummy shared\n    x = 1\nEnd\n")
+    docs = [(d["text"], None) for d in data.examples]
+    for i in range(8):
+        lesson = tmp_path / "lesson{}.3lm".format(i)
+        lesson.write_text("import shared\nDummy lesson{}\n    y = shared.x"
+                          " + {}\nEnd\n".format(i, i))
+        docs.append((lesson.read_text(), str(lesson)))
+    docs = docs * 4
+
+    serial = [run(*doc) for doc in docs]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        threaded = list(executor.map(lambda doc: run(*doc), docs))
+    assert threaded == serial
+
+    pool = ParserPool(maxsize=1)
+    with pool.parser() as p1, pool.parser() as p2:
+        assert p1 is not p2
+        assert p1.e3lmLexer is not p2.e3lmLexer
+    assert len(pool) == 1
+    with pool.parser() as p3:
+        assert p3 in (p1, p2)
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+# Budget of the cumulative import time of e3lm.cli, in milliseconds. Timing
+# depends on the host, so it is only checked when the budget is set.
+IMPORT_BUDGET_MS = os.environ.get("E3LM_IMPORT_BUDGET_MS")
+
+# Modules that must only be imported by the code paths that need them.
+DEFERRED = ("jinja2", "graphviz", "subprocess", "ply.yacc",
+            "e3lm.lang.parsetab", "e3lm.contrib.dot", "e3lm.contrib.json",
+            "e3lm.contrib.units")
+
+
+def imported(module):
+    """Return the names of the modules in `sys.modules` after importing
+    `module` in a new interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-c", "import sys, json, {}; "
+         "print(json.dumps(sorted(sys.modules)))".format(module)],
+        capture_output=True, text=True, check=True)
+    return set(json.loads(proc.stdout))
+
+
+def importtime(module):
+    """Return `{module: cumulative microseconds}` of importing `module` in a
+    new interpreter, from `python -X importtime`."""
+    env = dict(os.environ)
+    # Stale bytecode would be compiled again on every run.
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           "import " + module],
+                          env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_startup_imports():
+    for module in ("e3lm", "e3lm.cli"):
+        modules = imported(module)
+        assert [m for m in DEFERRED if m in modules] == [], module
+
+
+def test_startup_time():
+    if IMPORT_BUDGET_MS is None:
+        pytest.skip("E3LM_IMPORT_BUDGET_MS is not set")
+    budget = float(IMPORT_BUDGET_MS)
+    importtime("e3lm.cli")  # Warm up the bytecode cache.
+    best = min(importtime("e3lm.cli")["e3lm.cli"] for i in range(3)) / 1000
+    assert best <= budget, \
+        "import e3lm.cli took {:.1f} ms, over the budget of {:.0f} ms" \
+        .format(best, budget)
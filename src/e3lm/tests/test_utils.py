@@ -1,12 +1,25 @@
+import io
+import os
+import json
+import socket
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from e3lm.lang.interpreters import (
     E3lmInterpreter,
-    get_attr, dot_get,
+    get_attr, dot_get, dot_path, DotPath,
 )
 from e3lm.lang import ast
 from e3lm.utils.lang import interpret
+from e3lm.utils.bench import summarize, bench_phases
+from e3lm.utils.profiling import Profile, current
+from e3lm.utils.build import build, discover, BuildCache
+from e3lm.utils.serve import E3lmServer, E3lmClient, E3lmServerError
+from e3lm.contrib.json import JsonPlugin
 from e3lm.lang.lexer import E3lmLexer
 from e3lm.lang.parser import E3lmParser
 from e3lm.demos import data
+from e3lm.helpers import printers
 
 
 def test_backflow():
@@ -31,3 +44,263 @@ def test_backflow():
 def test_dotget():
     program = interpret(data.code4)
     assert "hello" == dot_get(program, "my1.attr2.0.1.2.hi")
+
+    # Children and attributes of blocks, by name.
+    program = interpret("Dummy outer\n    Dummy inner\n        x = 1\n"
+                        "    End\n    Dummy inner\n    End\n    y = [4, 5]\n"
+                        "End\n")
+    outer = program.blocks[0]
+    inner = outer.children[0]
+    assert isinstance(outer.children, ast.BlockIndex)
+    assert get_attr(outer, "inner") is inner
+    assert dot_get(program, "outer.inner.x") is inner._attrs["x"]
+    assert dot_get(program, "outer.inner.x", eval=True) == 1
+    assert dot_get(program, "outer.y.1", eval=True) == 5
+    assert dot_get(program, "outer.missing", None) is None
+
+    # Paths are split once and reused on other programs.
+    path = dot_path("outer.inner.x")
+    assert path is dot_path("outer.inner.x")
+    other = interpret("Dummy outer\n    Dummy inner\n        x = 2\n"
+                      "    End\nEnd\n")
+    assert [path.get(p, eval=True) for p in (program, other)] == [1, 2]
+    assert DotPath("blocks.0.name")(other) == "outer"
+
+
+def test_bench():
+    stats = summarize([5, 1, 3, 2, 4])
+    assert (stats["count"], stats["min"], stats["median"], stats["max"]) \
+        == (5, 1, 3, 5)
+    assert stats["p95"] == 5 and round(stats["stddev"], 3) == 1.581
+    assert summarize([7])["stddev"] == 0.0
+    assert summarize(range(1, 101))["p95"] == 95
+
+    samples = bench_phases(data.code4, plugins=[JsonPlugin], repeat=3,
+                           warmup=1)
+    assert list(samples.keys()) == \
+        ["lex", "parse", "interpret", "JsonPlugin", "total"]
+    assert all(len(ns) == 3 and min(ns) > 0 for ns in samples.values())
+    assert samples["total"][0] == sum(samples[k][0] for k in
+                                      ("lex", "parse", "interpret",
+                                       "JsonPlugin"))
+
+
+def test_profile():
+    text = ("Dummy a\n    x = b.y + 1\nEnd\n"
+            "Dummy b\n    y = 2\n    body = \'\'\'{{ y }}\'\'\'\nEnd\n")
+    interpret(text)
+    assert current() is None
+
+    with Profile() as prof:
+        assert current() is prof
+        interpret(text, plugins=[JsonPlugin])
+    assert current() is None
+
+    result = json.loads(prof.to_json())
+    assert result == prof.as_dict()
+    timings, counters = result["timings"], result["counters"]
+    for phase in ("lex.compute_input", "lex.tokens", "parse", "parse.imports",
+                  "interpret", "interpret.register", "interpret.resolve",
+                  "interpret.render", "plugin.JsonPlugin"):
+        assert timings[phase]["calls"] >= 1 and timings[phase]["ns"] > 0
+    assert timings["parse"]["ns"] >= timings["parse.imports"]["ns"]
+    assert counters["tokens"] == timings["lex.tokens"]["calls"]
+    assert (counters["blocks"], counters["attrs"], counters["passes"]) \
+        == (2, 3, 2)
+    assert counters["identifiers"] >= 1 and counters["revisits"] == 1
+
+
+def test_build(tmp_path):
+    src = tmp_path / "src"
+    (src / "a" / "b").mkdir(parents=True)
+    for i in range(6):
+        (src / "a" / "f{}.3lm".format(i)).write_text(
+            "Dummy d{}\n    x = 1 + {}\nEnd\n".format(i, i))
+    (src / "shared.3lm").write_text("Dummy shared\n    y = 2\nEnd\n")
+    (src / "a" / "b" / "main.3lm").write_text(
+        "import ../../shared\nDummy main\n    z = shared.y\nEnd\n")
+    (src / "a" / "b" / "bad.3lm").write_text("Dummy bad\n    x = y\nEnd\n")
+    (src / "a" / "notes.txt").write_text("Not 3lm")
+    assert len(discover(str(src))) == 9
+
+    for workers in (0, 2):
+        out = tmp_path / "out{}".format(workers)
+        results = {os.path.relpath(r.path, str(src)): r for r in
+                   build(str(src), str(out), ("json", "dot"), workers)}
+        assert len(results) == 9
+        assert [k for k, r in results.items() if not r.ok] == \
+            [os.path.join("a", "b", "bad.3lm")]
+        assert "does not have y" in results[os.path.join(
+            "a", "b", "bad.3lm")].error
+        program = json.loads((out / "a" / "f3.json").read_text())
+        assert program["blocks"][0]["attrs"] == {"x": 4}
+        program = json.loads((out / "a" / "b" / "main.json").read_text())
+        assert program["blocks"][1]["attrs"] == {"z": 2}
+        assert (out / "a" / "b" / "main.dot").read_text().startswith("digraph")
+
+
+def test_build_cache(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "shared.3lm").write_text("Dummy shared\n    y = 2\nEnd\n")
+    (src / "other.3lm").write_text("Dummy other\n    y = 3\nEnd\n")
+    for i in range(3):
+        (src / "uses{}.3lm".format(i)).write_text(
+            "import shared\nDummy main\n    z = shared.y\nEnd\n")
+    (src / "alone.3lm").write_text("import other\nDummy alone\nEnd\n")
+    cache_path = str(out / ".e3lm-cache.json")
+
+    def run(outputs=("json",)):
+        cache = BuildCache(cache_path, version="test")
+        results = list(build(str(src), str(out), outputs, 0, cache))
+        assert all(r.ok for r in results)
+        return sorted(os.path.basename(r.path) for r in results
+                      if not r.cached)
+
+    assert len(run()) == 6
+    assert run() == []
+    cache = BuildCache(cache_path, version="test")
+    assert len(cache) == 6
+    assert sorted(os.path.basename(p) for p in cache.dependents[
+        str(src / "shared.3lm")]) == ["uses0.3lm", "uses1.3lm", "uses2.3lm"]
+
+    # Editing an imported file rebuilds exactly its dependents.
+    (src / "shared.3lm").write_text("Dummy shared\n    y = 5\nEnd\n")
+    assert run() == ["shared.3lm", "uses0.3lm", "uses1.3lm", "uses2.3lm"]
+    program = json.loads((out / "uses1.json").read_text())
+    assert program["blocks"][1]["attrs"] == {"z": 5}
+    assert run() == []
+
+    # Edited files, missing outputs, other plugins and versions.
+    (src / "alone.3lm").write_text("import other\nDummy alone2\nEnd\n")
+    (out / "uses0.json").unlink()
+    assert run() == ["alone.3lm", "uses0.3lm"]
+    assert len(run(("json", "dot"))) == 6
+    assert len(list(build(str(src), str(out), ("json", "dot"), 0,
+                          BuildCache(cache_path, version="other")))) == 6
+    assert len(BuildCache(cache_path, version="test")) == 0
+
+
+def test_serve(tmp_path):
+    path = str(tmp_path / "e3lm.sock")
+    server = E3lmServer(workers=2)
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run,
+                              args=(server.serve_unix(path, ready),))
+    thread.start()
+    try:
+        assert ready.wait(10)
+
+        def request(i):
+            code = "Dummy d{}\n    x = 1 + {}\nEnd\n".format(i, i)
+            with E3lmClient(path, timeout=30) as client:
+                return (client.lex(code), client.parse(code),
+                        client.json(code), client.dot(code),
+                        client.interpret(code, plugins=["json"]))
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(request, range(8)))
+        for i, (tokens, outline, program, dot, interpreted) in \
+                enumerate(results):
+            assert tokens[0] == ["CLASS", ["Dummy", "d{}".format(i)], 1]
+            assert outline["blocks"][0]["name"] == "d{}".format(i)
+            assert outline["blocks"][0]["attrs"] == ["x"]
+            assert program["blocks"][0]["attrs"] == {"x": 1 + i}
+            assert dot.startswith("digraph")
+            assert interpreted["outputs"]["json"] == program
+
+        with E3lmClient(path, timeout=30) as client:
+            try:
+                client.json("Dummy bad\n    x = y\nEnd\n")
+                assert False, "The server answered an invalid program."
+            except E3lmServerError as e:
+                assert e.code == -32000
+                assert "does not have y" in str(e)
+            try:
+                client.call("nothing")
+                assert False, "The server answered an unknown method."
+            except E3lmServerError as e:
+                assert e.code == -32601
+            assert client.call("ping") == "pong"
+
+        # Malformed lines are answered, notifications are not.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(30)
+            sock.connect(path)
+            sock.sendall(b'{"jsonrpc": "2.0", "method": "ping"}\n{bad\n')
+            response = json.loads(sock.makefile("rb").readline())
+            assert response["error"]["code"] == -32700
+    finally:
+        server.close()
+        thread.join(10)
+    assert not thread.is_alive()
+    assert not os.path.exists(path)
+
+
+def test_serve_socket_path(tmp_path):
+    # Other files are kept.
+    path = tmp_path / "notes.txt"
+    path.write_text("keep")
+    try:
+        asyncio.run(E3lmServer(workers=1).serve_unix(str(path)))
+        assert False, "The server replaced a regular file."
+    except FileExistsError:
+        pass
+    assert path.read_text() == "keep"
+
+    # A socket left by a server that is not running is replaced.
+    path = str(tmp_path / "stale.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+    server = E3lmServer(workers=1)
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run,
+                              args=(server.serve_unix(path, ready),))
+    thread.start()
+    try:
+        assert ready.wait(10)
+        with E3lmClient(path, timeout=30) as client:
+            assert client.call("ping") == "pong"
+        # Nor is one that a server listens on.
+        try:
+            asyncio.run(E3lmServer(workers=1).serve_unix(path))
+            assert False, "The server replaced a socket in use."
+        except FileExistsError:
+            pass
+    finally:
+        server.close()
+        thread.join(10)
+    assert not os.path.exists(path)
+
+
+def test_tree_printer():
+    from asciitree import LeftAligned
+    text = "".join("Page p{}\n    n = {}\n    Note n{}\n        x = 1\n"
+                   "    End\nEnd\n".format(i, i, i) for i in range(5))
+    program = interpret(text)
+
+    def traverse():
+        return printers.TRAVERSE(cols=printers.COLORS, charset=[],
+                                 program_name="p", evaluate=True)
+
+    # Same lines as asciitree, written as they are drawn.
+    draw = printers.TREE_NODES.draw
+    tree = printers.TreePrinter(draw=draw, traverse=traverse())
+    assert tree(program) == \
+        LeftAligned(draw=draw, traverse=traverse())(program)
+
+    out = io.StringIO()
+    printers.nprint(program, max_level=1, max_children=2, file=out,
+                    pallete=None, noglyph=True, program_name="p",
+                    evaluate=True)
+    lines = out.getvalue().splitlines()
+    assert lines[1:-1] == [
+        " * Program(p)",
+        " |->-- o Block(Page, p0)",
+        " |   '->-- ... 1 more Note block, 1 more attr",
+        " |->-- o Block(Page, p1)",
+        " |   '->-- ... 1 more Note block, 1 more attr",
+        " '->-- ... 3 more Page blocks",
+    ]
+    out = io.StringIO()
+    printers.nprint(program, max_level=0, file=out, pallete=None)
+    assert out.getvalue().splitlines()[2] == " └── ... 5 more Page blocks"
@@ -0,0 +1,129 @@
+"""
+Author: Kenan Masri
+
+In-process benchmarking of the e3lm phases.
+This module times lexing, parsing, interpreting and every plugin of a text
+separately with `perf_counter_ns`, without the startup of a new process.
+"""
+
+import math
+import statistics
+import inspect as _inspect
+from time import perf_counter_ns
+from e3lm.lang.lexer import E3lmLexer
+from e3lm.lang.parser import E3lmParser
+from e3lm.lang.interpreters import E3lmInterpreter
+
+STATS = ("min", "median", "p95", "stddev")
+
+
+def summarize(samples):
+    """Return the statistics of `samples` (in nanoseconds) as a dict.
+
+    Keys are `count`, `min`, `median`, `p95` (nearest rank), `mean`,
+    `stddev` (sample standard deviation, 0 for a single sample) and `max`.
+    """
+    s = sorted(samples)
+    n = len(s)
+    if n == 0:
+        raise ValueError("Cannot summarize no samples.")
+    return {
+        "count": n,
+        "min": s[0],
+        "median": statistics.median(s),
+        "p95": s[max(0, math.ceil(0.95 * n) - 1)],
+        "mean": statistics.fmean(s),
+        "stddev": statistics.stdev(s) if n > 1 else 0.0,
+        "max": s[-1],
+    }
+
+
+def bench_phases(text, source=None, plugins=[], repeat=10, warmup=1,
+                 interpreter_cls=E3lmInterpreter):
+    """Time each phase of interpreting `text`, in this process.
+
+    Every run lexes the text, parses it (the parser lexes again while
+    parsing), interprets the parsed program and applies `plugins` in order,
+    then their `post_process`, the same way `e3lm.utils.lang.interpret`
+    does. The lexer and parser are built once and reused by all runs.
+
+    Args:
+        `text`: Text to benchmark.
+        `source`: Source of the text (used for its imports).
+        `plugins`: List of plugin classes or instances.
+        `repeat`: Number of timed runs.
+        `warmup`: Number of runs done before, and not timed.
+        `interpreter_cls`: Class of the interpreter.
+
+    Returns:
+        Dict of the samples (list of nanoseconds) by phase name: "lex",
+        "parse", "interpret", then the plugin class names (and
+        "<name>.post_process"), and "total".
+    """
+    lexer = E3lmLexer()
+    lexer.build()
+    parser = E3lmParser()
+    parser.build()
+    samples = {}
+
+    def run(times):
+        t0 = perf_counter_ns()
+        lexer.input(text, source or "<string>")
+        for tok in lexer.get_tokens():
+            pass
+        t1 = perf_counter_ns()
+        times.append(("lex", t1 - t0))
+
+        t0 = perf_counter_ns()
+        program = parser.parse(text, source)
+        t1 = perf_counter_ns()
+        times.append(("parse", t1 - t0))
+
+        interpreter = interpreter_cls(parser=parser)
+        t0 = perf_counter_ns()
+        program = interpreter.interpret(program, source)
+        t1 = perf_counter_ns()
+        times.append(("interpret", t1 - t0))
+        if program is None:
+            raise ValueError("Could not interpret the text.")
+
+        worked = []
+        for plugin in plugins:
+            if _inspect.isclass(plugin):
+                plugin = plugin()
+                plugin.is_plugin = True
+                plugin.is_pre = True
+                plugin.is_post = False
+            name = plugin.__class__.__name__
+            t0 = perf_counter_ns()
+            result = plugin.interpret(program, source)
+            t1 = perf_counter_ns()
+            times.append((name, t1 - t0))
+            if result == None:
+                raise BrokenPipeError(1, name, "Could not continue pipe.")
+            program = result
+            worked.append(plugin)
+
+        for plugin in worked:
+            if hasattr(plugin, "post_process"):
+                t0 = perf_counter_ns()
+                program = plugin.post_process(program)
+                t1 = perf_counter_ns()
+                times.append((plugin.__class__.__name__ + ".post_process",
+                              t1 - t0))
+
+    for i in range(warmup):
+        run([])
+    for i in range(repeat):
+        times = []
+        run(times)
+        for name, ns in times:
+            samples.setdefault(name, []).append(ns)
+        samples.setdefault("total", []).append(sum(ns for _, ns in times))
+    return samples
+
+
+def benchmark(text, source=None, plugins=[], repeat=10, warmup=1, **kwargs):
+    """Return the `summarize` statistics of `bench_phases`, by phase."""
+    return {phase: summarize(ns) for phase, ns in bench_phases(
+        text, source, plugins, repeat=repeat, warmup=warmup, **kwargs).items()}
@@ -0,0 +1,304 @@
+"""
+Author: Kenan Masri
+
+Batch interpretation of a directory tree of 3lm files.
+`build` discovers the .3lm files under a directory and interprets them on a
+pool of processes, writing the outputs of every file (JSON and/or dot
+source) under an output directory as soon as it is done. A `BuildCache`
+skips the files that did not change since they were last built.
+"""
+
+import os
+import json
+import hashlib
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from e3lm.utils.lang import get_plugin, interpret
+from e3lm.contrib.json import JsonPlugin
+
+# Outputs that can be written, by plugin: (program attribute, extension).
+# Plugins with a `dump` method (JSON and dot) stream the output to its file
+# instead of keeping it in the program.
+OUTPUTS = {
+    "json": ("json", ".json"),
+    "dot": ("dot_source", ".dot"),
+}
+
+
+def file_digest(path):
+    """Return the SHA-1 hex digest of the content of the file at `path`."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def package_version():
+    """Return the installed version of e3lm."""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        return version("e3lm")
+    except (ImportError, PackageNotFoundError):
+        return None
+
+
+class BuildResult():
+    """Result of building one file.
+
+    Attributes:
+        `path`: Path of the 3lm file.
+        `outputs`: List of the written output paths.
+        `error`: String of the error, `None` if the file was built.
+        `seconds`: Time spent building the file.
+        `digest`: SHA-1 hex digest of the file content.
+        `imports`: Dict of the SHA-1 hex digests of the imported files, by
+            absolute path.
+        `cached`: Whether the outputs were reused from a `BuildCache`.
+    """
+    __slots__ = ("path", "outputs", "error", "seconds", "digest", "imports",
+                 "cached")
+
+    def __init__(self, path, outputs=(), error=None, seconds=0.0,
+                 digest=None, imports=None, cached=False):
+        self.path = path
+        self.outputs = list(outputs)
+        self.error = error
+        self.seconds = seconds
+        self.digest = digest
+        self.imports = imports or {}
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        state = "cached" if self.cached else "ok" if self.ok else "error"
+        return f"BuildResult({self.path!r}, {state})"
+
+    __repr__ = __str__
+
+
+class BuildCache():
+    """On-disk cache of the builds of 3lm files.
+
+    For every built file, the cache records the digest of its content and of
+    each file it imports, the outputs (plugins) it was built with and the
+    written output paths. A file is up to date while none of these changed
+    and its outputs still exist. The whole cache is dropped when the e3lm
+    version changes.
+
+    Attributes:
+        `path`: Path of the cache file (JSON).
+        `version`: Version of e3lm the entries were built with.
+        `entries`: Dict of the entries by absolute path of the 3lm file.
+        `dependents`: Reverse import index, the set of the files importing a
+            file by its absolute path.
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version or package_version()
+        self.entries = {}
+        self.dependents = {}
+        self.load()
+
+    def load(self):
+        """Read the entries from `path`, if it is a cache of this version."""
+        self.entries = {}
+        self.dependents = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return
+        for path, entry in data.get("entries", {}).items():
+            self._add(path, entry)
+
+    def save(self):
+        """Write the entries to `path`."""
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "entries": self.entries}, f)
+        os.replace(tmp, self.path)
+
+    def _add(self, path, entry):
+        self.entries[path] = entry
+        for imp in entry["imports"]:
+            self.dependents.setdefault(imp, set()).add(path)
+
+    def discard(self, path):
+        """Drop the entry of the file at `path`, if any."""
+        entry = self.entries.pop(os.path.abspath(path), None)
+        if entry is None:
+            return
+        for imp in entry["imports"]:
+            files = self.dependents.get(imp)
+            if files is not None:
+                files.discard(os.path.abspath(path))
+                if not files:
+                    del self.dependents[imp]
+
+    def record(self, result, outputs):
+        """Record the `BuildResult` of a file built with `outputs`. Failed
+        builds are dropped so that they are tried again."""
+        if result.cached:
+            return
+        self.discard(result.path)
+        if result.ok:
+            self._add(os.path.abspath(result.path), {
+                "digest": result.digest,
+                "imports": result.imports,
+                "plugins": sorted(outputs),
+                "outputs": result.outputs,
+            })
+
+    def split(self, paths, outputs):
+        """Return `(fresh, stale)`, the lists of `paths` whose cached outputs
+        can be reused and of the ones to build.
+
+        Each file is hashed at most once: imported files through the reverse
+        import index, which invalidates exactly the files importing a
+        changed one.
+        """
+        digests = {}
+
+        def digest(path):
+            if path not in digests:
+                try:
+                    digests[path] = file_digest(path)
+                except OSError:
+                    digests[path] = None
+            return digests[path]
+
+        invalid = set()
+        for imp, files in self.dependents.items():
+            d = digest(imp)
+            for path in files:
+                if self.entries[path]["imports"][imp] != d:
+                    invalid.add(path)
+
+        plugins = sorted(outputs)
+        fresh, stale = [], []
+        for path in paths:
+            key = os.path.abspath(path)
+            entry = self.entries.get(key)
+            if entry is None or key in invalid \
+                    or entry["plugins"] != plugins \
+                    or entry["digest"] != digest(key) \
+                    or not all(os.path.exists(o) for o in entry["outputs"]):
+                stale.append(path)
+            else:
+                fresh.append(path)
+        return fresh, stale
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return f"BuildCache({self.path!r}, {len(self)} entries)"
+
+    __repr__ = __str__
+
+
+def discover(root):
+    """Return the sorted paths of the .3lm files under `root`, recursively."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for f in filenames:
+            if f.endswith(".3lm"):
+                found.append(os.path.join(dirpath, f))
+    return sorted(found)
+
+
+def build_file(path, root, outdir, outputs=("json",)):
+    """Interpret the file at `path` and write its `outputs` under `outdir`,
+    at the same place relative to `root`. Errors are returned in the
+    `BuildResult`, not raised."""
+    t_start = perf_counter()
+    written = []
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        # Same text as reading the file in text mode.
+        text = content.decode("utf-8").replace("\r\n", "\n") \
+            .replace("\r", "\n")
+        plugins = {o: JsonPlugin if o == "json" else get_plugin(o)
+                   for o in outputs}
+        program = interpret(text, os.path.abspath(path), plugins=[
+            p for p in plugins.values() if not hasattr(p, "dump")])
+        if program is None:
+            raise ValueError("Could not interpret the file.")
+        imports = {os.path.abspath(imp): file_digest(imp)
+                   for imp in program.imports}
+        base = os.path.join(outdir, os.path.splitext(
+            os.path.relpath(path, root))[0])
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        for o in outputs:
+            attr, ext = OUTPUTS[o]
+            with open(base + ext, "w", encoding="utf-8") as f:
+                if hasattr(plugins[o], "dump"):
+                    plugins[o]().dump(program, f)
+                else:
+                    f.write(getattr(program, attr))
+            written.append(base + ext)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as e:
+        # Including InterpreterError, which is not an Exception.
+        error = "{}: {}".format(e.__class__.__name__, e)
+        return BuildResult(path, written, error, perf_counter() - t_start)
+    return BuildResult(path, written, None, perf_counter() - t_start,
+                       digest, imports)
+
+
+def build(root, outdir, outputs=("json",), workers=None, cache=None):
+    """Build every .3lm file under `root` into `outdir`.
+
+    Files are interpreted on a `ProcessPoolExecutor` of `workers` processes
+    (the number of CPUs if `None`), or in this process if `workers` is 0.
+    With a `BuildCache`, the files that are up to date are not built again
+    and the cache is saved once done.
+
+    Yields:
+        `BuildResult` of each file, the cached ones first, then in the order
+        they finish.
+    """
+    for o in outputs:
+        if o not in OUTPUTS:
+            raise ValueError("Cannot build '{}' outputs, use one of {}."
+                             .format(o, ", ".join(OUTPUTS)))
+    paths = discover(root)
+    if cache is not None:
+        fresh, paths = cache.split(paths, outputs)
+        for path in fresh:
+            entry = cache.entries[os.path.abspath(path)]
+            yield BuildResult(path, entry["outputs"], digest=entry["digest"],
+                              imports=entry["imports"], cached=True)
+    try:
+        if workers == 0:
+            for path in paths:
+                result = build_file(path, root, outdir, outputs)
+                if cache is not None:
+                    cache.record(result, outputs)
+                yield result
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(build_file, path, root, outdir,
+                                       outputs) for path in paths]
+            for future in as_completed(futures):
+                result = future.result()
+                if cache is not None:
+                    cache.record(result, outputs)
+                yield result
+    finally:
+        if cache is not None:
+            cache.save()
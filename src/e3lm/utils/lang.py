@@ -5,31 +5,98 @@ Author: Kenan Masri
 
 import json
 import types
-import inspect as _inspect
+import threading
+from contextlib import contextmanager
 from e3lm.helpers.printers import cprint
 from e3lm.lang.parser import E3lmParser
 from e3lm.lang.lexer import E3lmLexer
 from e3lm.lang.interpreters import E3lmInterpreter
+from e3lm.utils import profiling
 
-_lexer = E3lmLexer()
-_parser = E3lmParser()
+
+class ParserPool():
+    """Pool of built parsers, each with its own lexer.
+
+    A parser is used by one thread at a time: `acquire` hands out an idle
+    parser (building a new one when none is idle) and `release` gives it
+    back. `parser()` does both around a `with` block.
+
+    Attributes:
+        `parser_cls`: Class of the pooled parsers.
+        `build_kwargs`: Dict used for building the parsers.
+        `maxsize`: Number of idle parsers kept, `None` for no bound.
+    """
+
+    def __init__(self, parser_cls=E3lmParser, maxsize=None, **build_kwargs):
+        self.parser_cls = parser_cls
+        self.build_kwargs = build_kwargs
+        self.maxsize = maxsize
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return an idle built parser, or a newly built one."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        parser = self.parser_cls()
+        parser.build(**self.build_kwargs)
+        return parser
+
+    def release(self, parser):
+        """Give `parser` back to the pool."""
+        with self._lock:
+            if self.maxsize is None or len(self._idle) < self.maxsize:
+                self._idle.append(parser)
+
+    @contextmanager
+    def parser(self):
+        """Context manager of a parser acquired from the pool."""
+        parser = self.acquire()
+        try:
+            yield parser
+        finally:
+            self.release(parser)
+
+    def __len__(self):
+        return len(self._idle)
+
+    def __str__(self):
+        return f"ParserPool({self.parser_cls.__name__}, {len(self)} idle)"
+
+    __repr__ = __str__
+
+
+# Parsers used by `lex`, `parse` and `interpret` when none is given.
+parser_pool = ParserPool()
+
+
+def is_built(obj):
+    """Whether the lexer or parser `obj` was already built."""
+    if isinstance(obj, E3lmLexer):
+        return obj.__dict__.get("lexer") is not None
+    return getattr(obj, "parser", None) is not None
 
 
 def lex(text, source=None, lexer=None, token_map=True, **kwargs):
     """Lex text.
 
-    `lexer`, `source` and the rest are used for building the lexer
+    `lexer`, `source` and the rest are used for building the lexer. An
+    already built lexer is only rebuilt when build arguments are given,
+    otherwise it is reset for the new input.
     """
     srs = source or "<string>"
 
-    if not lexer:
-        l = _lexer
-    else:
-        l = lexer
-        if _inspect.isclass(l):
-            l = l()
+    if not lexer and not kwargs and token_map:
+        with parser_pool.parser() as p:
+            return lex(text, source, lexer=p.e3lmLexer)
+
+    l = lexer or E3lmLexer
+    if isinstance(l, type):
+        l = l()
 
-    l.build(**kwargs)
+    if kwargs or not is_built(l):
+        l.build(**kwargs)
     l.input(text, srs)
     if token_map:
         tokens = l.get_tokens()
@@ -48,12 +115,16 @@ def parse(text, source=None,
           ):  # pragma: no cover
 
     lexer = lexer \
-        or (1 if "lexer" in parser_kwargs.keys() else None)\
-        or _lexer
+        or (1 if "lexer" in parser_kwargs.keys() else None)
     if lexer == 1:
         lexer = parser_kwargs.pop("lexer")
 
-    parser = parser or _parser
+    if not (lexer or parser or lexer_kwargs or parser_kwargs or kwargs):
+        with parser_pool.parser() as p:
+            return p.parse(text, source)
+
+    parser = parser or E3lmParser()
+    lexer = lexer or getattr(parser, "e3lmLexer", None) or E3lmLexer()
     lexer_kwargs = lexer_kwargs \
         or (parser_kwargs["lexer_kwargs"]
             if "lexer_kwargs" in parser_kwargs.keys() else {})
@@ -62,8 +133,11 @@ def parse(text, source=None,
         or (parser_kwargs["parse_kwargs"]
             if "parse_kwargs" in parser_kwargs.keys() else {})
 
-    lexer.build(**lexer_kwargs)
-    parser.build(lexer=lexer, **parse_kwargs)
+    if lexer_kwargs or not is_built(lexer):
+        lexer.build(**lexer_kwargs)
+    if parse_kwargs or not is_built(parser) \
+            or getattr(parser, "e3lmLexer", None) is not lexer:
+        parser.build(lexer=lexer, **parse_kwargs)
 
     return parser.parse(text, source, **kwargs)
 
@@ -75,12 +149,20 @@ def interpret(text, source=None,
               **kwargs
               ):  # pragma: no cover
 
-    p = parser or _parser
-    if _inspect.isclass(p):
+    if not parser and not parser_kwargs:
+        with parser_pool.parser() as p:
+            return interpret(text, source, interpreter_cls=interpreter_cls,
+                             parser=p, plugins=plugins, **kwargs)
+
+    p = parser or E3lmParser
+    if isinstance(p, type):
         p = p()
-    p.build(**parser_kwargs)
+    if parser_kwargs or not is_built(p):
+        p.build(**parser_kwargs)
 
-    pre_interpreter = interpreter_cls(parser=p)
+    # Arithmetic in units (see `E3lmInterpreter`).
+    units = {"units": kwargs["units"]} if kwargs.get("units") else {}
+    pre_interpreter = interpreter_cls(parser=p, **units)
 
     # PRE E3lm
     result = pre_interpreter.interpret(text, source)
@@ -89,14 +171,19 @@ def interpret(text, source=None,
     if result == None:
         return None
 
+    prof = profiling.current()
     worked = []
     for plugin in plugins:
-        if _inspect.isclass(plugin):
+        if isinstance(plugin, type):
             plugin = plugin()
             plugin.is_plugin = True
             plugin.is_pre = True
             plugin.is_post = False
-        _result = plugin.interpret(result, source)
+        if prof is None:
+            _result = plugin.interpret(result, source)
+        else:
+            with prof.time("plugin." + plugin.__class__.__name__):
+                _result = plugin.interpret(result, source)
         if _result:
             result = _result
             worked.append(plugin)
@@ -106,7 +193,12 @@ def interpret(text, source=None,
 
     for plugin in worked:
         if hasattr(plugin, "post_process"):
-            result = plugin.post_process(result)
+            if prof is None:
+                result = plugin.post_process(result)
+            else:
+                with prof.time("plugin." + plugin.__class__.__name__
+                               + ".post_process"):
+                    result = plugin.post_process(result)
             if result == None:
                 raise ValueError("'{}' post_process did not return Program."
                                  .format(plugin.__class__.__name__))
@@ -0,0 +1,122 @@
+"""
+Author: Kenan Masri
+
+Opt-in instrumentation of the e3lm phases.
+While a `Profile` is active (as a context manager), the lexer, parser,
+interpreter and plugins record the time spent in their phases and a few
+counters to it. Without an active profile nothing is recorded.
+
+Example:
+    with Profile() as prof:
+        interpret(text)
+    print(prof.to_json(indent=4))
+"""
+
+import json
+import functools
+import contextvars
+from contextlib import contextmanager
+from time import perf_counter_ns
+
+_current = contextvars.ContextVar("e3lm_profile", default=None)
+
+
+def current():
+    """Return the active `Profile` of this context, or `None`."""
+    return _current.get()
+
+
+class Profile():
+    """Timings and counters of the e3lm phases.
+
+    Timings are inclusive: the time of "parse" includes "parse.imports" and
+    the lexing done while parsing.
+
+    Attributes:
+        `timings`: Dict of `{"calls": n, "ns": total}` by phase name.
+        `counters`: Dict of counts by name.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self._tokens = []
+
+    def add(self, name, ns):
+        """Record a call of `ns` nanoseconds to the phase `name`."""
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = {"calls": 0, "ns": 0}
+        timing["calls"] += 1
+        timing["ns"] += ns
+
+    def count(self, name, n=1):
+        """Add `n` to the counter `name`."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def time(self, name):
+        """Context manager recording its duration to the phase `name`."""
+        t0 = perf_counter_ns()
+        try:
+            yield self
+        finally:
+            self.add(name, perf_counter_ns() - t0)
+
+    def stream(self, name, iterable, counter=None):
+        """Yield the items of `iterable`, recording the time spent getting
+        each of them to the phase `name` and their number to `counter`."""
+        it = iter(iterable)
+        while True:
+            t0 = perf_counter_ns()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add(name, perf_counter_ns() - t0)
+            if counter:
+                self.count(counter)
+            yield item
+
+    def as_dict(self):
+        """Return the timings and counters as a dict."""
+        return {
+            "timings": {k: dict(v) for k, v in self.timings.items()},
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self, **kwargs):
+        """Return `as_dict` dumped as JSON, `kwargs` go to `json.dumps`."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def __enter__(self):
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._tokens.pop())
+        return False
+
+    def __str__(self):
+        return (f"Profile({len(self.timings)} timings, "
+                f"{len(self.counters)} counters)")
+
+    __repr__ = __str__
+
+
+def profiled(name):
+    """Decorator recording the calls of the function to the phase `name`
+    of the active profile."""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            prof = _current.get()
+            if prof is None:
+                return f(*args, **kwargs)
+            t0 = perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                prof.add(name, perf_counter_ns() - t0)
+        return wrapper
+    return decorator
@@ -0,0 +1,400 @@
+"""
+Author: Kenan Masri
+
+A long-running e3lm worker and its client.
+`E3lmServer` keeps built lexers/parsers (see `ParserPool`) and the plugin
+classes warm, and answers JSON-RPC 2.0 requests over a Unix domain socket or
+stdin/stdout. Messages are single-line JSON objects separated by newlines.
+Requests are handled concurrently with asyncio, the work itself is done on
+a pool of threads. `E3lmClient` is a thin client for the socket.
+
+Methods (params are `text` or `path` of a file, and `source`):
+    `lex`: List of the tokens as `[type, value, lineno]`.
+    `parse`: Outline of the parsed program (blocks, their attributes names
+        and children).
+    `interpret`: Outline of the interpreted program, with `plugins` (names)
+        applied and their outputs, e.g. `{"json": ..., "dot": ...}`.
+    `json`: JSON of the interpreted program (`JsonPlugin`).
+    `dot`: Dot source of the interpreted program (`DotPlugin`), with its
+        `depth`, `collapse` and `expressions` options.
+    `ping`: "pong".
+"""
+
+import os
+import sys
+import json
+import stat
+import socket
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from e3lm.lang import ast
+from e3lm.utils.lang import get_plugin, interpret, lex, parse, parser_pool
+
+# JSON-RPC 2.0 error codes.
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+E3LM_ERROR = -32000
+
+# Outputs of the plugins, by plugin name: program attribute.
+PLUGIN_OUTPUTS = {
+    "json": "json",
+    "dot": "dot_source",
+}
+
+# Options of the `dot` method, passed to `DotPlugin`.
+DOT_OPTIONS = ("depth", "collapse", "expressions")
+
+
+class RPCError(Exception):
+    """Error answered to a request, with a JSON-RPC `code`."""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def outline(program):
+    """Return the JSON-able outline of `program`: its imports and blocks,
+    with their type, name, attribute names and children."""
+    def block(b):
+        return {
+            "type": b.type,
+            "name": b.name,
+            "attrs": list(b._attrs.keys()),
+            "children": [block(c) for c in b.children
+                         if type(c) == ast.Block],
+        }
+    return {
+        "imports": list(program.imports),
+        "blocks": [block(b) for b in program.blocks],
+    }
+
+
+def file_id(path):
+    """Return the `(device, inode)` of the file `path`, `None` if there is
+    none."""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def remove_stale_socket(path):
+    """Remove the socket `path` left by a server that is not running.
+
+    Raises `FileExistsError` if `path` is another kind of file or a socket
+    that a server listens on.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError("{} exists and is not a socket.".format(path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise FileExistsError("A server listens on {}.".format(path))
+
+
+class E3lmServer():
+    """JSON-RPC server of the e3lm phases.
+
+    Attributes:
+        `workers`: Number of threads doing the work.
+        `plugins`: Dict of the loaded plugin classes by name.
+        `methods`: Dict of the request handlers by method name.
+    """
+
+    def __init__(self, workers=4, plugins=("json", "dot")):
+        self.workers = workers
+        self.plugins = {name: get_plugin(name) for name in plugins}
+        self.methods = {
+            "lex": self.lex,
+            "parse": self.parse,
+            "interpret": self.interpret,
+            "json": self.json,
+            "dot": self.dot,
+            "ping": self.ping,
+        }
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._loop = None
+        self._stop = None
+        self.warm()
+
+    def warm(self):
+        """Build a parser for each worker ahead of the first request."""
+        parsers = [parser_pool.acquire() for i in range(self.workers)]
+        for p in parsers:
+            parser_pool.release(p)
+
+    # --- Methods ---
+
+    def text(self, params):
+        """Return `(text, source)` of the params of a request."""
+        if not isinstance(params, dict):
+            raise RPCError(INVALID_PARAMS, "Params must be an object.")
+        source = params.get("source")
+        if "text" in params:
+            if not isinstance(params["text"], str):
+                raise RPCError(INVALID_PARAMS, "'text' must be a string.")
+            return params["text"], source
+        if "path" in params:
+            path = params["path"]
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return f.read(), source or os.path.abspath(path)
+            except (OSError, TypeError) as e:
+                raise RPCError(INVALID_PARAMS, str(e))
+        raise RPCError(INVALID_PARAMS, "Missing 'text' or 'path'.")
+
+    def get_plugins(self, names):
+        plugins = []
+        for name in names:
+            if name not in self.plugins:
+                raise RPCError(INVALID_PARAMS,
+                               "Unknown plugin '{}'.".format(name))
+            plugins.append(self.plugins[name])
+        return plugins
+
+    def lex(self, params):
+        text, source = self.text(params)
+        return [[t.type, t.value, t.lineno] for t in lex(text, source)]
+
+    def parse(self, params):
+        text, source = self.text(params)
+        return outline(parse(text, source))
+
+    def interpret(self, params):
+        text, source = self.text(params)
+        names = params.get("plugins", [])
+        program = interpret(text, source, plugins=self.get_plugins(names))
+        result = outline(program)
+        result["outputs"] = {name: getattr(program, PLUGIN_OUTPUTS[name])
+                             for name in names if name in PLUGIN_OUTPUTS}
+        return result
+
+    def json(self, params):
+        text, source = self.text(params)
+        return interpret(text, source, plugins=self.get_plugins(["json"])).json
+
+    def dot(self, params):
+        text, source = self.text(params)
+        options = {k: params[k] for k in DOT_OPTIONS if k in params}
+        plugin = self.get_plugins(["dot"])[0](**options)
+        return interpret(text, source, plugins=[plugin]).dot_source
+
+    def ping(self, params):
+        return "pong"
+
+    # --- Protocol ---
+
+    def handle(self, request):
+        """Return the response (dict) to the `request` (dict), or `None` for
+        a notification."""
+        rid = None
+        try:
+            if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" \
+                    or not isinstance(request.get("method"), str):
+                raise RPCError(INVALID_REQUEST, "Invalid request.")
+            rid = request.get("id")
+            method = self.methods.get(request["method"])
+            if method is None:
+                raise RPCError(METHOD_NOT_FOUND, "Method '{}' not found."
+                               .format(request["method"]))
+            result = method(request.get("params", {}))
+            response = {"jsonrpc": "2.0", "id": rid, "result": result}
+        except RPCError as e:
+            response = {"jsonrpc": "2.0", "id": rid, "error": {
+                "code": e.code, "message": e.message, "data": e.data}}
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as e:
+            # Including InterpreterError, which is not an Exception.
+            response = {"jsonrpc": "2.0", "id": rid, "error": {
+                "code": E3LM_ERROR, "message": str(e),
+                "data": {"type": e.__class__.__name__}}}
+        if isinstance(request, dict) and "id" not in request:
+            return None
+        return response
+
+    async def handle_line(self, line):
+        """Return the encoded response to the request `line`, or `None`."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {"jsonrpc": "2.0", "id": None, "error": {
+                "code": PARSE_ERROR, "message": str(e), "data": None}}
+        else:
+            response = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.handle, request)
+        if response is None:
+            return None
+        return (json.dumps(response, default=str) + "\n").encode("utf-8")
+
+    async def serve_stream(self, reader, write):
+        """Answer the requests read from `reader` with `write(bytes)`, each in
+        its own task, so that responses come in the order they finish."""
+        tasks = set()
+
+        async def respond(line):
+            data = await self.handle_line(line)
+            if data is not None:
+                await write(data)
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.ensure_future(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def serve_connection(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def write(data):
+            async with lock:
+                writer.write(data)
+                await writer.drain()
+        try:
+            await self.serve_stream(reader, write)
+        finally:
+            writer.close()
+
+    async def serve_unix(self, path, ready=None):
+        """Serve on the Unix domain socket `path` until `stop` is called.
+        `ready` (a `threading.Event`) is set once listening."""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        remove_stale_socket(path)
+        server = await asyncio.start_unix_server(self.serve_connection, path,
+                                                 limit=2 ** 26)
+        created = file_id(path)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await self._stop.wait()
+        finally:
+            # Unless it was replaced by another one since.
+            if created is not None and file_id(path) == created:
+                os.unlink(path)
+
+    async def serve_stdio(self, stdin=None, stdout=None):
+        """Serve the requests read from `stdin` until it is closed, writing
+        the responses to `stdout`."""
+        self._loop = loop = asyncio.get_running_loop()
+        stdin = stdin or sys.stdin.buffer
+        stdout = stdout or sys.stdout.buffer
+        reader = asyncio.StreamReader(limit=2 ** 26)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), stdin)
+        lock = threading.Lock()
+
+        def write_sync(data):
+            with lock:
+                stdout.write(data)
+                stdout.flush()
+
+        async def write(data):
+            await loop.run_in_executor(None, write_sync, data)
+        await self.serve_stream(reader, write)
+
+    def stop(self):
+        """Stop `serve_unix`, from any thread."""
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def close(self):
+        self.stop()
+        self.executor.shutdown(wait=False)
+
+
+class E3lmServerError(Exception):
+    """Error answered by the server.
+
+    Attributes:
+        `code`: JSON-RPC error code.
+        `data`: Additional data, e.g. `{"type": "SyntaxError"}`.
+    """
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+class E3lmClient():
+    """Blocking client of an `E3lmServer` listening on the Unix domain socket
+    `path`. One request is sent at a time; use a client per thread for
+    concurrent requests."""
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rb")
+        self._id = 0
+
+    def call(self, method, **params):
+        """Return the result of `method` with `params`, or raise
+        `E3lmServerError`."""
+        self._id += 1
+        request = {"jsonrpc": "2.0", "id": self._id, "method": method,
+                   "params": params}
+        self.sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The e3lm server closed the connection.")
+        response = json.loads(line)
+        if "error" in response:
+            e = response["error"]
+            raise E3lmServerError(e["code"], e["message"], e.get("data"))
+        return response["result"]
+
+    def lex(self, text, source=None):
+        return self.call("lex", text=text, source=source)
+
+    def parse(self, text, source=None):
+        return self.call("parse", text=text, source=source)
+
+    def interpret(self, text, source=None, plugins=()):
+        return self.call("interpret", text=text, source=source,
+                         plugins=list(plugins))
+
+    def json(self, text, source=None):
+        return self.call("json", text=text, source=source)
+
+    def dot(self, text, source=None):
+        return self.call("dot", text=text, source=source)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __str__(self):
+        return f"E3lmClient({self.path!r})"
+
+    __repr__ = __str__